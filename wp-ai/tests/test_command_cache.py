@@ -0,0 +1,100 @@
+import pytest
+
+from wp_ai.command_cache import CommandCache, is_cacheable, is_read_only, wp_subcommand
+
+
+@pytest.mark.parametrize("command", [
+    "wp plugin list",
+    "wp plugin list --format=json",
+    "wp  core   version",
+    "wp option get siteurl",
+    "wp cron event list --fields=hook,next_run",
+    "wp user meta get 1 nickname",
+    "wp --info",
+    "/usr/bin/php /home/u/wp-cli.phar core version",
+    "/usr/local/bin/wp plugin status akismet --path='/var/www/html'",
+    "WP_CLI_CACHE_DIR=/tmp/x wp theme list",
+    "wp config get DB_NAME",
+])
+def test_read_only(command):
+    assert is_read_only(command)
+
+
+@pytest.mark.parametrize("command", [
+    # mutating wp commands
+    "wp plugin deactivate akismet",
+    "wp option update home https://example.com",
+    "wp user meta update 1 nickname x",
+    "wp cron event run --due-now",
+    "wp db query 'SELECT 1'",
+    "wp db check",
+    "wp db check --auto-repair",
+    "wp db check --repair",
+    # several commands in one string
+    "wp option get home\nwp option update home x",
+    "wp plugin list\nwp plugin delete akismet",
+    "wp plugin list\r\nwp plugin delete akismet",
+    "wp plugin list; wp plugin delete akismet",
+    "wp plugin list && wp plugin delete akismet",
+    "wp plugin list || wp plugin delete akismet",
+    "wp plugin list & wp plugin delete akismet",
+    # pipes, redirections, substitutions, comments
+    "wp plugin list | grep akismet",
+    "wp core version > /tmp/version",
+    "wp core version < /dev/null",
+    "wp plugin get $(cat /tmp/name)",
+    "wp plugin get `cat /tmp/name`",
+    "wp plugin list # then delete",
+    "wp plugin list #",
+    # code execution
+    "wp --exec='unlink(\"x\");' plugin list",
+    "wp --require=/tmp/evil.php core version",
+    # not wp
+    "ls -la",
+    "tail -n 100 /var/log/php_errors.log",
+    "sudo -u www-data wp plugin list",
+    "",
+    "wp",
+    "wp plugin",
+    "wp 'unterminated",
+])
+def test_not_read_only(command):
+    assert not is_read_only(command)
+
+
+def test_subcommand_path():
+    assert wp_subcommand("wp cron event list --format=json") == ("cron", "event", "list")
+    assert wp_subcommand("wp plugin list\nwp plugin delete x") is None
+
+
+@pytest.mark.parametrize("command,cacheable", [
+    ("wp plugin list", True),
+    ("wp core version", True),
+    ("wp cron event list --format=json", True),
+    ("wp config get DB_PASSWORD", False),
+    ("wp option get siteurl", False),
+    ("wp option list --search=*_key", False),
+    ("wp option pluck wp_mail_smtp smtp pass", False),
+    ("wp transient get oauth_token", False),
+    ("wp user list --fields=user_email", False),
+    ("wp user get admin", False),
+    ("wp user meta get 1 session_tokens", False),
+    ("wp user meta list 1", False),
+    ("wp config list", False),
+    ("wp config list --format=json", False),
+    ("wp plugin delete akismet", False),
+])
+def test_cacheable(command, cacheable):
+    assert is_cacheable(command) is cacheable
+
+
+def test_cache_store_lookup_invalidate(tmp_path):
+    cache = CommandCache(tmp_path / "command_cache.json")
+    cache.store("site", "wp plugin list", 0, [("out", "akismet\n")], ttl=60)
+    assert cache.lookup("site", "wp  plugin list", ttl=60)["lines"] == [["out", "akismet\n"]]
+    assert cache.lookup("other", "wp plugin list", ttl=60) is None
+    # a second instance (another process) sees the entry and the invalidation
+    other = CommandCache(tmp_path / "command_cache.json")
+    assert other.lookup("site", "wp plugin list", ttl=60) is not None
+    other.invalidate("site")
+    assert cache.lookup("site", "wp plugin list", ttl=60) is None
@@ -0,0 +1,58 @@
+import builtins
+
+import pytest
+from pydantic import ValidationError
+
+from wp_ai.config import HistoryConfig
+from wp_ai.history import JsonlHistoryStore, SQLiteHistoryStore
+
+
+def test_compression_is_validated():
+    assert HistoryConfig(compression=" ZSTD ").compression == "zstd"
+    with pytest.raises(ValidationError):
+        HistoryConfig(compression="bz2")
+
+
+def test_zstd_falls_back_to_gzip(tmp_path, monkeypatch):
+    real_import = builtins.__import__
+
+    def no_zstandard(name, *args, **kwargs):
+        if name == "zstandard":
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", no_zstandard)
+    store = JsonlHistoryStore(tmp_path / "history.jsonl", HistoryConfig(backend="jsonl", compression="zstd"))
+    store.append({"ts": "2026-01-01T00:00:00Z", "instruction": "a"})
+    with pytest.warns(RuntimeWarning, match="zstandard"):
+        segment = store.rotate()
+    assert segment.suffix == ".gz"
+    store.append({"ts": "2026-01-02T00:00:00Z", "instruction": "b"})
+    assert [e["instruction"] for e in store.iter_entries()] == ["a", "b"]
+
+
+def test_short_search_terms_match_literally(tmp_path):
+    store = SQLiteHistoryStore(tmp_path / "history.db")
+    for n, instruction in enumerate(["ディスク使用率 100% を確認", "progress 100 items", "本番サイトのキャッシュ削除",
+                                     "wp_options を確認"]):
+        store.append({"ts": f"2026-01-0{n + 1}T00:00:00Z", "instruction": instruction})
+
+    def found(text):
+        return sorted(e["instruction"] for e in store.search(text))
+
+    assert found("%") == ["ディスク使用率 100% を確認"]
+    assert found("_") == ["wp_options を確認"]
+    assert found("0%") == ["ディスク使用率 100% を確認"]
+    assert found("本") == ["本番サイトのキャッシュ削除"]
+    store.close()
+
+
+def test_sqlite_count(tmp_path):
+    store = SQLiteHistoryStore(tmp_path / "history.db")
+    for n, host in enumerate(["a", "b", "a"]):
+        store.append({"ts": f"2026-01-0{n + 1}T00:00:00Z", "host": host, "results": [{"exit_code": n}]})
+    assert store.count() == 3
+    assert store.count(host="a") == 2
+    assert store.count(status="success") == 1
+    assert store.count(since="2026-01-02") == 2
+    store.close()
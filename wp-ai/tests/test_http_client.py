@@ -0,0 +1,82 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from wp_ai.aio import run_sync
+from wp_ai.api import AsyncWPDoctorClient, WPDoctorClient
+from wp_ai.http_client import AsyncHTTPClient, HTTPError, HTTPStatusError, shared_client
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/wp-json/wpdoctor/v1/system-info"):
+            body = json.dumps({"path": self.path, "auth": self.headers.get("Authorization")}).encode()
+            self.send_response(200)
+        else:
+            body = b"not found"
+            self.send_response(404)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        self.wfile.write(b"data: 1\r\n\r\ndata: 2\n\n")
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/wp-json"
+    server.shutdown()
+
+
+def test_sync_client(base_url):
+    payload = WPDoctorClient(base_url, "user", "pass").system_info()
+    assert payload["path"] == "/wp-json/wpdoctor/v1/system-info"
+    assert payload["auth"].startswith("Basic ")
+
+
+def test_async_client(base_url):
+    async def call():
+        client = AsyncWPDoctorClient(base_url, http=shared_client())
+        info = await client.system_info()
+        with pytest.raises(HTTPStatusError) as excinfo:
+            await client.quick_checks()
+        response = await client.http.post(f"{base_url}/stream", json={}, stream=True)
+        lines = [line async for line in response.iter_lines()]
+        await response.aclose()
+        return info, excinfo.value.status, lines
+
+    info, status, lines = run_sync(call())
+    assert info["auth"] is None
+    assert status == 404
+    assert lines == ["data: 1", "", "data: 2", ""]
+
+
+def test_transport_error():
+    async def call():
+        async with AsyncHTTPClient(timeout=2) as client:
+            await client.get("http://127.0.0.1:1/")
+
+    with pytest.raises(HTTPError):
+        run_sync(call())
+
+
+def test_shared_client_is_a_singleton():
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(shared_client())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(client is clients[0] for client in clients)
@@ -0,0 +1,54 @@
+import json
+
+from wp_ai.config import HistoryConfig
+from wp_ai.history import JsonlHistoryStore, SQLiteHistoryStore
+from wp_ai.llm_metrics import iter_llm_calls, record_llm_call, summarize_llm_calls
+
+
+def _record(n, model="m"):
+    return {"ts": f"2026-01-{n:02d}T00:00:00Z", "model": model, "call_type": "plan", "ok": True,
+            "prompt_tokens": 10, "response_tokens": 5, "latency_ms": float(n), "ttft_ms": 1.0}
+
+
+def test_sqlite_store(tmp_path):
+    store = SQLiteHistoryStore(tmp_path / "history.db")
+    for n in range(1, 6):
+        record_llm_call(_record(n), store=store)
+    assert len(list(iter_llm_calls(store=store))) == 5
+    assert [r["ts"][:10] for r in iter_llm_calls(since="2026-01-04", store=store)] == ["2026-01-04", "2026-01-05"]
+    # retention prunes llm calls with the history
+    store.prune("2026-01-03")
+    assert len(list(iter_llm_calls(store=store))) == 3
+    store.close()
+
+
+def test_sqlite_imports_legacy_log(tmp_path):
+    log = tmp_path / "llm_calls.jsonl"
+    log.with_name("llm_calls.jsonl.1").write_text(json.dumps(_record(1)) + "\n")
+    log.write_text(json.dumps(_record(2)) + "\n" + "not json\n")
+    store = SQLiteHistoryStore(tmp_path / "history.db")
+    assert store.import_llm_calls(log) == 2
+    assert len(list(store.iter_llm_calls())) == 2
+    store.close()
+
+
+def test_jsonl_rotation_keeps_every_record(tmp_path):
+    config = HistoryConfig(backend="jsonl", rotate="none", max_bytes=300, compression="gzip")
+    store = JsonlHistoryStore(tmp_path / "history.jsonl", config)
+    for n in range(1, 21):
+        record_llm_call(_record(n), store=store)
+    assert len(store.llm_calls.segments()) > 1
+    records = list(iter_llm_calls(store=store))
+    assert sorted(r["latency_ms"] for r in records) == [float(n) for n in range(1, 21)]
+    assert len(list(iter_llm_calls(since="2026-01-19", store=store))) == 2
+    rows = summarize_llm_calls(records)
+    assert rows[0]["calls"] == 20 and rows[0]["prompt_tokens"] == 200
+
+
+def test_jsonl_adopts_legacy_rotation(tmp_path):
+    store = JsonlHistoryStore(tmp_path / "history.jsonl", HistoryConfig(backend="jsonl"))
+    (tmp_path / "llm_calls.jsonl.1").write_text(json.dumps(_record(1)) + "\n")
+    (tmp_path / "llm_calls.jsonl").write_text(json.dumps(_record(2)) + "\n")
+    store.adopt_legacy_llm_calls()
+    assert not (tmp_path / "llm_calls.jsonl.1").exists()
+    assert sorted(r["ts"] for r in store.iter_llm_calls()) == [_record(1)["ts"], _record(2)["ts"]]
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+import pytest
+
+from wp_ai.config import LLMConfig
+from wp_ai.llm import LLMClient
+from wp_ai.resilience import LLMCallError
+
+
+class _Chunk:
+    usage_metadata = None
+
+    def __init__(self, text):
+        self.text = text
+
+
+class _Response:
+    def __init__(self, delays):
+        self.delays = delays
+
+    async def __aiter__(self):
+        for n, delay in enumerate(self.delays):
+            await asyncio.sleep(delay)
+            yield _Chunk(str(n))
+
+
+class _Model:
+    def __init__(self, first_delay, delays):
+        self.first_delay = first_delay
+        self.delays = delays
+
+    async def generate_content_async(self, contents, stream):
+        await asyncio.sleep(self.first_delay)
+        return _Response(self.delays)
+
+
+def _client(monkeypatch, first_delay, delays, timeout):
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    client = LLMClient(LLMConfig(timeout=timeout, max_retries=0), call_type="chat")
+    monkeypatch.setattr(client, "_gemini_model", lambda name, system_instruction=None: _Model(first_delay, delays))
+    monkeypatch.setattr("wp_ai.llm_metrics.record_llm_call", lambda record, store=None: None)
+    return client
+
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def test_gemini_stream_outlives_the_deadline(monkeypatch):
+    client = _client(monkeypatch, 0.05, [0.1] * 6, timeout=0.3)
+    start = time.monotonic()
+    assert b"".join(client.generate_content_stream(MESSAGES)) == b"012345"
+    assert time.monotonic() - start > 0.3
+
+
+def test_gemini_stream_idle_timeout(monkeypatch):
+    client = _client(monkeypatch, 0.0, [0.0, 1.0], timeout=0.2)
+    with pytest.raises(TimeoutError):
+        list(client.generate_content_stream(MESSAGES))
+
+
+def test_gemini_stream_first_chunk_deadline(monkeypatch):
+    client = _client(monkeypatch, 1.0, [0.0], timeout=0.2)
+    with pytest.raises(LLMCallError):
+        list(client.generate_content_stream(MESSAGES))
@@ -0,0 +1,72 @@
+import threading
+import time
+
+from wp_ai.main import PlanModel
+from wp_ai.runner import BaseRunner
+from wp_ai.scheduler import run_steps, step_dependencies
+
+
+def steps(*specs):
+    return PlanModel(steps=list(specs)).execution_steps()
+
+
+def test_parallel_needs_flag_and_read_only():
+    deps = step_dependencies(steps(
+        {"cmd": "wp plugin list", "parallel_safe": True},
+        {"cmd": "wp core version", "parallel_safe": True},
+        {"cmd": "wp option get home"},  # read-only, but not flagged
+        {"cmd": "wp plugin list", "parallel_safe": True},
+        {"cmd": "wp plugin delete akismet", "parallel_safe": True},  # flagged, but mutating
+        {"cmd": "wp option get home\nwp option update home x", "parallel_safe": True},
+        {"cmd": "wp theme list", "parallel_safe": True},
+    ))
+    assert deps == [set(), set(), {0, 1}, {2}, {0, 1, 2, 3}, {0, 1, 2, 3, 4}, {5}]
+
+
+def test_plain_command_list_is_sequential():
+    plan = PlanModel(commands=["wp plugin list", "wp core version", "wp theme list"])
+    assert step_dependencies(plan.execution_steps()) == [set(), {0}, {0, 1}]
+
+
+def test_depends_on():
+    deps = step_dependencies(steps(
+        {"cmd": "wp plugin list", "parallel_safe": True},
+        {"cmd": "wp core version", "parallel_safe": True, "depends_on": [1]},
+        {"cmd": "wp theme list", "parallel_safe": True, "depends_on": [3]},  # not an earlier step
+    ))
+    assert deps == [set(), {0}, {0, 1}]
+
+
+class FakeRunner(BaseRunner):
+    def __init__(self):
+        self.active = self.peak = 0
+        self.lock = threading.Lock()
+
+    def run_command_with_callback(self, command, output_callback=None, error_callback=None):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        for i in range(3):
+            output_callback(f"{command} {i}\n")
+            time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        return 1 if "fail" in command else 0
+
+
+def test_run_steps_ordered_output_and_stop_on_failure():
+    runner = FakeRunner()
+    events, results = [], []
+    plan = steps(
+        {"cmd": "wp plugin list", "parallel_safe": True},
+        {"cmd": "wp core version", "parallel_safe": True},
+        {"cmd": "wp plugin get fail", "parallel_safe": True},
+        {"cmd": "wp plugin update akismet"},
+        {"cmd": "wp theme list", "parallel_safe": True},
+    )
+    run_steps(runner, plan, lambda kind, index, payload: events.append((kind, index)), results, max_parallel=4)
+    assert runner.peak > 1
+    indices = [index for _, index in events]
+    assert indices == sorted(indices)
+    # the barrier after the failed step never starts
+    assert [r["command"] for r in results] == ["wp plugin list", "wp core version", "wp plugin get fail"]
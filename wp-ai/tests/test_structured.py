@@ -0,0 +1,78 @@
+import pytest
+
+from wp_ai.main import PlanModel, _validate_ai_response
+from wp_ai.structured import TruncatedJSONError, extract_json_object, json_schema, openapi_schema
+
+
+def test_plain_object():
+    assert extract_json_object('{"a": 1}') == {"a": 1}
+
+
+@pytest.mark.parametrize("text", [
+    '```json\n{"a": 1}\n```',
+    'Here is the plan:\n{"a": 1}\nThanks.',
+    '{"a": 1,}',
+    "{'a': 1}".replace("'", '"'),
+    'Use {placeholder} then {"a": 1}',
+])
+def test_tolerant(text):
+    assert extract_json_object(text) == {"a": 1}
+
+
+def test_python_literals_and_raw_newlines():
+    assert extract_json_object('{"a": True, "b": None, "c": "x\ny"}') == {"a": True, "b": None, "c": "x\ny"}
+
+
+@pytest.mark.parametrize("text", [
+    '{"commands": ["wp plugin list", "wp db query \\"DELETE FROM wp_posts WHERE post_date <',
+    '{"commands": ["wp plugin list",',
+    '```json\n{"intent": "x", "commands": ["wp core version"]',
+])
+def test_truncated_is_rejected(text):
+    with pytest.raises(TruncatedJSONError):
+        extract_json_object(text)
+    with pytest.raises(ValueError):
+        _validate_ai_response(text)
+
+
+def test_no_object():
+    with pytest.raises(ValueError):
+        extract_json_object("I cannot help with that.")
+
+
+def test_schemas():
+    schema = json_schema(PlanModel)
+    assert "$defs" not in schema and "title" not in schema
+    assert openapi_schema(PlanModel)["properties"]["steps"]["items"]["properties"]["cmd"]["type"] == "string"
+
+
+class FakeClient:
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls.append(kwargs.get("call_type"))
+        return self.replies.pop(0)
+
+
+class Prompt:
+    system = "system"
+
+    def user_text(self):
+        return "instruction"
+
+
+def test_generate_plan_repairs_invalid_reply():
+    from wp_ai.main import _generate_plan
+    client = FakeClient('{"intent": "x"}', '{"commands": ["wp core version"]}')
+    assert _generate_plan(client, Prompt()).normalized_commands() == ["wp core version"]
+    assert client.calls == [None, "plan_repair"]
+
+
+def test_generate_plan_does_not_repair_truncated_reply():
+    from wp_ai.main import InvalidPlanError, _generate_plan
+    client = FakeClient('{"commands": ["wp plugin list", "wp db query \\"DELETE FROM wp_posts WHERE')
+    with pytest.raises(InvalidPlanError):
+        _generate_plan(client, Prompt())
+    assert client.calls == [None]
@@ -0,0 +1,71 @@
+import threading
+
+from wp_ai.gui.worker_pool import CANCELLED, QUEUED, RUNNING, WorkerPool
+
+
+def test_long_running_tasks_do_not_block_workers():
+    pool = WorkerPool(max_workers=1)
+    release = threading.Event()
+    fetched = threading.Event()
+    streams = [pool.submit(release.wait, 5, long_running=True) for _ in range(3)]
+    pool.submit(fetched.set)
+    assert fetched.wait(2)
+    assert [h.status for h in streams] == [RUNNING] * 3
+    release.set()
+
+
+def test_long_running_task_shares_key_and_reports_result():
+    pool = WorkerPool(max_workers=1)
+    release = threading.Event()
+    results = []
+    done = threading.Event()
+
+    def on_done(value):
+        results.append(value)
+        if len(results) == 2:
+            done.set()
+
+    pool.submit(lambda: release.wait(5) and "ok", key="stream", long_running=True, on_done=on_done)
+    pool.submit(lambda: "other", key="stream", on_done=on_done)
+    release.set()
+    assert done.wait(2)
+    assert results == ["ok", "ok"]
+
+
+def test_cancel_long_running_task():
+    pool = WorkerPool()
+    started = threading.Event()
+    finished = threading.Event()
+
+    def task():
+        from wp_ai.gui.worker_pool import current_token
+        started.set()
+        current_token().wait(5)
+        finished.set()
+
+    handle = pool.submit(task, long_running=True)
+    assert started.wait(2)
+    handle.cancel()
+    assert finished.wait(2)
+    assert handle.status == CANCELLED
+    assert not [t for t in pool.snapshot() if t["status"] in (QUEUED, RUNNING)]
+
+
+def test_non_cancellable_task_ignores_cancel_all():
+    pool = WorkerPool()
+    started = threading.Event()
+    release = threading.Event()
+    done = threading.Event()
+
+    def task():
+        started.set()
+        release.wait(5)
+
+    handle = pool.submit(task, long_running=True, cancellable=False, on_done=lambda _: done.set())
+    assert started.wait(2)
+    pool.cancel_all()
+    handle.cancel()
+    assert handle.status == RUNNING and not handle.token.cancelled
+    assert pool.snapshot()[0]["cancellable"] is False
+    release.set()
+    assert done.wait(2)
@@ -0,0 +1,80 @@
+"""
+Asyncio helpers for WP-AI
+
+The HTTP client (AsyncWPDoctorClient context prefetch, the OpenAI-compatible
+client) and the Gemini stream are coroutines. Synchronous callers (CLI
+commands, GUI worker threads) reach them through run_sync() /
+iterate_sync(), which run the coroutine on a single shared background event
+loop, so keep-alive connections are reused across calls.
+"""
+
+import asyncio
+import threading
+from typing import AsyncIterator, Awaitable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared background event loop, starting it on first use."""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            _loop_thread = threading.Thread(target=run, name="wp-ai-aio", daemon=True)
+            _loop_thread.start()
+            ready.wait()
+            _loop = loop
+        return _loop
+
+
+def in_loop_thread() -> bool:
+    """True when called from the shared loop's own thread."""
+    return _loop_thread is not None and threading.current_thread() is _loop_thread
+
+
+def run_sync(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """Run a coroutine on the shared loop and block until it finishes.
+
+    Must not be called from the loop thread itself (that would deadlock).
+    If the caller is interrupted (e.g. KeyboardInterrupt), the coroutine is
+    cancelled.
+    """
+    if in_loop_thread():
+        raise RuntimeError("run_sync() called from the event loop thread; await the coroutine instead")
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()
+        raise
+
+
+def iterate_sync(agen: AsyncIterator[T]) -> Iterator[T]:
+    """Iterate an async generator from synchronous code, one item at a time."""
+    try:
+        while True:
+            try:
+                item = run_sync(agen.__anext__())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        aclose = getattr(agen, "aclose", None)
+        if aclose is not None:
+            try:
+                run_sync(aclose())
+            except Exception:
+                pass
+
@@ -1,29 +1,21 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 import requests
 from requests.auth import HTTPBasicAuth
+from .http_client import AsyncHTTPClient
 
-class WPDoctorClient:
-    def __init__(self, base_wp_json_url: str, username: Optional[str] = None, password: Optional[str] = None, timeout: int = 15):
-        # base_wp_json_url example: https://example.com/wp-json
-        self.base = base_wp_json_url.rstrip('/')
-        self.auth = HTTPBasicAuth(username, password) if username and password else None
-        self.timeout = timeout
+
+class _WPDoctorEndpoints:
+    """WP Doctor REST endpoints, written against self._get / self._post.
+
+    In WPDoctorClient those return values; in AsyncWPDoctorClient they return
+    coroutines, so every endpoint method is awaitable there.
+    """
 
     def _get(self, path: str, params: Optional[Dict[str, Any]] = None):
-        url = f"{self.base}/{path.lstrip('/')}"
-        resp = requests.get(url, auth=self.auth, params=params, timeout=self.timeout)
-        resp.raise_for_status()
-        return resp.json()
+        raise NotImplementedError
 
     def _post(self, path: str, json_body: Optional[Dict[str, Any]] = None):
-        url = f"{self.base}/{path.lstrip('/')}"
-        resp = requests.post(url, auth=self.auth, json=json_body or {}, timeout=self.timeout)
-        resp.raise_for_status()
-        # actions may return JSON or text
-        try:
-            return resp.json()
-        except ValueError:
-            return {"raw": resp.text}
+        raise NotImplementedError
 
     # Diagnostics
     def quick_checks(self) -> Dict[str, Any]:
@@ -71,3 +63,69 @@ class WPDoctorClient:
 
     def llm_chat(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         return self._post('wpdoctor/v1/llm-chat', {"messages": messages})
+
+
+class AsyncWPDoctorClient(_WPDoctorEndpoints):
+    """asyncio WP Doctor client: ``await client.system_info()``.
+
+    Pass a shared AsyncHTTPClient to reuse connections across clients
+    (e.g. when querying many hosts from one event loop).
+    """
+
+    def __init__(self, base_wp_json_url: str, username: Optional[str] = None, password: Optional[str] = None,
+                 timeout: int = 15, http: Optional[AsyncHTTPClient] = None):
+        # base_wp_json_url example: https://example.com/wp-json
+        self.base = base_wp_json_url.rstrip('/')
+        self.auth: Optional[Tuple[str, str]] = (username, password) if username and password else None
+        self.timeout = timeout
+        self.http = http or AsyncHTTPClient(timeout=timeout)
+
+    async def _get(self, path: str, params: Optional[Dict[str, Any]] = None):
+        url = f"{self.base}/{path.lstrip('/')}"
+        resp = await self.http.get(url, auth=self.auth, params=params, timeout=self.timeout)
+        resp.raise_for_status()
+        return await resp.json()
+
+    async def _post(self, path: str, json_body: Optional[Dict[str, Any]] = None):
+        url = f"{self.base}/{path.lstrip('/')}"
+        resp = await self.http.post(url, auth=self.auth, json=json_body or {}, timeout=self.timeout)
+        resp.raise_for_status()
+        # actions may return JSON or text
+        try:
+            return await resp.json()
+        except ValueError:
+            return {"raw": await resp.text()}
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+class WPDoctorClient(_WPDoctorEndpoints):
+    """Synchronous WP Doctor client (requests: honours proxies, CA bundles, gzip)."""
+
+    def __init__(self, base_wp_json_url: str, username: Optional[str] = None, password: Optional[str] = None, timeout: int = 15):
+        # base_wp_json_url example: https://example.com/wp-json
+        self.base = base_wp_json_url.rstrip('/')
+        self.auth = HTTPBasicAuth(username, password) if username and password else None
+        self.timeout = timeout
+        # keep-alive across calls to the same site
+        self.session = requests.Session()
+
+    def _get(self, path: str, params: Optional[Dict[str, Any]] = None):
+        url = f"{self.base}/{path.lstrip('/')}"
+        resp = self.session.get(url, auth=self.auth, params=params, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def _post(self, path: str, json_body: Optional[Dict[str, Any]] = None):
+        url = f"{self.base}/{path.lstrip('/')}"
+        resp = self.session.post(url, auth=self.auth, json=json_body or {}, timeout=self.timeout)
+        resp.raise_for_status()
+        # actions may return JSON or text
+        try:
+            return resp.json()
+        except ValueError:
+            return {"raw": resp.text}
+
+    def close(self):
+        self.session.close()
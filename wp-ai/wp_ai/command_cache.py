@@ -0,0 +1,223 @@
+"""
+Result cache for read-only WP-CLI commands
+
+Plans often repeat the same read-only checks (`wp plugin list`,
+`wp core version`, `wp option get ...`) a few minutes apart. Commands that
+READ_ONLY_COMMANDS classifies as read-only have their output cached per
+host for a short TTL ([runner].cache_ttl seconds), in
+~/.config/wp-ai/command_cache.json so that separate `wp-ai say` runs and
+GUI sessions share it.
+
+Anything else run on a host -- a mutating wp command, a shell command, a
+command that could not be parsed, several lines of commands -- drops all
+cached results of that host, since the site may have changed. Only
+successful runs (exit code 0) with modest output are cached, and commands
+whose output may hold secrets are never written to the cache file:
+wp-config values (DB_PASSWORD, salts), options and transients (SMTP
+passwords, API / license keys, OAuth tokens) and users and their meta
+(emails, session tokens).
+
+CachingRunner (runner.py) applies the cache around any BaseRunner; replays
+start with a "[cached ...]" line and callers record "cached" in history.
+"""
+
+import json
+import os
+import posixpath
+import shlex
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .config import CONFIG_DIR, ensure_config_dir
+
+COMMAND_CACHE_FILE = CONFIG_DIR / "command_cache.json"
+MAX_OUTPUT_BYTES = 256 * 1024  # larger outputs are not cached
+
+# wp <command> [<subcommand> [<subcommand>]] that only read site state
+READ_ONLY_COMMANDS = frozenset({
+    ("core", "version"), ("core", "is-installed"), ("core", "check-update"), ("core", "verify-checksums"),
+    ("plugin", "list"), ("plugin", "get"), ("plugin", "status"), ("plugin", "is-active"),
+    ("plugin", "is-installed"), ("plugin", "path"), ("plugin", "search"), ("plugin", "verify-checksums"),
+    ("theme", "list"), ("theme", "get"), ("theme", "status"), ("theme", "is-active"),
+    ("theme", "is-installed"), ("theme", "path"), ("theme", "search"),
+    ("option", "get"), ("option", "list"), ("option", "pluck"),
+    ("cron", "event", "list"), ("cron", "schedule", "list"),
+    ("user", "list"), ("user", "get"), ("user", "list-caps"), ("user", "meta", "get"), ("user", "meta", "list"),
+    ("post", "list"), ("post", "get"), ("post", "meta", "get"), ("post", "meta", "list"),
+    ("term", "list"), ("term", "get"), ("comment", "list"), ("comment", "get"), ("comment", "count"),
+    ("post-type", "list"), ("post-type", "get"), ("taxonomy", "list"), ("taxonomy", "get"),
+    ("site", "list"), ("role", "list"), ("role", "exists"), ("cap", "list"),
+    ("db", "size"), ("db", "tables"), ("db", "prefix"), ("db", "columns"),
+    ("config", "get"), ("config", "list"), ("config", "has"), ("config", "path"),
+    ("cache", "type"), ("cache", "get"), ("transient", "get"), ("transient", "type"),
+    ("rewrite", "list"), ("menu", "list"), ("menu", "item", "list"), ("sidebar", "list"), ("widget", "list"),
+    ("media", "image-size"), ("maintenance-mode", "status"),
+    ("language", "core", "list"), ("language", "plugin", "list"), ("language", "theme", "list"),
+    ("cli", "version"), ("cli", "info"), ("package", "list"),
+})
+
+# read-only, but their output must not be stored in plaintext
+UNCACHEABLE_COMMANDS = frozenset({
+    ("config", "get"), ("config", "list"),
+    ("option", "get"), ("option", "list"), ("option", "pluck"),
+    ("transient", "get"), ("cache", "get"),
+    ("user", "list"), ("user", "get"), ("user", "meta", "get"), ("user", "meta", "list"),
+})
+
+# global options that make any command run arbitrary code
+UNSAFE_OPTIONS = ("--exec", "--require")
+
+_WP_EXECUTABLES = ("wp", "wp-cli", "wp-cli.phar")
+
+
+def wp_subcommand(command: str) -> Optional[Tuple[str, ...]]:
+    """The wp command path of a plain WP-CLI invocation (e.g. ("plugin", "list")).
+
+    None for shell pipelines, redirections, substitutions, comments,
+    multi-line text, non-wp commands, unparsable text and invocations using
+    --exec / --require.
+    """
+    if any(ch in command for ch in "`\n\r#") or "$(" in command:
+        return None
+    try:
+        lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+        lexer.whitespace_split = True
+        tokens = list(lexer)
+    except ValueError:
+        return None
+    if any(token and all(ch in "();<>|&" for ch in token) for token in tokens):
+        return None
+
+    start = next((i for i, token in enumerate(tokens)
+                  if posixpath.basename(token) in _WP_EXECUTABLES), None)
+    if start is None:
+        return None
+    # only environment assignments and interpreters (php ...) may come before wp
+    if any("=" not in token and "php" not in posixpath.basename(token) for token in tokens[:start]):
+        return None
+
+    words: List[str] = []
+    for token in tokens[start + 1:]:
+        if token.startswith("-"):
+            if token.split("=", 1)[0] in UNSAFE_OPTIONS:
+                return None
+            continue
+        words.append(token)
+    if not words:
+        # wp --info / wp --version
+        return ("--info",) if any(t in ("--info", "--version") for t in tokens[start + 1:]) else None
+    return tuple(words)
+
+
+def is_read_only(command: str) -> bool:
+    """True if the command is a WP-CLI command that does not change the site."""
+    path = wp_subcommand(command)
+    if path is None:
+        return False
+    if path == ("--info",):
+        return True
+    return path[:3] in READ_ONLY_COMMANDS or path[:2] in READ_ONLY_COMMANDS
+
+
+def is_cacheable(command: str) -> bool:
+    """True if the command is read-only and its output may be stored in the cache file."""
+    path = wp_subcommand(command)
+    return (is_read_only(command) and path[:2] not in UNCACHEABLE_COMMANDS
+            and path[:3] not in UNCACHEABLE_COMMANDS)
+
+
+def command_key(command: str) -> str:
+    """Whitespace-normalized command text used as the cache key."""
+    try:
+        return shlex.join(shlex.split(command))
+    except ValueError:
+        return " ".join(command.split())
+
+
+class CommandCache:
+    """Cached outputs per host and command, persisted as JSON.
+
+    Entries are {"ts", "exit_code", "lines": [[stream, text], ...]} where
+    stream is "out" or "err".
+    """
+
+    def __init__(self, path=COMMAND_CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._hosts: Optional[Dict[str, Dict[str, dict]]] = None
+
+    def _load(self) -> Dict[str, Dict[str, dict]]:
+        if self._hosts is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._hosts = data if isinstance(data, dict) else {}
+            except (OSError, ValueError):
+                self._hosts = {}
+        return self._hosts
+
+    def _save(self, max_age: float):
+        cutoff = time.time() - max_age
+        hosts = {}
+        for host, entries in self._load().items():
+            live = {k: v for k, v in entries.items() if v.get("ts", 0) > cutoff}
+            if live:
+                hosts[host] = live
+        self._hosts = hosts
+        try:
+            ensure_config_dir()
+            tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+            # command output (user lists, options) is for this user only
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with open(fd, "w", encoding="utf-8") as f:
+                json.dump(hosts, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def lookup(self, host: str, command: str, ttl: float) -> Optional[dict]:
+        """The cached entry for command on host if younger than ttl seconds, else None."""
+        if ttl <= 0:
+            return None
+        with self._lock:
+            self._hosts = None  # pick up invalidations from other processes
+            entry = self._load().get(host, {}).get(command_key(command))
+            if not entry or time.time() - entry.get("ts", 0) > ttl:
+                return None
+            return entry
+
+    def store(self, host: str, command: str, exit_code: int, lines: List[Tuple[str, str]], ttl: float):
+        if ttl <= 0 or sum(len(text) for _, text in lines) > MAX_OUTPUT_BYTES:
+            return
+        with self._lock:
+            self._hosts = None
+            self._load().setdefault(host, {})[command_key(command)] = {
+                "ts": time.time(), "exit_code": exit_code, "lines": [list(line) for line in lines],
+            }
+            self._save(ttl)
+
+    def invalidate(self, host: Optional[str] = None):
+        """Drop the cached results of host (all hosts if None)."""
+        with self._lock:
+            self._hosts = None
+            hosts = self._load()
+            if host is None:
+                if not hosts:
+                    return
+                hosts.clear()
+            elif hosts.pop(host, None) is None:
+                return
+            self._save(float("inf"))
+
+
+_cache: Optional[CommandCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_command_cache() -> CommandCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CommandCache()
+        return _cache
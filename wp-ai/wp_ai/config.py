@@ -9,18 +9,30 @@ else:
     import tomli
 from typing import Optional, List
 import keyring
-from pydantic import BaseModel
-import json
+from pydantic import BaseModel, field_validator
 import datetime
 
 APP_NAME = "wp-ai"
 CONFIG_DIR = Path.home() / ".config" / APP_NAME
 CONFIG_FILE = CONFIG_DIR / "config.toml"
 HISTORY_FILE = CONFIG_DIR / "history.jsonl"
+HISTORY_DB = CONFIG_DIR / "history.db"
+LLM_CALLS_FILE = CONFIG_DIR / "llm_calls.jsonl"
 
 class LLMConfig(BaseModel):
     provider: str = "gemini"
     model: str = "gemini-1.5-flash"
+    base_url: Optional[str] = None  # openai provider: OpenAI-compatible endpoint, e.g. http://192.168.1.10:8000/v1
+    fallback_models: List[str] = []  # tried in order when `model` is rate-limited or unavailable
+    timeout: float = 60.0  # per-call deadline in seconds, across retries and fallbacks (0 = none)
+    max_retries: int = 2  # retries per model on rate limits / transient errors
+    backoff_base: float = 1.0  # seconds; full-jitter exponential backoff
+    backoff_max: float = 20.0
+    breaker_threshold: int = 3  # consecutive failures that open the circuit for a model
+    breaker_cooldown: float = 30.0  # seconds before a half-open trial
+    prompt_cache: bool = True  # cache the planner system prompt on the provider side (Gemini cached content / prefix reuse)
+    prompt_cache_ttl: int = 3600  # seconds a Gemini cached prompt is kept
+    structured_output: bool = True  # constrain plan replies with a JSON schema (Gemini response_schema / OpenAI response_format)
 
 class PolicyConfig(BaseModel):
     blocklist: List[str] = [r"^wp db drop", r"^wp user delete"]
@@ -28,6 +40,33 @@ class PolicyConfig(BaseModel):
 
 class RunnerConfig(BaseModel):
     default: str = "ssh"
+    cache_ttl: float = 120.0  # seconds read-only wp commands (plugin list, option get, ...) are served from cache (0 = off)
+    max_parallel: int = 4  # independent read-only plan steps run at the same time (1 = strictly sequential)
+
+class HistoryConfig(BaseModel):
+    backend: str = "sqlite"  # "sqlite" or "jsonl"
+    rotate: str = "monthly"  # jsonl: "monthly" or "none"
+    max_bytes: int = 0  # jsonl: also rotate when the active file reaches this size (0 = off)
+    compression: str = "gzip"  # jsonl segments: "gzip", "zstd" or "none"
+    retention_days: int = 0  # drop entries/segments older than this (0 = keep forever)
+    output_max_bytes: int = 64 * 1024  # per-step output kept in history, head + tail (0 = don't capture)
+
+    @field_validator('compression')
+    @classmethod
+    def validate_compression(cls, v):
+        v = v.strip().lower()
+        allowed = ("gzip", "zstd", "none")
+        if v not in allowed:
+            raise ValueError(f"compression must be one of {allowed}")
+        return v
+
+class GuiConfig(BaseModel):
+    scrollback_lines: int = 5000  # lines kept in chat/execution output widgets (0 = unlimited)
+    chat_memory_tokens: int = 3000  # chat history sent with each message; older turns are summarized (0 = no history)
+    chat_summary_tokens: int = 500  # target length of the running summary
+    context_max_age: float = 60.0  # seconds prefetched context is reused when sending (0 = no prefetch)
+    context_deadline: float = 2.0  # seconds to wait for context before calling the LLM (0 = wait for all sections)
+    context_refine: bool = True  # follow up when late context shows fatal errors etc.
 
 class SSHConfig(BaseModel):
     host: str
@@ -39,16 +78,27 @@ class SSHConfig(BaseModel):
     known_hosts_path: Optional[str] = None
     wp_path: Optional[str] = None
     wordpress_path: Optional[str] = None
+    max_sessions: int = 10  # concurrent channels per connection (server MaxSessions; OpenSSH default 10)
+    error_log_path: Optional[str] = None  # PHP/WordPress error log; log viewer follows it over SSH (tail -F)
+
+class DockerComposeConfig(BaseModel):
+    service: Optional[str] = None  # default: "wpcli"
+    wordpress_path: Optional[str] = None  # default: "/var/www/html"
+    file: Optional[str] = None  # docker-compose file (-f)
 
 class HostConfig(BaseModel):
     name: str
     ssh: SSHConfig
     api_url: Optional[str] = None
+    runner: Optional[str] = None  # "ssh" or "docker_compose"; defaults to [runner].default
+    docker_compose: Optional[DockerComposeConfig] = None
 
 class Config(BaseModel):
     llm: LLMConfig = LLMConfig()
     policy: PolicyConfig = PolicyConfig()
     runner: RunnerConfig = RunnerConfig()
+    history: HistoryConfig = HistoryConfig()
+    gui: GuiConfig = GuiConfig()
     hosts: list[HostConfig] = []
 
     def get_host(self, name: str) -> Optional[HostConfig]:
@@ -105,11 +155,9 @@ def write_default_config(path: Optional[Path] = None):
 
 
 def history_append(entry: dict):
-    """Append a JSON object to history.jsonl in the config dir."""
-    ensure_config_dir()
-    HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(HISTORY_FILE, "a", encoding="utf-8") as f:
-        f.write(json.dumps({"ts": datetime.datetime.utcnow().isoformat() + "Z", **entry}, ensure_ascii=False) + "\n")
+    """Append an entry to the configured history store (SQLite by default)."""
+    from .history import get_history_store
+    get_history_store().append({"ts": datetime.datetime.utcnow().isoformat() + "Z", **entry})
 
 
 def get_api_key(provider: str) -> Optional[str]:
@@ -1,19 +1,28 @@
+import re
 from typing import Dict, Any, List
 
-def build_context_text(payloads: Dict[str, Any]) -> str:
-    parts: List[str] = []
+# Log lines that make late-arriving context worth a follow-up answer
+SIGNIFICANT_PATTERN = re.compile(
+    r"fatal|uncaught|parse error|critical|emergency|allowed memory size|out of memory|"
+    r"error establishing a database connection|segmentation fault",
+    re.IGNORECASE,
+)
+
+def build_context_sections(payloads: Dict[str, Any]) -> Dict[str, str]:
+    """Context text per payload ("system_info", "plugins_analysis", "error_logs", "db_check")."""
+    sections: Dict[str, str] = {}
     si = payloads.get('system_info')
     if si:
         wp = si.get('wordpress_version') or si.get('wp_version') or si.get('wp')
         php = si.get('php_version') or si.get('php')
         os = si.get('server_os') or si.get('os')
-        parts.append(f"System: WP={wp} PHP={php} OS={os}")
+        sections['system_info'] = f"System: WP={wp} PHP={php} OS={os}"
     pa = payloads.get('plugins_analysis')
     if pa:
         active = pa.get('active_count') or (len([p for p in pa.get('plugins', []) if p.get('status') == 'active']) if isinstance(pa.get('plugins'), list) else None)
         updates = pa.get('updates', [])
         upd_count = len(updates) if isinstance(updates, list) else (updates.get('count') if isinstance(updates, dict) else None)
-        parts.append(f"Plugins: active={active} updates={upd_count}")
+        sections['plugins_analysis'] = f"Plugins: active={active} updates={upd_count}"
     el = payloads.get('error_logs')
     if el:
         lines = el.get('tail') or el.get('lines') or el.get('log')
@@ -24,10 +33,18 @@ def build_context_text(payloads: Dict[str, Any]) -> str:
         else:
             tail = None
         if tail:
-            parts.append("Recent Errors:\n" + tail)
+            sections['error_logs'] = "Recent Errors:\n" + tail
     db = payloads.get('db_check')
     if db:
         autoload = db.get('autoload_size') or db.get('autoload_bytes')
         overhead = db.get('overhead')
-        parts.append(f"DB: autoload={autoload} overhead={overhead}")
+        sections['db_check'] = f"DB: autoload={autoload} overhead={overhead}"
+    return sections
+
+def build_context_text(payloads: Dict[str, Any]) -> str:
+    parts: List[str] = list(build_context_sections(payloads).values())
     return '\n'.join([p for p in parts if p])
+
+def significant_sections(sections: Dict[str, str]) -> List[str]:
+    """Names of context sections with something an answer should not ignore (fatal errors etc.)."""
+    return [name for name, text in sections.items() if text and SIGNIFICANT_PATTERN.search(text)]
@@ -0,0 +1,161 @@
+"""
+Multi-turn chat memory with a token budget
+
+ConversationMemory keeps the chat turns of one conversation and builds the
+message list for each request:
+
+    [system: base prompt + running summary + current context]
+    [recent turns, verbatim, newest that fit in the token budget]
+    [user: the new prompt]
+
+Turns that fall out of the budget are folded into a running summary by
+summarize(), which callers run in the background after a reply completes;
+until then those turns are simply not sent.
+
+Context payloads (system info, plugins, logs, DB) are kept as named
+sections. Each request carries the latest version of every section once,
+in the system message, instead of repeating it with each turn.
+"""
+
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from .llm_metrics import estimate_tokens
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a WordPress site administrator "
+    "and the WP-AI assistant. Update the summary with the new turns below. Keep facts that "
+    "later questions may depend on: the site/host, versions, errors, plugins, commands tried "
+    "and their results, decisions and open questions. Drop pleasantries. Write in the language "
+    "of the conversation, as terse notes, at most {max_tokens} tokens.\n\n"
+    "Current summary:\n{summary}\n\nNew turns:\n{turns}\n\nUpdated summary:"
+)
+
+LATE_CONTEXT_PROMPT = (
+    "More system context arrived after your last answer ({sections}, now in the system context). "
+    "It shows problems that may change that answer. Briefly correct or extend your last answer "
+    "based on it; do not repeat what is still valid."
+)
+
+
+class ConversationMemory:
+    """Token-budgeted chat history with a rolling summary (thread-safe)."""
+
+    def __init__(self, budget_tokens: int = 3000, summary_max_tokens: int = 500):
+        self.budget_tokens = budget_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.summary = ""
+        self._turns: List[Tuple[str, str, int]] = []  # (role, content, tokens)
+        self._context: Dict[str, str] = {}
+        self._summarizing = False
+        self._lock = threading.Lock()
+
+    # ===== turns =====
+
+    def add_exchange(self, prompt: str, reply: str):
+        """Record a completed user prompt / assistant reply pair."""
+        with self._lock:
+            self._turns.append(("user", prompt, estimate_tokens(prompt)))
+            self._turns.append(("assistant", reply, estimate_tokens(reply)))
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
+            self._context.clear()
+            self.summary = ""
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._turns)
+
+    # ===== context =====
+
+    def update_context(self, sections: Dict[str, str]) -> List[str]:
+        """Merge context sections; returns the names whose content changed."""
+        changed = []
+        with self._lock:
+            for name, text in sections.items():
+                if text and self._context.get(name) != text:
+                    self._context[name] = text
+                    changed.append(name)
+        return changed
+
+    def clear_context(self):
+        with self._lock:
+            self._context.clear()
+
+    def context_text(self) -> str:
+        with self._lock:
+            return "\n".join(self._context.values())
+
+    # ===== request building =====
+
+    def _window_start(self, reserved: int) -> int:
+        """Index of the oldest turn that fits in the budget (whole exchanges only)."""
+        used = reserved
+        start = len(self._turns)
+        for index in range(len(self._turns) - 2, -1, -2):
+            pair = self._turns[index][2] + self._turns[index + 1][2]
+            if used + pair > self.budget_tokens:
+                break
+            used += pair
+            start = index
+        return start
+
+    def build_messages(self, system_prompt: str, prompt: str) -> List[Dict[str, str]]:
+        """Messages for the next request (ChatWindow / LLMClient format)."""
+        with self._lock:
+            system = system_prompt
+            if self.summary:
+                system += f"\n\nSummary of the earlier conversation:\n{self.summary}"
+            if self._context:
+                system += "\n\nHere is the current system context:\n" + "\n".join(self._context.values())
+            reserved = estimate_tokens(prompt) + estimate_tokens(self.summary)
+            start = self._window_start(reserved) if self.budget_tokens > 0 else len(self._turns)
+            messages = [{"role": "system", "content": system}]
+            messages.extend({"role": role, "content": content} for role, content, _ in self._turns[start:])
+            messages.append({"role": "user", "content": prompt})
+            return messages
+
+    # ===== summarization =====
+
+    def needs_summary(self) -> bool:
+        """True when some turns no longer fit in the budget and are not summarized yet."""
+        with self._lock:
+            if self._summarizing or self.budget_tokens <= 0:
+                return False
+            # leave room for the next prompt: summarize once the window is past half full
+            return self._window_start(self.budget_tokens // 2) > 0
+
+    def summarize(self, generate: Callable[[str], str]) -> bool:
+        """Fold the turns outside the budget into the running summary.
+
+        ``generate`` is a prompt -> text function (e.g. LLMClient.generate_content);
+        it is called without holding the lock. Returns True if the summary changed.
+        """
+        with self._lock:
+            if self._summarizing:
+                return False
+            count = self._window_start(self.budget_tokens // 2)
+            if count <= 0:
+                return False
+            self._summarizing = True
+            old = self._turns[:count]
+            summary = self.summary
+        try:
+            turns = "\n".join(f"{'User' if role == 'user' else 'Assistant'}: {content}" for role, content, _ in old)
+            new_summary = generate(SUMMARY_PROMPT.format(
+                max_tokens=self.summary_max_tokens, summary=summary or "(none)", turns=turns,
+            )).strip()
+        except Exception:
+            with self._lock:
+                self._summarizing = False
+            raise
+        with self._lock:
+            self._summarizing = False
+            if not new_summary or self._turns[:count] != old:
+                # cleared or changed meanwhile
+                return False
+            del self._turns[:count]
+            self.summary = new_summary
+        return True
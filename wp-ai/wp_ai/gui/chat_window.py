@@ -6,23 +6,26 @@ WP-AI Chat Window
 """
 
 import tkinter as tk
-from tkinter import scrolledtext, messagebox
+from tkinter import scrolledtext, messagebox, filedialog
 from tkinter import ttk
-import threading
-import queue
 import sys
 import os
+from functools import partial
+from typing import Optional
 
 # UTF-8設定
 from .utils import setup_encoding, get_font_family, center_window
 from .widgets import StatusBar, ContextControlPanel
+from .output_buffer import OutputBuffer
+from .worker_pool import submit, current_token, TaskHandle, TaskCancelled, PRIORITY_HIGH, PRIORITY_LOW
+from .event_bus import subscribe
 from .dialogs import LLMSettingsDialog, HostManagerDialog
+from .context_prefetch import ContextPrefetcher, collect, context_requests, get_context_cache
 
 from ..config import load_config, Config
 from ..llm import LLMClient
-from ..api import WPDoctorClient
-from ..context import build_context_text
-from ..auth import get_api_basic_auth_keys
+from ..context import build_context_sections, significant_sections
+from ..conversation import ConversationMemory, LATE_CONTEXT_PROMPT
 
 
 class ChatWindow(tk.Toplevel):
@@ -31,6 +34,12 @@ class ChatWindow(tk.Toplevel):
     AIとのチャット、ホスト選択、LLM設定などを提供
     """
     
+    BASE_SYSTEM_PROMPT = (
+        "You are WP-AI assistant. "
+        "Reply in natural Japanese prose aimed at WordPress site administrators. "
+        "Provide helpful and accurate information about WordPress management and troubleshooting."
+    )
+    
     def __init__(self, parent=None):
         # 親がない場合は独立ウィンドウとして起動（Tkとして扱う）
         if parent is None:
@@ -56,7 +65,7 @@ class ChatWindow(tk.Toplevel):
         
         # LLMクライアント初期化
         try:
-            self.client = LLMClient(self.config.llm)
+            self.client = LLMClient(self.config.llm, call_type="chat")
         except Exception as e:
             messagebox.showwarning(
                 "LLM初期化エラー",
@@ -64,18 +73,33 @@ class ChatWindow(tk.Toplevel):
             )
             self.client = None
         
-        # キュー・イベント
-        self.response_queue = queue.Queue()
-        self._cancel_event = threading.Event()
+        # ワーカーからのメッセージ（イベントバス経由でTkスレッドに配送）
+        self.events = subscribe(self, self.handle_event)
+        self._chat_task: Optional[TaskHandle] = None
         self._typing_phase = None
         self._typing_dots = 0
         self._typing_after_id = None
         
+        # 会話メモリ（直近のターンはそのまま、古いターンは要約して送る）
+        self.memory = ConversationMemory(
+            budget_tokens=self.config.gui.chat_memory_tokens,
+            summary_max_tokens=self.config.gui.chat_summary_tokens,
+        )
+        
         self._build_ui()
         self._load_hosts()
         
-        # キューチェック開始
-        self.after(100, self.check_queue)
+        # 選択中ホストのコンテキストを先読みしておき、送信時はすぐLLMを呼ぶ
+        self.prefetcher = ContextPrefetcher(self, self._selected_host, self.context_panel, self.prompt_input)
+        self.prefetcher.schedule()
+        
+        # ストリーミングのチャンクはフレーム単位でまとめて描画
+        # 古い行はスクロールバック上限で削除（全文は「ログ保存」で保存できる）
+        self.chat_buffer = OutputBuffer(
+            self.chat_display,
+            on_flush=self._on_chunks_rendered,
+            max_lines=self.config.gui.scrollback_lines,
+        )
     
     def _build_ui(self):
         """UI構築"""
@@ -104,6 +128,8 @@ class ChatWindow(tk.Toplevel):
         tk.Button(top_bar, text="Reload", command=self.reload_hosts).pack(side=tk.LEFT)
         tk.Button(top_bar, text="Manage", command=self.open_host_manager).pack(side=tk.LEFT, padx=(6, 0))
         tk.Button(top_bar, text="LLM設定...", command=self.open_llm_settings).pack(side=tk.LEFT, padx=(6, 0))
+        tk.Button(top_bar, text="ログ保存...", command=self.save_transcript).pack(side=tk.LEFT, padx=(6, 0))
+        tk.Button(top_bar, text="新しい会話", command=self.new_conversation).pack(side=tk.LEFT, padx=(6, 0))
         
         # ===== チャット表示エリア =====
         self.chat_display = scrolledtext.ScrolledText(
@@ -173,11 +199,22 @@ class ChatWindow(tk.Toplevel):
     def reload_hosts(self):
         """ホストをリロード"""
         self._load_hosts()
+        self.prefetcher.schedule()
         self.status_bar.set_status("ホストをリロードしました")
     
+    def _selected_host(self):
+        """選択中のホスト設定（未選択・未設定なら None）"""
+        host_name = self.host_var.get()
+        if not host_name or host_name == "(ホストが未設定)":
+            return None
+        return self.config.get_host(host_name)
+    
     def on_host_change(self, event=None):
         """ホスト変更時の処理"""
         selected = self.host_var.get()
+        # 前のホストのコンテキストは送らない
+        self.memory.clear_context()
+        self.prefetcher.schedule()
         self.status_bar.set_status(f"ホスト切替: {selected}")
     
     def open_host_manager(self):
@@ -201,7 +238,7 @@ class ChatWindow(tk.Toplevel):
         """LLMクライアントを再初期化"""
         try:
             self.config = load_config()
-            self.client = LLMClient(self.config.llm)
+            self.client = LLMClient(self.config.llm, call_type="chat")
             self.status_bar.set_status("LLM設定を再読込しました")
         except Exception as e:
             messagebox.showerror("LLM再初期化エラー", f"LLMクライアントの再初期化に失敗しました:\n{e}")
@@ -209,6 +246,8 @@ class ChatWindow(tk.Toplevel):
     
     def add_message(self, sender: str, message: str, is_streaming=False):
         """メッセージをチャット表示に追加"""
+        # バッファに残っているチャンクを先に描画して順序を保つ
+        self.chat_buffer.flush()
         self.chat_display.config(state="normal")
         
         if not is_streaming:
@@ -225,9 +264,35 @@ class ChatWindow(tk.Toplevel):
         if not is_streaming:
             self.chat_display.insert(tk.END, "\n\n")
         
+        self.chat_buffer.trim()
         self.chat_display.config(state="disabled")
         self.chat_display.see(tk.END)
     
+    def new_conversation(self):
+        """会話メモリをリセット（表示中のログはそのまま残す）"""
+        if self._chat_task and self._chat_task.status in ("queued", "running"):
+            messagebox.showinfo("新しい会話", "応答の生成中です。完了または中断してから実行してください。")
+            return
+        self.memory.clear()
+        self.add_message("System", "新しい会話を開始しました（これまでのやり取りはAIに送られません）")
+        self.status_bar.set_status("新しい会話")
+    
+    def save_transcript(self):
+        """会話の全文をファイルに保存（スクロールバックで削除された行も含む）"""
+        path = filedialog.asksaveasfilename(
+            parent=self,
+            title="会話ログを保存",
+            defaultextension=".txt",
+            filetypes=[("Text", "*.txt"), ("All files", "*.*")],
+        )
+        if not path:
+            return
+        try:
+            self.chat_buffer.save(path)
+            self.status_bar.set_status(f"保存しました: {path}")
+        except Exception as e:
+            messagebox.showerror("保存エラー", f"ログの保存に失敗しました:\n{e}")
+    
     def send_message(self, event=None):
         """メッセージ送信"""
         prompt = self.prompt_input.get().strip()
@@ -251,9 +316,6 @@ class ChatWindow(tk.Toplevel):
         self.send_button.config(state="disabled")
         self.stop_button.config(state="normal")
         
-        # キャンセルフラグリセット
-        self._cancel_event.clear()
-        
         # AIメッセージのプレースホルダー
         self.add_message("AI", "", is_streaming=False)
         
@@ -268,127 +330,154 @@ class ChatWindow(tk.Toplevel):
         self._typing_after_id = self.after(350, self._update_typing_indicator)
         
         # コンテキスト設定の取得（メインスレッドで行う）
-        host_name = self.host_var.get()
-        context_types = self.context_panel.get_context_types()
+        host_config = self._selected_host()
         log_lines, log_level = self.context_panel.get_log_params()
-        
-        # バックグラウンドスレッド開始
-        thread = threading.Thread(
-            target=self.run_chat_stream, 
-            args=(prompt, host_name, context_types, log_lines, log_level), 
-            daemon=True
+        requests = context_requests(self.context_panel.get_context_types(), log_lines, log_level)
+        
+        # 共有ワーカープールで実行（ウィンドウを閉じるとキャンセル）
+        self._chat_task = submit(
+            self.run_chat_stream,
+            prompt, host_config, requests,
+            name="AIチャット応答",
+            priority=PRIORITY_HIGH,
+            owner=self,
+            long_running=True,
         )
-        thread.start()
     
-    def run_chat_stream(self, prompt: str, host_name: str, context_types: list, log_lines: int, log_level: str):
+    def run_chat_stream(self, prompt: str, host_config, requests: list):
         """バックグラウンドスレッドでストリーミング実行"""
+        token = current_token()
+        client = self.client
+        late = {}
         try:
-            # コンテキスト取得
-            context_text = ""
-            if context_types and host_name and host_name != "(ホストが未設定)":
+            # コンテキスト取得（先読み済みで新しければそのまま使う）
+            # 期限までに届かないセクションは待たずにLLMを呼び、応答後に受け取る
+            if requests and host_config and host_config.api_url:
                 try:
-                    host_config = self.config.get_host(host_name)
-                    if host_config and host_config.api_url:
-                        user, pwd = get_api_basic_auth_keys(host_name)
-                        if user and pwd:
-                            # 取得中メッセージ
-                            self.response_queue.put({"type": "status", "text": "コンテキスト情報を取得中..."})
-                            
-                            api_client = WPDoctorClient(host_config.api_url, username=user, password=pwd)
-                            payloads = {}
-                            
-                            if 'system' in context_types:
-                                payloads['system_info'] = api_client.system_info()
-                                payloads['db_check'] = api_client.db_check()
-                            
-                            if 'plugins' in context_types:
-                                payloads['plugins_analysis'] = api_client.plugins_analysis(status='active', with_updates=True)
-                            
-                            if 'logs' in context_types:
-                                payloads['error_logs'] = api_client.error_logs(lines=log_lines, level=log_level)
-                            
-                            context_text = build_context_text(payloads)
-                        else:
-                            self.response_queue.put({
-                                "type": "error_log", 
-                                "text": f"WordPressホスト '{host_name}' のAPI認証情報が見つかりません。\n"
-                                        f"CLIで以下のコマンドを実行して設定してください:\n"
-                                        f"wp-ai creds set --host {host_name}"
-                            })
+                    self.events.post({"type": "status", "text": "コンテキスト情報を取得中..."})
+                    result = get_context_cache().get(
+                        host_config, requests, self.config.gui.context_max_age,
+                        deadline=self.config.gui.context_deadline,
+                    )
+                    if result is None:
+                        self.events.post({
+                            "type": "error_log", 
+                            "text": f"WordPressホスト '{host_config.name}' のAPI認証情報が見つかりません。\n"
+                                    f"CLIで以下のコマンドを実行して設定してください:\n"
+                                    f"wp-ai creds set --host {host_config.name}"
+                        })
+                    else:
+                        for section, error in result.errors.items():
+                            self.events.post({"type": "error_log", "text": f"コンテキスト取得エラー ({section}): {error}"})
+                        # 変更のあったセクションだけ差し替え（同じ内容を毎ターン重複させない）
+                        self.memory.update_context(build_context_sections(result.payloads))
+                        late = result.pending
+                except TaskCancelled:
+                    raise
                 except Exception as e:
-                    self.response_queue.put({"type": "error_log", "text": f"コンテキスト取得エラー: {e}"})
+                    self.events.post({"type": "error_log", "text": f"コンテキスト取得エラー: {e}"})
 
-            # システムプロンプト構築
-            base_system_prompt = (
-                "You are WP-AI assistant. "
-                "Reply in natural Japanese prose aimed at WordPress site administrators. "
-                "Provide helpful and accurate information about WordPress management and troubleshooting."
-            )
-            
-            if context_text:
-                system_prompt = f"{base_system_prompt}\n\nHere is the current system context:\n{context_text}"
-            else:
-                system_prompt = base_system_prompt
-            
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ]
+            # 要約 + コンテキスト + 予算内の直近ターン + 今回の質問
+            messages = self.memory.build_messages(self.BASE_SYSTEM_PROMPT, prompt)
             
             # ステータス更新
-            self.response_queue.put({"type": "status", "text": "AI応答を生成中..."})
+            self.events.post({"type": "status", "text": "AI応答を生成中..." if not late else
+                              f"AI応答を生成中...（{', '.join(late)} は取得を継続）"})
             
             # ストリーミング実行
-            for chunk in self.client.generate_content_stream(messages):
-                if self._cancel_event.is_set():
-                    break
-                
-                text = chunk.decode("utf-8", errors="ignore")
-                if text:
-                    self.response_queue.put({"type": "chunk", "text": text})
+            reply = self._stream_reply(client, messages, token)
+            
+            # 会話メモリに記録（中断時は途中までの応答）
+            if reply:
+                self.memory.add_exchange(prompt, reply)
+            
+            # 遅れて届いたコンテキストを反映（重大なエラーがあれば補足の応答）
+            if late and reply and not token.cancelled:
+                self._apply_late_context(client, late, token)
             
             # 完了シグナル
-            self.response_queue.put({"type": "done"})
+            self.events.post({"type": "done"})
             
+            # 予算からあふれたターンを低優先度で要約
+            if self.memory.needs_summary():
+                submit(
+                    self.memory.summarize, partial(client.generate_content, call_type="chat_summary"),
+                    name="会話の要約",
+                    priority=PRIORITY_LOW,
+                    key=("chat_summary", id(self.memory)),
+                    owner=self,
+                )
+            
+        except TaskCancelled:
+            # コンテキスト待ちの間に「Stop」された: 入力欄を戻す
+            self.events.post({"type": "done"})
         except Exception as e:
             error_message = f"\n--- ERROR ---\n{str(e)}"
-            self.response_queue.put({"type": "error", "text": error_message})
+            self.events.post({"type": "error", "text": error_message})
     
-    def check_queue(self):
-        """メインスレッドでキューをチェック"""
-        try:
-            while not self.response_queue.empty():
-                message = self.response_queue.get_nowait()
-                
-                if isinstance(message, dict):
-                    mtype = message.get("type")
-                    
-                    if mtype == "chunk":
-                        text = message.get("text", "")
-                        
-                        # 最初のチャンクでフェーズ切替
-                        if self._typing_phase == "thinking":
-                            self._typing_phase = "streaming"
-                            self.status_bar.set_status("出力中…")
-                        
-                        self.add_message("AI", text, is_streaming=True)
-                    
-                    elif mtype == "done":
-                        # ストリーム完了
-                        self._on_stream_complete()
-                    
-                    elif mtype == "status":
-                        self.status_bar.set_status(message.get("text", ""))
-                    
-                    elif mtype == "error_log":
-                        self.add_message("System", message.get("text", ""), is_streaming=False)
-                    
-                    elif mtype == "error":
-                        # エラー
-                        self._on_stream_error(message.get("text", "Unknown error"))
-        
-        finally:
-            self.after(100, self.check_queue)
+    def _stream_reply(self, client: LLMClient, messages: list, token) -> str:
+        """応答をストリーミングで表示し、全文を返す（中断時は途中まで）"""
+        reply = []
+        for chunk in client.generate_content_stream(messages):
+            if token.cancelled:
+                break
+            
+            text = chunk.decode("utf-8", errors="ignore")
+            if text:
+                reply.append(text)
+                self.chat_buffer.write(text)
+        return "".join(reply)
+    
+    def _apply_late_context(self, client: LLMClient, late: dict, token):
+        """期限後に届いたコンテキストを会話メモリに反映（ワーカースレッド）
+        
+        新しく分かった内容に致命的エラーなどが含まれていれば、
+        直前の応答への補足をもう1回生成する。
+        """
+        self.events.post({"type": "status", "text": f"残りのコンテキストを取得中... ({', '.join(late)})"})
+        payloads, errors, _ = collect(late)
+        for section, error in errors.items():
+            self.events.post({"type": "error_log", "text": f"コンテキスト取得エラー ({section}): {error}"})
+        sections = build_context_sections(payloads)
+        changed = self.memory.update_context(sections)
+        notable = significant_sections({name: sections[name] for name in changed})
+        if not notable or not self.config.gui.context_refine:
+            return
+        
+        self.events.post({"type": "status", "text": "追加のコンテキストを反映中..."})
+        self.chat_buffer.write(f"\n\nAI（追加のコンテキスト: {', '.join(notable)}）:\n", ("ai_label",))
+        followup = LATE_CONTEXT_PROMPT.format(sections=", ".join(notable))
+        reply = self._stream_reply(client, self.memory.build_messages(self.BASE_SYSTEM_PROMPT, followup), token)
+        if reply:
+            self.memory.add_exchange(followup, reply)
+    
+    def handle_event(self, message):
+        """ワーカーからのメッセージを処理（Tkスレッド）"""
+        # 先に書かれたチャンクを描画してから制御メッセージを処理
+        self.chat_buffer.flush()
+        
+        if isinstance(message, dict):
+            mtype = message.get("type")
+            
+            if mtype == "done":
+                # ストリーム完了
+                self._on_stream_complete()
+            
+            elif mtype == "status":
+                self.status_bar.set_status(message.get("text", ""))
+            
+            elif mtype == "error_log":
+                self.add_message("System", message.get("text", ""), is_streaming=False)
+            
+            elif mtype == "error":
+                # エラー
+                self._on_stream_error(message.get("text", "Unknown error"))
+    
+    def _on_chunks_rendered(self):
+        """チャンク描画後の処理（最初のチャンクでフェーズ切替）"""
+        if self._typing_phase == "thinking":
+            self._typing_phase = "streaming"
+            self.status_bar.set_status("出力中…")
     
     def _on_stream_complete(self):
         """ストリーム完了時の処理"""
@@ -399,6 +488,7 @@ class ChatWindow(tk.Toplevel):
         # 改行追加
         self.chat_display.config(state="normal")
         self.chat_display.insert(tk.END, "\n\n")
+        self.chat_buffer.trim()
         self.chat_display.config(state="disabled")
         
         # ステータス更新
@@ -460,7 +550,8 @@ class ChatWindow(tk.Toplevel):
     def stop_stream(self):
         """ストリーミング中断"""
         try:
-            self._cancel_event.set()
+            if self._chat_task:
+                self._chat_task.cancel()
             self.stop_button.config(state="disabled")
             
             # ステータス更新
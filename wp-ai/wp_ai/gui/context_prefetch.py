@@ -0,0 +1,308 @@
+"""
+Context prefetch for WP-AI GUI
+
+コンテキスト（system / plugins / logs）の先読みキャッシュ。
+
+ホスト選択の変更や入力欄へのフォーカスで、選択中のコンテキストを
+低優先度のワーカータスクで取得しておく。送信時には、新しい取得結果が
+あればそのまま使い、取得中ならその完了を待つ。足りないセクションだけを
+その場で取得するので、LLMへのリクエストをすぐに始められる。
+
+- セクション（system_info, db_check, plugins_analysis, error_logs）単位で保持
+- キー: (ホスト名, API URL, セクション, パラメータ)
+- 同じセクションの取得は同時に1つだけ（取得中のものには相乗りする）
+- 新しさの上限は [gui].context_max_age 秒（0 で先読みしない）
+- 送信時は [gui].context_deadline 秒まで待ち、遅いセクション（ログ、
+  プラグイン分析など）は取得を続けたまま pending として返す。LLMへの
+  リクエストは届いた分のコンテキストで始め、残りは後から受け取る
+"""
+
+import asyncio
+import threading
+import time
+import tkinter as tk
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from functools import partial
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .worker_pool import submit, current_token, PRIORITY_LOW
+from ..aio import get_loop
+from ..api import AsyncWPDoctorClient
+from ..auth import get_api_basic_auth_keys
+from ..http_client import shared_client
+
+# コンテキスト種別 -> 取得するセクション
+CONTEXT_SECTIONS = {
+    'system': ('system_info', 'db_check'),
+    'plugins': ('plugins_analysis',),
+    'logs': ('error_logs',),
+}
+
+PREFETCH_DELAY_MS = 300  # 連続した操作（ログ行数の入力など）をまとめる待ち時間
+WAIT_SLICE = 0.2  # 取得中のセクションを待つ間、キャンセルを確認する間隔（秒）
+
+_MISSING = object()
+
+Request = Tuple[str, tuple]  # (セクション, パラメータ)
+
+
+def context_requests(context_types: List[str], log_lines: Optional[int] = None,
+                     log_level: Optional[str] = None) -> List[Request]:
+    """選択されたコンテキスト種別を (セクション, パラメータ) のリストに変換"""
+    requests = []
+    for ctype in context_types or []:
+        if ctype == 'logs' and not (log_lines and log_level):
+            continue
+        for section in CONTEXT_SECTIONS.get(ctype, ()):
+            params = (log_lines, log_level) if section == 'error_logs' else ()
+            requests.append((section, params))
+    return requests
+
+
+async def _fetch_section(client: AsyncWPDoctorClient, section: str, params: tuple):
+    if section == 'system_info':
+        return await client.system_info()
+    if section == 'db_check':
+        return await client.db_check()
+    if section == 'plugins_analysis':
+        return await client.plugins_analysis(status='active', with_updates=True)
+    if section == 'error_logs':
+        lines, level = params
+        return await client.error_logs(lines=lines, level=level)
+    raise ValueError(f"Unknown context section: {section}")
+
+
+class ContextResult(NamedTuple):
+    """送信時のコンテキスト取得結果"""
+    payloads: Dict[str, Any]  # セクション名 -> APIの応答
+    errors: Dict[str, BaseException]  # 取得に失敗したセクション
+    reused: int  # 先読み（または取得中の結果）から使ったセクション数
+    pending: Dict[str, Future]  # 期限までに届かず、取得を続けているセクション
+
+
+def collect(futures: Dict[str, Future], deadline: Optional[float] = None
+            ) -> Tuple[Dict[str, Any], Dict[str, BaseException], Dict[str, Future]]:
+    """セクションの取得結果を待つ（実行中タスクのキャンセルで TaskCancelled）
+
+    戻り値は (取得できた分, 失敗した分, deadline 秒までに終わらなかった分)。
+    """
+    end = None if not deadline or deadline <= 0 else time.monotonic() + deadline
+    payloads: Dict[str, Any] = {}
+    errors: Dict[str, BaseException] = {}
+    pending: Dict[str, Future] = {}
+    token = current_token()
+    for section, future in futures.items():
+        while True:
+            timeout = WAIT_SLICE if end is None else min(WAIT_SLICE, end - time.monotonic())
+            if timeout <= 0 and not future.done():
+                pending[section] = future
+                break
+            try:
+                payloads[section] = future.result(max(timeout, 0))
+                break
+            except FutureTimeout:
+                token.raise_if_cancelled()
+            except Exception as e:
+                errors[section] = e
+                break
+    return payloads, errors, pending
+
+
+class ContextCache:
+    """ホストごとのコンテキストのキャッシュ（スレッドセーフ）"""
+
+    def __init__(self):
+        self._entries: Dict[tuple, Tuple[float, Any]] = {}
+        self._inflight: Dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(host_config, request: Request) -> tuple:
+        section, params = request
+        return (host_config.name, host_config.api_url, section, params)
+
+    def _fresh(self, key: tuple, max_age: float):
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] <= max_age:
+            return entry[1]
+        return _MISSING
+
+    # ===== 先読み =====
+
+    def prefetch(self, host_config, requests: List[Request], max_age: float, owner=None) -> bool:
+        """古い/未取得のセクションがあれば低優先度で取得を投入する
+
+        取得中または十分新しいセクションしかなければ何もしない。
+        """
+        if not host_config or not host_config.api_url or not requests or max_age <= 0:
+            return False
+        with self._lock:
+            stale = [
+                r for r in requests
+                if self._key(host_config, r) not in self._inflight
+                and self._fresh(self._key(host_config, r), max_age) is _MISSING
+            ]
+        if not stale:
+            return False
+        submit(
+            self._prefetch_task, host_config, stale, max_age,
+            name=f"コンテキスト先読み ({host_config.name})",
+            priority=PRIORITY_LOW,
+            key=("context_prefetch", host_config.name, host_config.api_url, tuple(stale)),
+            owner=owner,
+        )
+        return True
+
+    def _prefetch_task(self, host_config, requests: List[Request], max_age: float):
+        # 待機中に送信側が取得した分は除く
+        with self._lock:
+            requests = [r for r in requests if self._fresh(self._key(host_config, r), max_age) is _MISSING]
+        if not requests:
+            return
+        user, pwd = get_api_basic_auth_keys(host_config.name)
+        if not (user and pwd):
+            return
+        futures, _ = self._start(host_config, user, pwd, requests)
+        # 取得が終わるまでタスクとして残す（タスクモニターに表示される）
+        collect(futures)
+
+    # ===== 取得 =====
+
+    def _start(self, host_config, user: str, pwd: str, requests: List[Request]) -> Tuple[Dict[str, Future], int]:
+        """各セクションの取得を aio ループで開始する（待たない）
+
+        取得中のセクションには相乗りする。戻り値は (セクション名 -> Future, 相乗りした数)。
+        """
+        futures: Dict[str, Future] = {}
+        started: List[Tuple[tuple, Future]] = []
+        loop = get_loop()
+        with self._lock:
+            for request in requests:
+                key = self._key(host_config, request)
+                future = self._inflight.get(key)
+                if future is None:
+                    future = asyncio.run_coroutine_threadsafe(self._fetch(host_config, user, pwd, request), loop)
+                    self._inflight[key] = future
+                    started.append((key, future))
+                futures[request[0]] = future
+        # 完了済みならその場で呼ばれるので、ロックの外で登録する
+        now = time.monotonic()
+        for key, future in started:
+            future.add_done_callback(partial(self._store, key, now))
+        return futures, len(futures) - len(started)
+
+    @staticmethod
+    async def _fetch(host_config, user: str, pwd: str, request: Request):
+        client = AsyncWPDoctorClient(host_config.api_url, username=user, password=pwd, http=shared_client())
+        return await _fetch_section(client, *request)
+
+    def _store(self, key: tuple, started: float, future: Future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if not future.cancelled() and future.exception() is None:
+                self._entries[key] = (started, future.result())
+
+    def get(self, host_config, requests: List[Request], max_age: float,
+            deadline: Optional[float] = None) -> Optional[ContextResult]:
+        """送信時のコンテキスト取得（ワーカースレッドで呼ぶ）
+
+        max_age 秒以内の取得結果と取得中の結果を使い、足りない分だけ取得する。
+        deadline 秒で待つのをやめ、間に合わなかったセクションは取得を続けたまま
+        pending として返す（collect() で後から受け取れる）。
+        API認証情報がなければ None。
+        """
+        if not requests:
+            return ContextResult({}, {}, 0, {})
+        user, pwd = get_api_basic_auth_keys(host_config.name)
+        if not (user and pwd):
+            return None
+
+        payloads: Dict[str, Any] = {}
+        missing: List[Request] = []
+        with self._lock:
+            for request in requests:
+                value = self._fresh(self._key(host_config, request), max_age)
+                if value is _MISSING:
+                    missing.append(request)
+                else:
+                    payloads[request[0]] = value
+
+        futures, joined = self._start(host_config, user, pwd, missing)
+        fetched, errors, pending = collect(futures, deadline)
+        payloads.update(fetched)
+        return ContextResult(payloads, errors, len(payloads) - len(fetched) + joined, pending)
+
+    def invalidate(self, host_name: Optional[str] = None):
+        """キャッシュを破棄（host_name 指定時はそのホストの分だけ）"""
+        with self._lock:
+            if host_name is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == host_name]:
+                    del self._entries[key]
+
+
+_cache: Optional[ContextCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_context_cache() -> ContextCache:
+    """GUI全体で共有するコンテキストキャッシュ"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ContextCache()
+        return _cache
+
+
+class ContextPrefetcher:
+    """ウィンドウ用の先読みスケジューラ（Tkスレッドで使う）
+
+    入力欄へのフォーカス、ホスト変更（schedule() を呼ぶ）、コンテキスト
+    設定の変更で先読みする。入力欄にフォーカスがある間は、期限ごとに
+    取り直して新しい状態を保つ。
+    """
+
+    def __init__(self, window, get_host: Callable[[], Any], context_panel, input_widget):
+        self.window = window
+        self.get_host = get_host
+        self.context_panel = context_panel
+        self.input_widget = input_widget
+        self._after_id = None
+        input_widget.bind("<FocusIn>", lambda e: self.schedule(), add="+")
+        context_panel.on_change(self.schedule)
+
+    def max_age(self) -> float:
+        return self.window.config.gui.context_max_age
+
+    def requests(self) -> List[Request]:
+        log_lines, log_level = self.context_panel.get_log_params()
+        return context_requests(self.context_panel.get_context_types(), log_lines, log_level)
+
+    def schedule(self, delay_ms: int = PREFETCH_DELAY_MS):
+        """少し待ってから先読み（続けて呼ばれたら最後の1回だけ）"""
+        if self.max_age() <= 0:
+            return
+        try:
+            if self._after_id is not None:
+                self.window.after_cancel(self._after_id)
+            self._after_id = self.window.after(delay_ms, self._run)
+        except tk.TclError:
+            # ウィンドウが破棄済み
+            self._after_id = None
+
+    def _run(self):
+        self._after_id = None
+        host = self.get_host()
+        if host is None:
+            return
+        get_context_cache().prefetch(host, self.requests(), self.max_age(), owner=self.window)
+        # 入力中は期限切れの少し前に取り直す
+        try:
+            focused = self.window.focus_get() is self.input_widget
+        except Exception:
+            focused = False
+        if focused:
+            self.schedule(max(1000, int(self.max_age() * 1000 * 0.9)))
+
@@ -1,18 +1,27 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import re
-import threading
-from typing import List, Optional
+import os
+import json
+import time
+import hashlib
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
-from ..config import load_config, CONFIG_FILE, ensure_config_dir, write_default_config, set_api_key, get_api_key
+from .event_bus import subscribe
+from .worker_pool import submit
+from ..aio import run_sync
+from ..http_client import shared_client
+from ..openai_compat import AsyncOpenAICompatClient
+from ..config import load_config, CONFIG_DIR, CONFIG_FILE, ensure_config_dir, write_default_config, set_api_key, get_api_key
 
 
-def fetch_available_models(provider: str, api_key: Optional[str] = None) -> List[str]:
+def fetch_available_models(provider: str, api_key: Optional[str] = None, base_url: Optional[str] = None) -> List[str]:
     """利用可能なモデルのリストを取得
     
     Args:
         provider: 'gemini' or 'openai'
         api_key: APIキー（Noneの場合は設定から取得）
+        base_url: OpenAI互換サーバーのURL（openai のみ。ローカルサーバーならキー不要）
         
     Returns:
         モデル名のリスト
@@ -20,7 +29,7 @@ def fetch_available_models(provider: str, api_key: Optional[str] = None) -> List
     if api_key is None:
         api_key = get_api_key(provider)
         
-    if not api_key:
+    if not api_key and not (provider == "openai" and base_url):
         return []
         
     try:
@@ -47,14 +56,9 @@ def fetch_available_models(provider: str, api_key: Optional[str] = None) -> List
             return model_names
             
         elif provider == "openai":
-            # OpenAI APIを使用してモデルリストを取得
-            # TODO: OpenAI実装
-            return [
-                "gpt-4",
-                "gpt-4-turbo-preview",
-                "gpt-3.5-turbo",
-                "gpt-3.5-turbo-16k"
-            ]
+            # OpenAI互換APIの /models から取得
+            client = AsyncOpenAICompatClient(base_url, api_key, http=shared_client())
+            return run_sync(client.list_models())
         else:
             return []
             
@@ -63,11 +67,67 @@ def fetch_available_models(provider: str, api_key: Optional[str] = None) -> List
         return []
 
 
+def _key_fingerprint(api_key: Optional[str]) -> str:
+    """APIキーの識別子（キーそのものは保持しない）"""
+    if not api_key:
+        return ""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+# モデル一覧のディスクキャッシュ（プロバイダー + APIキーの識別子ごと）
+MODEL_CACHE_FILE = CONFIG_DIR / "model_cache.json"
+MODEL_CACHE_TTL = 24 * 60 * 60  # 秒。これより古ければバックグラウンドで再取得
+
+
+def _read_model_cache() -> Dict[str, dict]:
+    try:
+        with open(MODEL_CACHE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _cache_key(provider: str, api_key: Optional[str], base_url: Optional[str]) -> str:
+    key = f"{provider}:{_key_fingerprint(api_key)}"
+    return f"{key}@{base_url}" if base_url else key
+
+
+def load_cached_models(provider: str, api_key: Optional[str], base_url: Optional[str] = None) -> Tuple[List[str], Optional[float]]:
+    """キャッシュ済みのモデル一覧と、その経過秒数（なければ [], None）"""
+    entry = _read_model_cache().get(_cache_key(provider, api_key, base_url))
+    if not entry or not isinstance(entry.get("models"), list):
+        return [], None
+    return entry["models"], max(0.0, time.time() - entry.get("fetched_at", 0))
+
+
+def save_cached_models(provider: str, api_key: Optional[str], models: List[str], base_url: Optional[str] = None):
+    """モデル一覧をキャッシュに保存（一時ファイル経由で置き換える）"""
+    cache = _read_model_cache()
+    cache[_cache_key(provider, api_key, base_url)] = {"models": models, "fetched_at": time.time()}
+    try:
+        ensure_config_dir()
+        tmp_path = MODEL_CACHE_FILE.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_path, MODEL_CACHE_FILE)
+    except OSError as e:
+        print(f"モデルキャッシュの保存に失敗: {e}")
+
+
+def fetch_and_cache_models(provider: str, api_key: Optional[str], base_url: Optional[str] = None) -> List[str]:
+    """モデル一覧を取得してキャッシュを更新（取得できなかった場合は更新しない）"""
+    models = fetch_available_models(provider, api_key, base_url)
+    if models:
+        save_cached_models(provider, api_key, models, base_url)
+    return models
+
+
 class LLMSettingsDialog(tk.Toplevel):
     def __init__(self, parent):
         super().__init__(parent)
         self.title("LLM Settings")
-        self.geometry("450x350")
+        self.geometry("450x390")
         self.resizable(False, False)
         self.transient(parent)
         self.grab_set()
@@ -77,6 +137,8 @@ class LLMSettingsDialog(tk.Toplevel):
         self.saved_model = None  # 保存されたモデルを記憶
         self.initial_load = True  # 初回読み込みフラグ
         self._refresh_in_progress = False  # リフレッシュ中フラグ
+        self._models_provider = None  # available_models のプロバイダー
+        self.events = subscribe(self, self._on_event)
         
         self.setup_ui()
         self.load_settings()
@@ -117,9 +179,14 @@ class LLMSettingsDialog(tk.Toplevel):
         self.api_key_entry = ttk.Entry(main_frame, textvariable=self.api_key_var, show="*")
         self.api_key_entry.grid(row=3, column=1, sticky=tk.EW, pady=5, columnspan=2)
         
+        # Base URL（openai: OpenAI互換サーバー。空欄なら api.openai.com）
+        ttk.Label(main_frame, text="Base URL:").grid(row=4, column=0, sticky=tk.W, pady=5)
+        self.base_url_var = tk.StringVar()
+        ttk.Entry(main_frame, textvariable=self.base_url_var).grid(row=4, column=1, sticky=tk.EW, pady=5, columnspan=2)
+        
         # Buttons
         btn_frame = ttk.Frame(main_frame)
-        btn_frame.grid(row=4, column=0, columnspan=3, pady=20)
+        btn_frame.grid(row=5, column=0, columnspan=3, pady=20)
         
         ttk.Button(btn_frame, text="Save", command=self.save_settings).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="Cancel", command=self.destroy).pack(side=tk.LEFT, padx=5)
@@ -130,18 +197,21 @@ class LLMSettingsDialog(tk.Toplevel):
         llm_config = self.config.llm
         self.provider_var.set(llm_config.provider)
         self.model_var.set(llm_config.model)
+        self.base_url_var.set(llm_config.base_url or "")
         self.saved_model = llm_config.model  # 保存されたモデルを記憶
         # API key is in keyring, not config.toml
         # We leave it empty by default for security, or could try to load it?
         # Usually better to leave empty and only update if user enters something.
         
         # 初期モデルリストを読み込み（遅延実行で二重読み込みを防ぐ）
-        self.after(200, self.refresh_models)
+        # キャッシュが新しければネットワークには出ない
+        self.after(200, lambda: self.refresh_models(force=False))
         
     def save_settings(self):
         provider = self.provider_var.get().strip()
         model = self.model_var.get().strip()
         api_key = self.api_key_var.get().strip()
+        base_url = self.base_url_var.get().strip()
         
         if not provider or not model:
             messagebox.showerror("Error", "Provider and Model are required.")
@@ -184,6 +254,13 @@ class LLMSettingsDialog(tk.Toplevel):
             model_pattern = r'model\s*=\s*".*"'
             if re.search(model_pattern, text):
                 text = re.sub(model_pattern, f'model = "{model}"', text)
+            
+            # Update base_url（無ければ model の行の後に追加）
+            base_url_pattern = r'base_url\s*=\s*".*"'
+            if re.search(base_url_pattern, text):
+                text = re.sub(base_url_pattern, f'base_url = "{base_url}"', text)
+            elif base_url:
+                text = re.sub(r'(model\s*=\s*".*")', lambda m: f'{m.group(1)}\nbase_url = "{base_url}"', text, count=1)
                 
             config_path.write_text(text, encoding="utf-8")
             
@@ -195,10 +272,14 @@ class LLMSettingsDialog(tk.Toplevel):
     
     def on_provider_change(self, event=None):
         """プロバイダー変更時にモデルリストを更新"""
-        self.refresh_models()
+        self.refresh_models(force=False)
     
-    def refresh_models(self):
-        """モデルリストを更新"""
+    def refresh_models(self, force: bool = True):
+        """モデルリストを更新
+        
+        キャッシュがあれば即座に表示し、キャッシュが古い（または force）ときだけ
+        バックグラウンドで再取得して新しいモデルを追加する。
+        """
         # 既にリフレッシュ中の場合はスキップ
         if self._refresh_in_progress:
             return
@@ -207,42 +288,73 @@ class LLMSettingsDialog(tk.Toplevel):
         if not provider:
             return
         
+        # APIキーを取得（入力されている場合はそれを使用）
+        api_key = self.api_key_var.get().strip()
+        if not api_key:
+            api_key = get_api_key(provider)
+        base_url = self.base_url_var.get().strip() if provider == "openai" else ""
+        base_url = base_url or None
+        
+        cached, age = load_cached_models(provider, api_key, base_url)
+        if cached:
+            self._update_model_list(cached, provider)
+            if not force and age < MODEL_CACHE_TTL:
+                self.status_var.set(f"{len(cached)}個のモデルが利用可能（キャッシュ）")
+                return
+        
         self._refresh_in_progress = True
         
-        self.status_var.set("モデルリストを取得中...")
+        self.status_var.set("モデルリストを更新中..." if cached else "モデルリストを取得中...")
         self.refresh_btn.config(state="disabled")
         
-        # バックグラウンドスレッドでモデルリストを取得
-        thread = threading.Thread(
-            target=self._fetch_models_background,
-            args=(provider,),
-            daemon=True
+        # 共有ワーカープールで取得（同じプロバイダー・キーの取得中なら結果を共有）
+        submit(
+            fetch_and_cache_models,
+            provider, api_key, base_url,
+            name=f"モデル一覧の取得 ({provider})",
+            key=("models", provider, _key_fingerprint(api_key), base_url),
+            owner=self,
+            on_done=lambda models: self.events.post(("models", provider, models)),
+            on_error=lambda e: self.events.post(("error", provider, str(e))),
         )
-        thread.start()
     
-    def _fetch_models_background(self, provider: str):
-        """バックグラウンドでモデルリストを取得"""
-        try:
-            # APIキーを取得（入力されている場合はそれを使用）
-            api_key = self.api_key_var.get().strip()
-            if not api_key:
-                api_key = get_api_key(provider)
-            
-            models = fetch_available_models(provider, api_key)
-            
-            # メインスレッドでUIを更新
-            self.after(0, self._update_model_list, models)
-            
-        except Exception as e:
-            self.after(0, self._on_fetch_error, str(e))
+    def _on_event(self, message):
+        """ワーカーからの結果を反映（Tkスレッド）"""
+        kind, provider, payload = message
+        self.refresh_btn.config(state="normal")
+        self._refresh_in_progress = False  # リフレッシュ完了
+        if provider != self.provider_var.get():
+            # 取得中にプロバイダーが変わった: 現在のプロバイダーで読み直す
+            self.refresh_models(force=False)
+            return
+        if kind == "models":
+            self._update_model_list(payload, provider, fetched=True)
+        else:
+            self._on_fetch_error(payload)
     
-    def _update_model_list(self, models: List[str]):
-        """モデルリストを更新（メインスレッド）"""
+    def _update_model_list(self, models: List[str], provider: str, fetched: bool = False):
+        """モデルリストを更新（メインスレッド）
+        
+        取得結果は表示中の一覧（キャッシュ）に追加する形でマージする。
+        """
+        if fetched and self._models_provider == provider and self.available_models:
+            if not models:
+                # 取得に失敗した（キーの誤り等）: キャッシュの一覧を残す
+                self.status_var.set(f"{len(self.available_models)}個のモデルが利用可能（更新に失敗、キャッシュを表示中）")
+                return
+            added = [m for m in models if m not in self.available_models]
+            models = sorted(set(self.available_models) | set(models))
+        else:
+            added = []
+        self._models_provider = provider
         self.available_models = models
         
         if models:
             self.model_combo['values'] = models
-            self.status_var.set(f"{len(models)}個のモデルが利用可能")
+            status = f"{len(models)}個のモデルが利用可能"
+            if added:
+                status += f"（新規 {len(added)}個）"
+            self.status_var.set(status)
             
             # 現在のモデル値を保存
             current_model = self.model_var.get()
@@ -267,14 +379,10 @@ class LLMSettingsDialog(tk.Toplevel):
         else:
             self.model_combo['values'] = []
             self.status_var.set("モデルが見つかりません（APIキーを確認してください）")
-        
-        self.refresh_btn.config(state="normal")
-        self._refresh_in_progress = False  # リフレッシュ完了
     
     def _on_fetch_error(self, error_msg: str):
         """モデル取得エラー時の処理"""
         self.status_var.set(f"エラー: {error_msg}")
-        self.refresh_btn.config(state="normal")
 
 
 class HostManagerDialog(tk.Toplevel):
@@ -0,0 +1,137 @@
+"""
+GUI event bus for WP-AI
+
+ワーカースレッドからTkスレッドへメッセージを渡す共有バス。
+after() による定期ポーリングの代わりに、投稿があったときだけ
+仮想イベントでTkのイベントループを起こす。
+"""
+
+import tkinter as tk
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+
+class Channel:
+    """ウィンドウ単位の購読チャネル
+
+    post() はどのスレッドからでも呼べる。購読元のウィジェットが破棄されると
+    自動的に閉じ、以降の投稿は捨てられる。
+    """
+
+    def __init__(self, bus: "EventBus", key: int, handler: Callable[[Any], None]):
+        self.bus = bus
+        self.key = key
+        self.handler = handler
+        self.closed = False
+
+    def post(self, message: Any = None):
+        """メッセージを投稿（ハンドラはTkスレッドで呼ばれる）"""
+        if not self.closed:
+            self.bus.post(self.key, message)
+
+    def close(self):
+        """購読を解除"""
+        self.closed = True
+        self.bus.unsubscribe(self.key)
+
+
+class EventBus:
+    """Tkルートごとに1つ作られるイベントバス"""
+
+    VIRTUAL_EVENT = "<<WPAIEventBus>>"
+    FALLBACK_POLL_MS = 50
+
+    def __init__(self, root: tk.Misc):
+        self.root = root
+        self._pending = deque()
+        self._channels: Dict[int, Channel] = {}
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self._wake_pending = threading.Event()
+        self._polling = False
+        root.bind(self.VIRTUAL_EVENT, self._dispatch, add="+")
+
+    def subscribe(self, widget: tk.Misc, handler: Callable[[Any], None]) -> Channel:
+        """widget が生きている間 handler にメッセージを配送するチャネルを作成"""
+        with self._lock:
+            self._next_key += 1
+            channel = Channel(self, self._next_key, handler)
+            self._channels[channel.key] = channel
+
+        def on_destroy(event, channel=channel):
+            if event.widget is widget:
+                channel.close()
+
+        widget.bind("<Destroy>", on_destroy, add="+")
+        return channel
+
+    def unsubscribe(self, key: int):
+        with self._lock:
+            self._channels.pop(key, None)
+
+    def post(self, key: int, message: Any):
+        self._pending.append((key, message))
+        # 起床要求は1回にまとめる（Tkスレッドが取り出すまで再送しない）
+        if not self._wake_pending.is_set():
+            self._wake_pending.set()
+            self._wake()
+
+    def _wake(self):
+        if threading.current_thread() is threading.main_thread():
+            try:
+                self.root.after_idle(self._dispatch)
+            except tk.TclError:
+                pass
+            return
+        try:
+            self.root.event_generate(self.VIRTUAL_EVENT, when="tail")
+        except (RuntimeError, tk.TclError):
+            # スレッド非対応のTcl等: ポーリングに切り替える
+            self._start_polling()
+
+    def _start_polling(self):
+        if self._polling:
+            return
+        self._polling = True
+        try:
+            self.root.after(self.FALLBACK_POLL_MS, self._poll)
+        except (RuntimeError, tk.TclError):
+            self._polling = False
+
+    def _poll(self):
+        self._dispatch()
+        try:
+            self.root.after(self.FALLBACK_POLL_MS, self._poll)
+        except tk.TclError:
+            self._polling = False
+
+    def _dispatch(self, event=None):
+        """溜まったメッセージを配送（Tkスレッド）"""
+        # 先にフラグを下ろす: 取り出し中の投稿は新たな起床要求になる
+        self._wake_pending.clear()
+        while self._pending:
+            key, message = self._pending.popleft()
+            with self._lock:
+                channel = self._channels.get(key)
+            if channel is None or channel.closed:
+                continue
+            try:
+                channel.handler(message)
+            except Exception as e:
+                print(f"イベント処理エラー: {e}")
+
+
+def get_event_bus(widget: tk.Misc) -> EventBus:
+    """widget が属するTkルートの共有イベントバスを取得"""
+    root = widget._root()
+    bus: Optional[EventBus] = getattr(root, "_wpai_event_bus", None)
+    if bus is None:
+        bus = EventBus(root)
+        root._wpai_event_bus = bus
+    return bus
+
+
+def subscribe(widget: tk.Misc, handler: Callable[[Any], None]) -> Channel:
+    """get_event_bus(widget).subscribe(widget, handler) の省略形"""
+    return get_event_bus(widget).subscribe(widget, handler)
@@ -7,22 +7,155 @@ WP-AI History Window
 
 import tkinter as tk
 from tkinter import scrolledtext, messagebox, ttk
+import threading
+import queue
 import json
-from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import Any, Callable, Dict, List, Optional
 from datetime import datetime
 
 from .utils import setup_encoding
+from .event_bus import subscribe
 
-from ..config import HISTORY_FILE
+from ..history import get_history_store, entry_status, entry_search_fields
+
+
+STATUS_LABELS = {"success": "成功", "failed": "失敗", "unknown": "不明"}
+
+
+def _make_row(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Treeview表示用の行データを作成（ワーカースレッドで実行）"""
+    timestamp = entry.get("ts", "")
+    # ISO形式をローカル時刻に変換
+    try:
+        dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+        timestamp_str = dt.strftime("%Y-%m-%d %H:%M:%S")
+    except Exception:
+        timestamp_str = timestamp
+
+    status = STATUS_LABELS[entry_status(entry)]
+    host = entry.get("host", "N/A")
+    instruction = entry.get("instruction", "N/A")
+    return {
+        "entry": entry,
+        "values": (timestamp_str, host, instruction, status),
+        "status": status,
+        "host_key": (entry.get("host") or "").lower(),
+        "search_key": "\n".join(entry_search_fields(entry).values()).lower(),
+    }
+
+
+class HistoryLoader(threading.Thread):
+    """履歴の読み込みとフィルタを行うワーカースレッド
+
+    新しい順にページ単位で読み込み、現在のフィルタに一致した行を
+    post で窓へ送る。フィルタ変更は全件を再評価して "reset" を送る。
+    全文検索インデックスがあるストアでは、検索語を関連度順の検索に回す。
+    """
+
+    PAGE_SIZE = 500
+    SEARCH_LIMIT = 1000
+
+    def __init__(self, post: Callable[[Dict[str, Any]], None]):
+        super().__init__(daemon=True)
+        self.post = post
+        self.commands: "queue.Queue" = queue.Queue()
+        self.rows: List[Dict[str, Any]] = []
+        self.host_filter = ""
+        self.search_term = ""
+        self.generation = 0
+        self.ranked = False
+        self.store = None
+        self.total: Optional[int] = None  # 全件数（インデックスで数えられるストアのみ）
+
+    def set_filter(self, host_filter: str, search_term: str, generation: int):
+        self.commands.put(("filter", host_filter, search_term, generation))
+
+    def stop(self):
+        self.commands.put(("stop",))
+
+    def _match(self, row: Dict[str, Any]) -> bool:
+        if self.host_filter and self.host_filter not in row["host_key"]:
+            return False
+        if self.search_term and not all(t in row["search_key"] for t in self.search_term.split()):
+            return False
+        return True
+
+    def _handle(self, command) -> bool:
+        if command[0] == "stop":
+            return False
+        _, self.host_filter, self.search_term, self.generation = command
+        self.ranked = bool(self.search_term.strip()) and self.store.supports_search
+        if self.ranked:
+            # インデックス検索（関連度順）。ホストは部分一致で後から絞る
+            try:
+                entries = self.store.search(self.search_term, limit=self.SEARCH_LIMIT)
+            except Exception as e:
+                self.post({"type": "error", "loader": self, "message": str(e)})
+                entries = []
+            matched = [row for row in map(_make_row, entries)
+                       if not self.host_filter or self.host_filter in row["host_key"]]
+        else:
+            matched = [row for row in self.rows if self._match(row)]
+        self.post({"type": "reset", "loader": self, "generation": self.generation, "rows": matched})
+        return True
+
+    def run(self):
+        try:
+            self.store = get_history_store()
+            entries = self.store.iter_recent(page_size=self.PAGE_SIZE)
+            # SQLite では件数をインデックスから数えられるので、読み込み完了を待たずに表示できる
+            count = getattr(self.store, "count", None)
+            self.total = count() if count else None
+        except Exception as e:
+            self.post({"type": "error", "loader": self, "message": str(e)})
+            return
+
+        loading = True
+        while True:
+            # 溜まっているコマンドを処理（読み込み完了後はブロックして待つ）
+            try:
+                while True:
+                    command = self.commands.get(block=not loading)
+                    if not self._handle(command):
+                        return
+            except queue.Empty:
+                pass
+
+            page = []
+            try:
+                for entry in entries:
+                    page.append(_make_row(entry))
+                    if len(page) >= self.PAGE_SIZE:
+                        break
+            except Exception as e:
+                self.post({"type": "error", "loader": self, "message": str(e)})
+                loading = False
+                continue
+
+            if len(page) < self.PAGE_SIZE:
+                loading = False
+            self.rows.extend(page)
+            self.post({
+                "type": "rows",
+                "loader": self,
+                "generation": self.generation,
+                # 検索結果表示中は読み込み進捗のみ通知
+                "rows": [] if self.ranked else [row for row in page if self._match(row)],
+                "loaded": len(self.rows),
+                "total": self.total,
+                "done": not loading,
+            })
 
 
 class HistoryWindow(tk.Toplevel):
     """実行履歴ウィンドウ
     
     履歴の表示、検索、再実行
+    行はスクロールに合わせて少しずつ描画する
     """
     
+    PREFETCH_ROWS = 100
+    
     def __init__(self, parent):
         super().__init__(parent)
         
@@ -34,11 +167,19 @@ class HistoryWindow(tk.Toplevel):
         self.transient(parent)
         
         self.parent = parent
-        self.history_data: List[Dict[str, Any]] = []
         self.filtered_data: List[Dict[str, Any]] = []
+        self.loaded_count = 0
+        self.total_count: Optional[int] = None
+        self.loading_done = False
+        self._rendered = 0
+        self._generation = 0
+        self._filter_after_id = None
+        self._loader: Optional[HistoryLoader] = None
+        self.events = subscribe(self, self._on_loader_event)
         
         # UI構築
         self._build_ui()
+        self.bind("<Destroy>", self._on_destroy)
         
         # 履歴読み込み
         self.load_history()
@@ -65,7 +206,7 @@ class HistoryWindow(tk.Toplevel):
             width=15
         )
         self.host_filter.pack(side=tk.LEFT, padx=5)
-        self.host_filter.bind("<KeyRelease>", lambda e: self.apply_filters())
+        self.host_filter.bind("<KeyRelease>", lambda e: self.schedule_filters())
         
         ttk.Label(toolbar_frame, text="検索:").pack(side=tk.LEFT, padx=(20, 5))
         self.search_var = tk.StringVar()
@@ -75,7 +216,7 @@ class HistoryWindow(tk.Toplevel):
             width=30
         )
         self.search_entry.pack(side=tk.LEFT, padx=5)
-        self.search_entry.bind("<KeyRelease>", lambda e: self.apply_filters())
+        self.search_entry.bind("<KeyRelease>", lambda e: self.schedule_filters())
         
         ttk.Button(
             toolbar_frame,
@@ -106,15 +247,19 @@ class HistoryWindow(tk.Toplevel):
         self.tree.column("status", width=80)
         
         # スクロールバー
-        tree_scroll = ttk.Scrollbar(left_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=tree_scroll.set)
+        self.tree_scroll = ttk.Scrollbar(left_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
         
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        tree_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree_scroll.pack(side=tk.RIGHT, fill=tk.Y)
         
         # 選択イベント
         self.tree.bind("<<TreeviewSelect>>", self.on_select)
         
+        # タグに色を設定
+        self.tree.tag_configure("成功", foreground="#4CAF50")
+        self.tree.tag_configure("失敗", foreground="#F44336")
+        
         # 右側: 詳細表示
         right_frame = ttk.Frame(paned_window)
         paned_window.add(right_frame, weight=1)
@@ -154,94 +299,112 @@ class HistoryWindow(tk.Toplevel):
         ttk.Label(button_frame, textvariable=self.status_var).pack(side=tk.LEFT, padx=20)
         
     def load_history(self):
-        """履歴ファイルを読み込み"""
-        self.history_data = []
+        """履歴をバックグラウンドで読み込み（新しい順にページ単位）"""
+        if self._loader:
+            self._loader.stop()
+        
+        self.filtered_data = []
+        self.loaded_count = 0
+        self.total_count = None
+        self.loading_done = False
+        self._clear_tree()
+        self.status_var.set("読み込み中...")
+        
+        self._generation += 1
+        self._loader = HistoryLoader(self.events.post)
+        self._loader.set_filter(*self._current_filters(), self._generation)
+        self._loader.start()
+        
+    def _current_filters(self):
+        return self.host_filter_var.get().lower(), self.search_var.get().lower()
+        
+    def schedule_filters(self):
+        """キー入力ごとのフィルタをまとめる（デバウンス）"""
+        if self._filter_after_id:
+            self.after_cancel(self._filter_after_id)
+        self._filter_after_id = self.after(250, self.apply_filters)
         
-        if not HISTORY_FILE.exists():
-            self.status_var.set("履歴ファイルが見つかりません")
-            return
-            
-        try:
-            with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        entry = json.loads(line)
-                        self.history_data.append(entry)
-            
-            # 新しい順にソート
-            self.history_data.sort(key=lambda x: x.get("ts", ""), reverse=True)
-            
-            self.status_var.set(f"履歴: {len(self.history_data)}件")
-            self.apply_filters()
-            
-        except Exception as e:
-            messagebox.showerror("エラー", f"履歴読み込みエラー: {str(e)}")
-            self.status_var.set("エラー")
-            
     def apply_filters(self):
-        """フィルタを適用"""
-        host_filter = self.host_filter_var.get().lower()
-        search_term = self.search_var.get().lower()
+        """フィルタを適用（評価はワーカースレッドで行う）"""
+        self._filter_after_id = None
+        if not self._loader:
+            return
+        self._generation += 1
+        self._loader.set_filter(*self._current_filters(), self._generation)
         
-        self.filtered_data = []
+    def _on_loader_event(self, msg):
+        """ワーカーからの結果を反映（Tkスレッド）"""
+        # 「更新」で置き換えられたローダーの結果は捨てる
+        if msg["loader"] is not self._loader:
+            return
         
-        for entry in self.history_data:
-            # ホストフィルタ
-            if host_filter and host_filter not in entry.get("host", "").lower():
-                continue
-                
-            # 検索フィルタ
-            if search_term:
-                instruction = entry.get("instruction", "").lower()
-                if search_term not in instruction:
-                    continue
-            
-            self.filtered_data.append(entry)
+        if msg["type"] == "error":
+            messagebox.showerror("エラー", f"履歴読み込みエラー: {msg['message']}")
+            self.status_var.set("エラー")
+            return
         
-        self.update_tree()
+        # 古いフィルタの結果は捨てる
+        if msg["generation"] != self._generation:
+            if msg["type"] == "rows":
+                self.loaded_count = msg["loaded"]
+                self.total_count = msg["total"]
+                self.loading_done = msg["done"]
+            return
         
-    def update_tree(self):
-        """Treeviewを更新"""
-        # クリア
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # データ追加
-        for entry in self.filtered_data:
-            timestamp = entry.get("ts", "")
-            # ISO形式をローカル時刻に変換
-            try:
-                dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
-                timestamp_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-            except:
-                timestamp_str = timestamp
+        if msg["type"] == "reset":
+            self.filtered_data = msg["rows"]
+            self._clear_tree()
+            self._fill_visible()
             
-            host = entry.get("host", "N/A")
-            instruction = entry.get("instruction", "N/A")
-            
-            # 結果を判定
-            results = entry.get("results", [])
-            if results:
-                # 最後のコマンドの結果をチェック
-                last_result = results[-1]
-                exit_code = last_result.get("exit_code", -1)
-                status = "成功" if exit_code == 0 else "失敗"
-            else:
-                status = "不明"
+        elif msg["type"] == "rows":
+            self.filtered_data.extend(msg["rows"])
+            self.loaded_count = msg["loaded"]
+            self.total_count = msg["total"]
+            self.loading_done = msg["done"]
+            self._fill_visible()
+        
+        self._update_status()
+                
+    def _update_status(self):
+        if not self.loading_done:
+            total = f" / 全{self.total_count}件" if self.total_count is not None else ""
+            self.status_var.set(f"表示: {len(self.filtered_data)}件 / 読み込み済み{self.loaded_count}件{total}...")
+        elif self.loaded_count == 0:
+            self.status_var.set("履歴がありません")
+        else:
+            self.status_var.set(f"表示: {len(self.filtered_data)}件 / 全{self.loaded_count}件")
+                
+    def _clear_tree(self):
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        self._rendered = 0
+        
+    def _render_rows(self, count: int):
+        """未描画の行をcount件だけTreeviewへ追加"""
+        end = min(self._rendered + count, len(self.filtered_data))
+        for index in range(self._rendered, end):
+            row = self.filtered_data[index]
+            self.tree.insert("", tk.END, iid=str(index), values=row["values"], tags=(row["status"],))
+        self._rendered = end
+        
+    def _fill_visible(self):
+        """表示領域＋先読み分の行があることを保証"""
+        visible = max(int(self.tree.cget("height")), self.tree.winfo_height() // 20)
+        if self._rendered < visible + self.PREFETCH_ROWS:
+            self._render_rows(visible + self.PREFETCH_ROWS - self._rendered)
             
-            self.tree.insert(
-                "",
-                tk.END,
-                values=(timestamp_str, host, instruction, status),
-                tags=(status,)
-            )
+    def _on_tree_scroll(self, first, last):
+        """スクロール位置が末尾に近づいたら次の行を描画"""
+        self.tree_scroll.set(first, last)
+        if float(last) > 0.9 and self._rendered < len(self.filtered_data):
+            self.after_idle(self._render_rows, self.PREFETCH_ROWS)
         
-        # タグに色を設定
-        self.tree.tag_configure("成功", foreground="#4CAF50")
-        self.tree.tag_configure("失敗", foreground="#F44336")
-        
-        self.status_var.set(f"表示: {len(self.filtered_data)}件 / 全{len(self.history_data)}件")
+    def update_tree(self):
+        """Treeviewを作り直す"""
+        self._clear_tree()
+        self._fill_visible()
+        self._update_status()
         
     def clear_filters(self):
         """フィルタをクリア"""
@@ -249,6 +412,10 @@ class HistoryWindow(tk.Toplevel):
         self.search_var.set("")
         self.apply_filters()
         
+    def _on_destroy(self, event):
+        if event.widget is self and self._loader:
+            self._loader.stop()
+        
     def on_select(self, event=None):
         """履歴項目選択時"""
         selection = self.tree.selection()
@@ -259,17 +426,16 @@ class HistoryWindow(tk.Toplevel):
             self.detail_display.config(state='disabled')
             return
         
-        # 選択されたインデックスを取得
-        item = selection[0]
-        index = self.tree.index(item)
+        # 選択されたインデックスを取得（iid = filtered_data上の位置）
+        index = int(selection[0])
         
         if index < len(self.filtered_data):
-            entry = self.filtered_data[index]
+            entry = self.filtered_data[index]["entry"]
             self.display_detail(entry)
             self.rerun_btn.config(state='normal')
         
     def display_detail(self, entry: Dict[str, Any]):
-        """詳細を表示"""
+        """詳細を表示（コマンド出力はクリック時に読み込む）"""
         self.detail_display.config(state='normal')
         self.detail_display.delete(1.0, tk.END)
         
@@ -293,37 +459,79 @@ class HistoryWindow(tk.Toplevel):
                     text += f"  {i}. {cmd}\n"
             text += "\n"
         
+        self.detail_display.insert(tk.END, text)
+        
         # 実行結果
         results = entry.get("results", [])
         if results:
-            text += "--- 実行結果 ---\n"
+            self.detail_display.insert(tk.END, "--- 実行結果 ---\n")
             for i, result in enumerate(results, 1):
                 cmd = result.get("command", "N/A")
                 exit_code = result.get("exit_code", -1)
                 status = "成功" if exit_code == 0 else "失敗"
-                text += f"{i}. {cmd}\n"
-                text += f"   結果: {status} (exit code: {exit_code})\n\n"
-        
-        # JSON全体も表示（折りたたみ可能にしたい場合は別途実装）
-        text += "\n--- JSON (Raw) ---\n"
+                self.detail_display.insert(tk.END, f"{i}. {cmd}\n")
+                self.detail_display.insert(tk.END, f"   結果: {status} (exit code: {exit_code})\n")
+                
+                ref = result.get("output_ref")
+                if ref:
+                    size = result.get("output_bytes", 0)
+                    note = "、一部省略" if result.get("output_truncated") else ""
+                    tag = f"output_{i}"
+                    self.detail_display.insert(tk.END, "   ")
+                    self.detail_display.insert(tk.END, f"[出力を表示 ({size} bytes{note})]", ("output_link", tag))
+                    self.detail_display.tag_bind(
+                        tag, "<Button-1>",
+                        lambda e, ref=ref, title=f"{i}. {cmd}": self.show_output(ref, title)
+                    )
+                    self.detail_display.insert(tk.END, "\n")
+                self.detail_display.insert(tk.END, "\n")
+        
+        self.detail_display.tag_configure("output_link", foreground="#1976D2", underline=True)
+        self.detail_display.tag_bind("output_link", "<Enter>", lambda e: self.detail_display.config(cursor="hand2"))
+        self.detail_display.tag_bind("output_link", "<Leave>", lambda e: self.detail_display.config(cursor=""))
+        
+        # JSON全体も表示（出力本体は含まない）
+        text = "\n--- JSON (Raw) ---\n"
         text += json.dumps(entry, indent=2, ensure_ascii=False)
         
         self.detail_display.insert(tk.END, text)
         self.detail_display.config(state='disabled')
         
+    def show_output(self, ref: str, title: str):
+        """保存されたコマンド出力を別ウィンドウで表示"""
+        try:
+            output = get_history_store().get_output(ref)
+        except Exception as e:
+            messagebox.showerror("エラー", f"出力の読み込みエラー: {str(e)}")
+            return
+        if output is None:
+            messagebox.showwarning("警告", "出力データが見つかりません（保持期間切れの可能性があります）。")
+            return
+        
+        window = tk.Toplevel(self)
+        window.title(f"出力 - {title[:60]}")
+        window.geometry("800x500")
+        window.transient(self)
+        
+        display = scrolledtext.ScrolledText(window, wrap=tk.NONE, font=("Consolas", 9))
+        display.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        display.insert(tk.END, output)
+        display.config(state='disabled')
+        
+        ttk.Button(window, text="閉じる", command=window.destroy).pack(pady=5)
+        
     def rerun_selected(self):
         """選択した履歴を再実行"""
         selection = self.tree.selection()
         if not selection:
             return
             
-        item = selection[0]
-        index = self.tree.index(item)
+        index = int(selection[0])
         
         if index >= len(self.filtered_data):
             return
             
-        entry = self.filtered_data[index]
+        entry = self.filtered_data[index]["entry"]
         instruction = entry.get("instruction", "")
         host = entry.get("host", "")
         
@@ -7,17 +7,23 @@ WP-AI Launcher Window
 
 import tkinter as tk
 from tkinter import scrolledtext, messagebox, ttk
-import threading
-import queue
 import json
+import re
+import shlex
+import threading
 from typing import Optional
 
 from .utils import setup_encoding
 from .dialogs import LLMSettingsDialog
+from .event_bus import subscribe
+from .worker_pool import submit, PRIORITY_NORMAL, PRIORITY_LOW
+from .widgets import TaskMonitor
+from .log_view import LogView, LEVEL_INFO, LEVEL_NAMES, classify_lines
 
 from ..config import load_config, Config
 from ..api import WPDoctorClient
 from ..auth import get_api_basic_auth_keys
+from ..runner import SSHRunner
 
 
 class LauncherWindow(tk.Tk):
@@ -177,6 +183,10 @@ class LauncherWindow(tk.Tk):
         )
         footer_label.pack()
         
+        # ステータスバー: バックグラウンドタスクのモニター
+        self.task_monitor = TaskMonitor(self)
+        self.task_monitor.pack(fill=tk.X, padx=10, pady=(0, 5))
+        
     def _load_hosts(self):
         """ホスト一覧を読み込み"""
         try:
@@ -289,7 +299,7 @@ class SystemInfoWindow(tk.Toplevel):
         self.transient(parent)
         
         self.host_config = host_config
-        self.data_queue = queue.Queue()
+        self.events = subscribe(self, self._on_event)
         
         self._build_ui()
         self._load_data()
@@ -328,49 +338,38 @@ class SystemInfoWindow(tk.Toplevel):
         self.status_var.set("読み込み中...")
         self.progress.start()
         
-        thread = threading.Thread(target=self._fetch_data, daemon=True)
-        thread.start()
-        
-        self.after(100, self._check_queue)
+        # 同じホストへの取得が実行中ならその結果を共有する
+        submit(
+            self._fetch_data,
+            name="システム情報の取得",
+            key=("system_info", self.host_config.name),
+            owner=self,
+            on_done=lambda data: self.events.post({"type": "success", "data": data}),
+            on_error=lambda e: self.events.post({"type": "error", "message": str(e)}),
+        )
         
     def _fetch_data(self):
         """バックグラウンドでデータ取得"""
-        try:
-            username, password = get_api_basic_auth_keys(self.host_config.name)
-            client = WPDoctorClient(
-                self.host_config.api_url,
-                username=username,
-                password=password
-            )
-            
-            data = client.system_info()
-            self.data_queue.put({"type": "success", "data": data})
-            
-        except Exception as e:
-            self.data_queue.put({"type": "error", "message": str(e)})
+        username, password = get_api_basic_auth_keys(self.host_config.name)
+        client = WPDoctorClient(
+            self.host_config.api_url,
+            username=username,
+            password=password
+        )
+        return client.system_info()
             
-    def _check_queue(self):
-        """キューチェック"""
-        try:
-            while not self.data_queue.empty():
-                msg = self.data_queue.get_nowait()
-                
-                if msg["type"] == "success":
-                    self._display_data(msg["data"])
-                    self.status_var.set("完了")
-                    self.progress.stop()
-                    
-                elif msg["type"] == "error":
-                    self.text_display.delete(1.0, tk.END)
-                    self.text_display.insert(tk.END, f"エラー: {msg['message']}")
-                    self.status_var.set("エラー")
-                    self.progress.stop()
-                    
-        except queue.Empty:
-            pass
-        finally:
-            if self.winfo_exists():
-                self.after(100, self._check_queue)
+    def _on_event(self, msg):
+        """ワーカーからのメッセージを処理（Tkスレッド）"""
+        if msg["type"] == "success":
+            self._display_data(msg["data"])
+            self.status_var.set("完了")
+            self.progress.stop()
+        
+        elif msg["type"] == "error":
+            self.text_display.delete(1.0, tk.END)
+            self.text_display.insert(tk.END, f"エラー: {msg['message']}")
+            self.status_var.set("エラー")
+            self.progress.stop()
                 
     def _display_data(self, data):
         """データを表示"""
@@ -392,7 +391,7 @@ class PluginAnalysisWindow(tk.Toplevel):
         self.transient(parent)
         
         self.host_config = host_config
-        self.data_queue = queue.Queue()
+        self.events = subscribe(self, self._on_event)
         
         self._build_ui()
         self._load_data()
@@ -449,48 +448,37 @@ class PluginAnalysisWindow(tk.Toplevel):
         for item in self.tree.get_children():
             self.tree.delete(item)
         
-        thread = threading.Thread(target=self._fetch_data, daemon=True)
-        thread.start()
-        
-        self.after(100, self._check_queue)
+        # 同じホストへの取得が実行中ならその結果を共有する
+        submit(
+            self._fetch_data,
+            name="プラグイン分析の取得",
+            key=("plugins_analysis", self.host_config.name),
+            owner=self,
+            on_done=lambda data: self.events.post({"type": "success", "data": data}),
+            on_error=lambda e: self.events.post({"type": "error", "message": str(e)}),
+        )
         
     def _fetch_data(self):
         """バックグラウンドでデータ取得"""
-        try:
-            username, password = get_api_basic_auth_keys(self.host_config.name)
-            client = WPDoctorClient(
-                self.host_config.api_url,
-                username=username,
-                password=password
-            )
-            
-            data = client.plugins_analysis(status='all', with_updates=True)
-            self.data_queue.put({"type": "success", "data": data})
-            
-        except Exception as e:
-            self.data_queue.put({"type": "error", "message": str(e)})
+        username, password = get_api_basic_auth_keys(self.host_config.name)
+        client = WPDoctorClient(
+            self.host_config.api_url,
+            username=username,
+            password=password
+        )
+        return client.plugins_analysis(status='all', with_updates=True)
             
-    def _check_queue(self):
-        """キューチェック"""
-        try:
-            while not self.data_queue.empty():
-                msg = self.data_queue.get_nowait()
-                
-                if msg["type"] == "success":
-                    self._display_data(msg["data"])
-                    self.status_var.set("完了")
-                    self.progress.stop()
-                    
-                elif msg["type"] == "error":
-                    messagebox.showerror("エラー", f"データ取得エラー: {msg['message']}")
-                    self.status_var.set("エラー")
-                    self.progress.stop()
-                    
-        except queue.Empty:
-            pass
-        finally:
-            if self.winfo_exists():
-                self.after(100, self._check_queue)
+    def _on_event(self, msg):
+        """ワーカーからのメッセージを処理（Tkスレッド）"""
+        if msg["type"] == "success":
+            self._display_data(msg["data"])
+            self.status_var.set("完了")
+            self.progress.stop()
+        
+        elif msg["type"] == "error":
+            messagebox.showerror("エラー", f"データ取得エラー: {msg['message']}")
+            self.status_var.set("エラー")
+            self.progress.stop()
                 
     def _display_data(self, data):
         """データを表示"""
@@ -514,7 +502,18 @@ class PluginAnalysisWindow(tk.Toplevel):
 
 
 class LogViewerWindow(tk.Toplevel):
-    """ログビューアウィンドウ"""
+    """ログビューアウィンドウ
+
+    取得したログは行インデックスとして保持し、レベル・正規表現の
+    フィルタはクライアント側で行う。「追跡」中は定期的に取得して
+    新しい行だけを末尾に追加する。ホストに [hosts.ssh].error_log_path が
+    あれば、代わりにSSH接続上のチャネルで tail -F し、届いた行をすぐ追加する
+    （接続はプラン実行など同じホストの他の処理と共有）。
+    """
+    
+    FOLLOW_INTERVAL_MS = 5000
+    # 追跡時に新しい行を判定するため、前回の末尾と照合する行数
+    FOLLOW_OVERLAP = 20
     
     def __init__(self, parent, host_config):
         super().__init__(parent)
@@ -524,7 +523,12 @@ class LogViewerWindow(tk.Toplevel):
         self.transient(parent)
         
         self.host_config = host_config
-        self.data_queue = queue.Queue()
+        self.events = subscribe(self, self._on_event)
+        self._fetching = False
+        self._follow_after_id = None
+        self._filter_after_id = None
+        self._filter_error = None
+        self._stream_stop: Optional[threading.Event] = None
         
         self._build_ui()
         self._load_data()
@@ -543,7 +547,7 @@ class LogViewerWindow(tk.Toplevel):
         lines_entry = ttk.Entry(toolbar, textvariable=self.lines_var, width=10)
         lines_entry.pack(side=tk.LEFT, padx=5)
         
-        # ログレベル
+        # ログレベル（取得済みの行に対して絞り込む）
         ttk.Label(toolbar, text="レベル:").pack(side=tk.LEFT, padx=(10, 5))
         self.level_var = tk.StringVar(value="all")
         level_combo = ttk.Combobox(
@@ -554,40 +558,81 @@ class LogViewerWindow(tk.Toplevel):
             width=10
         )
         level_combo.pack(side=tk.LEFT, padx=5)
+        level_combo.bind("<<ComboboxSelected>>", lambda e: self.apply_filter())
         
-        self.status_var = tk.StringVar(value="準備中...")
-        ttk.Label(toolbar, textvariable=self.status_var).pack(side=tk.LEFT, padx=10)
+        # 追跡
+        self.follow_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            toolbar,
+            text="追跡",
+            variable=self.follow_var,
+            command=self._on_follow_toggle
+        ).pack(side=tk.LEFT, padx=(10, 5))
         
         # プログレスバー
         self.progress = ttk.Progressbar(toolbar, mode='indeterminate', length=100)
         self.progress.pack(side=tk.RIGHT, padx=5)
         
-        # ログ表示エリア
+        # 正規表現フィルタ
+        filter_bar = ttk.Frame(self)
+        filter_bar.pack(fill=tk.X, padx=10, pady=(0, 5))
+        
+        ttk.Label(filter_bar, text="検索 (正規表現):").pack(side=tk.LEFT, padx=5)
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add("write", lambda *args: self.schedule_filter())
+        ttk.Entry(filter_bar, textvariable=self.filter_var, width=40).pack(side=tk.LEFT, padx=5)
+        
+        self.status_var = tk.StringVar(value="準備中...")
+        ttk.Label(filter_bar, textvariable=self.status_var).pack(side=tk.LEFT, padx=10)
+        
+        # ログ表示エリア（見えている行だけを描画）
         log_frame = ttk.Frame(self)
         log_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
         
-        self.log_display = scrolledtext.ScrolledText(
-            log_frame,
-            wrap=tk.WORD,
-            font=("Consolas", 9)
-        )
-        self.log_display.pack(fill=tk.BOTH, expand=True)
+        self.log_view = LogView(log_frame, on_change=self._update_status)
+        self.log_view.pack(fill=tk.BOTH, expand=True)
         
         # 閉じるボタン
         ttk.Button(self, text="閉じる", command=self.destroy).pack(pady=10)
         
+        self.bind("<Destroy>", self._on_destroy)
+        
+    def _on_destroy(self, event):
+        if event.widget is self:
+            self._stop_stream()
+            if self._follow_after_id:
+                self.after_cancel(self._follow_after_id)
+                self._follow_after_id = None
+        
     def _load_data(self):
-        """データ読み込み"""
-        self.status_var.set("読み込み中...")
-        self.progress.start()
+        """データ読み込み（表示内容を置き換える）"""
+        self._start_fetch(append=False)
         
-        thread = threading.Thread(target=self._fetch_data, daemon=True)
-        thread.start()
+    def _start_fetch(self, append: bool):
+        if self._fetching:
+            return
+        try:
+            lines = int(self.lines_var.get())
+        except ValueError:
+            self.status_var.set("エラー: 行数は数値で指定してください。")
+            return
         
-        self.after(100, self._check_queue)
+        self._fetching = True
+        if not append:
+            self.status_var.set("読み込み中...")
+        self.progress.start()
         
-    def _fetch_data(self):
-        """バックグラウンドでデータ取得"""
+        previous = self.log_view.tail(self.FOLLOW_OVERLAP) if append else None
+        submit(
+            self._fetch_data,
+            lines, previous,
+            name="ログの追跡" if append else "ログの取得",
+            priority=PRIORITY_LOW if append else PRIORITY_NORMAL,
+            owner=self,
+        )
+        
+    def _fetch_data(self, lines: int, previous=None):
+        """バックグラウンドでデータ取得（行分割とレベル判定もここで行う）"""
         try:
             username, password = get_api_basic_auth_keys(self.host_config.name)
             client = WPDoctorClient(
@@ -596,56 +641,165 @@ class LogViewerWindow(tk.Toplevel):
                 password=password
             )
             
-            lines = int(self.lines_var.get())
-            level = self.level_var.get()
+            # レベルはクライアント側で絞り込むので全件を取得
+            data = client.error_logs(lines=lines, level="all", format='json')
+            log_lines = self._extract_lines(data)
             
-            data = client.error_logs(lines=lines, level=level, format='json')
-            self.data_queue.put({"type": "success", "data": data})
+            if previous is None:
+                self.events.post({"type": "success", "lines": log_lines, "levels": classify_lines(log_lines)})
+            else:
+                new_lines = self._new_lines(previous, log_lines)
+                self.events.post({"type": "append", "lines": new_lines, "levels": classify_lines(new_lines)})
             
-        except ValueError:
-            self.data_queue.put({"type": "error", "message": "行数は数値で指定してください。"})
         except Exception as e:
-            self.data_queue.put({"type": "error", "message": str(e)})
+            self.events.post({"type": "error", "message": str(e)})
             
-    def _check_queue(self):
-        """キューチェック"""
-        try:
-            while not self.data_queue.empty():
-                msg = self.data_queue.get_nowait()
-                
-                if msg["type"] == "success":
-                    self._display_data(msg["data"])
-                    self.status_var.set("完了")
-                    self.progress.stop()
-                    
-                elif msg["type"] == "error":
-                    self.log_display.delete(1.0, tk.END)
-                    self.log_display.insert(tk.END, f"エラー: {msg['message']}")
-                    self.status_var.set("エラー")
-                    self.progress.stop()
-                    
-        except queue.Empty:
-            pass
-        finally:
-            if self.winfo_exists():
-                self.after(100, self._check_queue)
-                
-    def _display_data(self, data):
-        """データを表示"""
-        self.log_display.delete(1.0, tk.END)
-        
-        # ログデータの取得
+    @staticmethod
+    def _extract_lines(data) -> list:
+        """APIの応答からログ行を取り出す"""
         logs = data.get('tail') or data.get('lines') or data.get('log', [])
         
         if isinstance(logs, list):
-            log_text = '\n'.join(logs)
+            return [str(line) for line in logs]
         elif isinstance(logs, str):
-            log_text = logs
+            return logs.splitlines()
+        return json.dumps(data, indent=2, ensure_ascii=False).splitlines()
+        
+    @staticmethod
+    def _new_lines(previous: list, fetched: list) -> list:
+        """前回の末尾と重なる部分を除いた新しい行
+        
+        前回の最終行と一致する位置を後ろから探し、その手前の行も前回の末尾と
+        一致すれば、それ以降を新しい行とみなす。重なりがなければ
+        （ローテーション等）取得した全行を返す。
+        """
+        if not previous:
+            return fetched
+        last = previous[-1]
+        for j in range(len(fetched) - 1, -1, -1):
+            if fetched[j] != last:
+                continue
+            k = min(j + 1, len(previous))
+            if fetched[j + 1 - k:j + 1] == previous[-k:]:
+                return fetched[j + 1:]
+        return fetched
+        
+    def _on_event(self, msg):
+        """ワーカーからのメッセージを処理（Tkスレッド）"""
+        if msg["type"] == "stream":
+            self.log_view.append(msg["lines"], msg["levels"])
+            return
+        if msg["type"] == "stream_end":
+            self.follow_var.set(False)
+            self._stream_stop = None
+            self.status_var.set(msg["message"])
+            return
+        
+        self._fetching = False
+        self.progress.stop()
+        
+        if msg["type"] == "success":
+            self.log_view.set_lines(msg["lines"], msg["levels"])
+        
+        elif msg["type"] == "append":
+            self.log_view.append(msg["lines"], msg["levels"])
+        
+        elif msg["type"] == "error":
+            self.status_var.set(f"エラー: {msg['message']}")
+        
+        self._schedule_follow()
+        
+    # ===== フィルタ =====
+    
+    def schedule_filter(self):
+        """キー入力ごとのフィルタをまとめる（デバウンス）"""
+        if self._filter_after_id:
+            self.after_cancel(self._filter_after_id)
+        self._filter_after_id = self.after(250, self.apply_filter)
+        
+    def apply_filter(self):
+        """レベルと正規表現で表示中の行を絞り込む"""
+        self._filter_after_id = None
+        text = self.filter_var.get()
+        pattern = None
+        self._filter_error = None
+        if text:
+            try:
+                pattern = re.compile(text, re.IGNORECASE)
+            except re.error as e:
+                # 入力途中の不完全な正規表現は文字列として扱う
+                self._filter_error = str(e)
+                pattern = re.compile(re.escape(text), re.IGNORECASE)
+        self.log_view.set_filter(LEVEL_NAMES.get(self.level_var.get(), LEVEL_INFO), pattern)
+        
+    def _update_status(self):
+        view = self.log_view
+        status = f"表示: {len(view.visible)}行 / {len(view.lines)}行"
+        if view.filtering:
+            status += " (フィルタ中...)"
+        if self._filter_error:
+            status += f" [正規表現エラー: {self._filter_error}]"
+        if self.follow_var.get():
+            status += " [追跡中]"
+        self.status_var.set(status)
+        
+    # ===== 追跡 =====
+    
+    def _on_follow_toggle(self):
+        if self.follow_var.get():
+            if self.host_config.ssh.error_log_path:
+                self._start_stream()
+            else:
+                self._start_fetch(append=True)
         else:
-            log_text = json.dumps(data, indent=2, ensure_ascii=False)
+            self._stop_stream()
+            if self._follow_after_id:
+                self.after_cancel(self._follow_after_id)
+                self._follow_after_id = None
+        self._update_status()
+        
+    def _start_stream(self):
+        """SSHでログファイルを tail -F する"""
+        self._stop_stream()
+        self._stream_stop = threading.Event()
+        # 追跡中ずっと続くので、ワーカープールではなく専用スレッドで読む
+        threading.Thread(
+            target=self._stream_log, args=(self._stream_stop,),
+            name=f"log-follow-{self.host_config.name}", daemon=True,
+        ).start()
+        
+    def _stop_stream(self):
+        if self._stream_stop is not None:
+            self._stream_stop.set()
+            self._stream_stop = None
+            
+    def _stream_log(self, stop: threading.Event):
+        """ログの追跡（専用スレッド）"""
+        command = f"tail -n 0 -F {shlex.quote(self.host_config.ssh.error_log_path)}"
         
-        self.log_display.insert(tk.END, log_text)
-
+        def on_lines(lines):
+            lines = [line.rstrip("\r\n") for line in lines]
+            self.events.post({"type": "stream", "lines": lines, "levels": classify_lines(lines)})
+        
+        runner = SSHRunner(self.host_config.ssh)
+        try:
+            exit_code = runner.follow(command, on_lines, stop)
+            if not stop.is_set():
+                self.events.post({"type": "stream_end", "message": f"追跡が終了しました (終了コード: {exit_code})"})
+        except Exception as e:
+            if not stop.is_set():
+                self.events.post({"type": "stream_end", "message": f"エラー: {e}"})
+        finally:
+            runner.close()
+        
+    def _schedule_follow(self):
+        if self.follow_var.get() and self._follow_after_id is None:
+            self._follow_after_id = self.after(self.FOLLOW_INTERVAL_MS, self._follow_tick)
+            
+    def _follow_tick(self):
+        self._follow_after_id = None
+        if self.follow_var.get():
+            self._start_fetch(append=True)
 
 def main():
     """GUIアプリケーション起動"""
@@ -0,0 +1,226 @@
+"""
+Virtualized log view for WP-AI GUI
+
+数千〜数万行のログを扱うためのビュー。全行はメモリ上の行インデックス
+（行テキストとレベル）として保持し、Textウィジェットには画面に見えている
+行だけを描画する。レベル/正規表現フィルタはインデックスに対して
+バッチ単位で評価するので、サーバーへの再問い合わせもGUIの停止も起きない。
+"""
+
+import re
+import tkinter as tk
+from tkinter import ttk
+import tkinter.font as tkfont
+from typing import Callable, List, Optional, Pattern
+
+# レベル（数値が大きいほど重要）
+LEVEL_INFO = 0
+LEVEL_NOTICE = 1
+LEVEL_WARNING = 2
+LEVEL_ERROR = 3
+
+LEVEL_NAMES = {"all": LEVEL_INFO, "notice": LEVEL_NOTICE, "warning": LEVEL_WARNING, "error": LEVEL_ERROR}
+LEVEL_TAGS = ("level_info", "level_notice", "level_warning", "level_error")
+LEVEL_COLORS = {"level_notice": "#1565C0", "level_warning": "#EF6C00", "level_error": "#C62828"}
+
+_LEVEL_PATTERNS = [
+    (LEVEL_ERROR, re.compile(r"fatal error|parse error|\berror\b|\bcritical\b|\balert\b|\bemergency\b", re.IGNORECASE)),
+    (LEVEL_WARNING, re.compile(r"\bwarning\b", re.IGNORECASE)),
+    (LEVEL_NOTICE, re.compile(r"\bnotice\b|\bdeprecated\b|\bstrict standards\b", re.IGNORECASE)),
+]
+
+
+def classify_line(line: str) -> int:
+    """ログ行のレベルを判定（PHPエラーログの書式を想定）"""
+    for level, pattern in _LEVEL_PATTERNS:
+        if pattern.search(line):
+            return level
+    return LEVEL_INFO
+
+
+def classify_lines(lines: List[str]) -> List[int]:
+    """行ごとのレベルを判定（ワーカースレッドから呼んでよい）"""
+    return [classify_line(line) for line in lines]
+
+
+class LogView(ttk.Frame):
+    """見えている行だけを描画するログビュー
+
+    - set_lines(lines, levels): 内容を置き換え
+    - append(lines, levels): 末尾に追加（末尾表示中なら追従する）
+    - set_filter(min_level, pattern): クライアント側でフィルタ
+    """
+
+    # 1回のアイドル処理でフィルタを評価する行数
+    FILTER_BATCH = 5000
+
+    def __init__(self, parent, font=("Consolas", 9), on_change: Optional[Callable[[], None]] = None):
+        super().__init__(parent)
+        self.on_change = on_change
+
+        self.lines: List[str] = []
+        self.levels: List[int] = []
+        # フィルタに一致した行（self.lines のインデックス）
+        self.visible: List[int] = []
+        self.top = 0
+        self.stick_to_end = True
+        self.min_level = LEVEL_INFO
+        self.pattern: Optional[Pattern] = None
+        self.filtering = False
+        self._filter_pos = 0
+        self._filter_after_id = None
+        self._render_after_id = None
+
+        self.text = tk.Text(self, wrap=tk.NONE, font=font, state="disabled")
+        self.yscroll = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.xscroll = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.text.xview)
+        self.text.config(xscrollcommand=self.xscroll.set)
+
+        self.text.grid(row=0, column=0, sticky="nsew")
+        self.yscroll.grid(row=0, column=1, sticky="ns")
+        self.xscroll.grid(row=1, column=0, sticky="ew")
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        for tag, color in LEVEL_COLORS.items():
+            self.text.tag_config(tag, foreground=color)
+
+        self._linespace = tkfont.Font(font=self.text.cget("font")).metrics("linespace")
+
+        self.text.bind("<Configure>", lambda e: self.render())
+        self.text.bind("<MouseWheel>", self._on_mousewheel)
+        self.text.bind("<Button-4>", lambda e: self._scroll_by(-3))
+        self.text.bind("<Button-5>", lambda e: self._scroll_by(3))
+        self.text.bind("<Prior>", lambda e: self._scroll_by(-self.page_rows()))
+        self.text.bind("<Next>", lambda e: self._scroll_by(self.page_rows()))
+        self.text.bind("<Control-Home>", lambda e: self._scroll_to(0))
+        self.text.bind("<Control-End>", lambda e: self._scroll_to(len(self.visible)))
+
+    # ===== データ =====
+
+    def set_lines(self, lines: List[str], levels: Optional[List[int]] = None):
+        """内容を置き換えて末尾を表示"""
+        self.lines = list(lines)
+        self.levels = list(levels) if levels is not None else classify_lines(self.lines)
+        self.stick_to_end = True
+        self._refilter()
+
+    def append(self, lines: List[str], levels: Optional[List[int]] = None):
+        """行を末尾に追加"""
+        if not lines:
+            return
+        self.lines.extend(lines)
+        self.levels.extend(levels if levels is not None else classify_lines(lines))
+        if self.filtering:
+            # 評価中のフィルタが末尾まで処理する
+            return
+        self._filter_range(len(self.lines))
+        self._schedule_render()
+
+    def tail(self, count: int) -> List[str]:
+        """末尾 count 行（フィルタに関係なく）"""
+        return self.lines[-count:] if count > 0 else []
+
+    # ===== フィルタ =====
+
+    def set_filter(self, min_level: int = LEVEL_INFO, pattern: Optional[Pattern] = None):
+        """レベル（以上）と正規表現で絞り込む"""
+        self.min_level = min_level
+        self.pattern = pattern
+        self._refilter()
+
+    def _matches(self, index: int) -> bool:
+        if self.levels[index] < self.min_level:
+            return False
+        return self.pattern is None or self.pattern.search(self.lines[index]) is not None
+
+    def _filter_range(self, end: int):
+        matches = self._matches
+        self.visible.extend(i for i in range(self._filter_pos, end) if matches(i))
+        self._filter_pos = end
+
+    def _refilter(self):
+        if self._filter_after_id:
+            self.after_cancel(self._filter_after_id)
+            self._filter_after_id = None
+        self.visible = []
+        self._filter_pos = 0
+        self.top = 0
+        self.filtering = True
+        self._filter_step()
+
+    def _filter_step(self):
+        """FILTER_BATCH 行ずつ評価し、合間にイベント処理を挟む"""
+        self._filter_after_id = None
+        self._filter_range(min(self._filter_pos + self.FILTER_BATCH, len(self.lines)))
+        if self._filter_pos < len(self.lines):
+            self._filter_after_id = self.after(1, self._filter_step)
+        else:
+            self.filtering = False
+        self.render()
+
+    # ===== 描画 =====
+
+    def page_rows(self) -> int:
+        """画面に入る行数"""
+        return max(1, self.text.winfo_height() // max(1, self._linespace))
+
+    def _schedule_render(self):
+        if self._render_after_id is None:
+            self._render_after_id = self.after_idle(self.render)
+
+    def render(self):
+        """見えている範囲の行だけを描画（色付けは1回の insert でまとめて行う）"""
+        if self._render_after_id:
+            self.after_cancel(self._render_after_id)
+            self._render_after_id = None
+
+        rows = self.page_rows()
+        total = len(self.visible)
+        last_top = max(0, total - rows)
+        if self.stick_to_end:
+            self.top = last_top
+        self.top = max(0, min(self.top, last_top))
+
+        chunks = []
+        for i in self.visible[self.top:self.top + rows]:
+            chunks.extend([self.lines[i] + "\n", LEVEL_TAGS[self.levels[i]]])
+
+        self.text.config(state="normal")
+        self.text.delete("1.0", tk.END)
+        if chunks:
+            self.text.insert(tk.END, *chunks)
+        self.text.config(state="disabled")
+
+        if total:
+            self.yscroll.set(self.top / total, min(1.0, (self.top + rows) / total))
+        else:
+            self.yscroll.set(0.0, 1.0)
+
+        if self.on_change:
+            self.on_change()
+
+    # ===== スクロール =====
+
+    def _scroll_to(self, top: int):
+        rows = self.page_rows()
+        last_top = max(0, len(self.visible) - rows)
+        self.top = max(0, min(top, last_top))
+        self.stick_to_end = self.top >= last_top
+        self.render()
+        return "break"
+
+    def _scroll_by(self, delta: int):
+        return self._scroll_to(self.top + delta)
+
+    def _on_mousewheel(self, event):
+        return self._scroll_by(-3 if event.delta > 0 else 3)
+
+    def _on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self._scroll_to(int(float(args[1]) * len(self.visible)))
+        elif args[0] == "scroll":
+            step = int(args[1])
+            if args[2] == "pages":
+                step *= self.page_rows()
+            self._scroll_by(step)
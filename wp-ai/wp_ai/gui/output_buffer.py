@@ -0,0 +1,186 @@
+"""
+Frame-paced output buffer for Tk Text widgets
+
+ワーカースレッドは write()/call() でデックに積むだけで、ウィジェットには
+触らない。最初の書き込みでイベントバス経由でTkスレッドを起こし、
+1フレーム（既定33ms）後にデックを取り出して、連続するテキストを
+まとめて1回の insert で描画する。アイドル時はタイマーを動かさない。
+
+max_lines を指定すると、行数が上限を超えたところで古い行をまとめて
+削除する（スクロールバック）。削除した行は一時ファイルに書き出し、
+save() で全文を保存できる。
+"""
+
+import shutil
+import tempfile
+import tkinter as tk
+from collections import deque
+from typing import Callable, Optional
+
+from .event_bus import subscribe
+
+
+class OutputBuffer:
+    """Textウィジェットへの出力をフレーム単位でまとめて描画するバッファ
+
+    - write(text, tags): テキストを追加（どのスレッドからでも可）
+    - call(fn, *args): 描画順を保ったままTkスレッドで関数を実行
+    - save(path): 削除済みの行も含めた全文を保存
+    """
+
+    FRAME_MS = 33
+    # 上限を超えてから削除するまでの余裕（上限に対する割合）。
+    # 1行ごとに削除すると毎フレーム再レイアウトが走るため、まとめて削る
+    TRIM_SLACK = 0.1
+
+    def __init__(
+        self,
+        widget: tk.Text,
+        frame_ms: int = FRAME_MS,
+        on_flush: Optional[Callable[[], None]] = None,
+        max_lines: int = 0,
+    ):
+        self.widget = widget
+        self.frame_ms = frame_ms
+        self.on_flush = on_flush
+        self.max_lines = max_lines
+        self.trimmed_lines = 0
+        self._spill = None
+        # deque.append / popleft はスレッドセーフ（ロック不要）
+        self._pending = deque()
+        self._requested = False
+        self._after_id = None
+        self._closed = False
+        self._channel = subscribe(widget, self._on_request)
+        widget.bind("<Destroy>", self._on_destroy, add="+")
+
+    def write(self, text: str, tags=()):
+        """テキストを追加"""
+        if text:
+            self._pending.append(("text", text, tuple(tags)))
+            self._request_frame()
+
+    def call(self, fn: Callable, *args):
+        """Tkスレッドで fn(*args) を実行（先に積まれたテキストの描画後）"""
+        self._pending.append(("call", fn, args))
+        self._request_frame()
+
+    def _request_frame(self):
+        # 積んだ後にフラグを見る: フレーム処理はフラグを下ろしてから取り出すので取りこぼさない
+        if not self._requested:
+            self._requested = True
+            self._channel.post()
+
+    def _on_request(self, _message=None):
+        if self._after_id is None and not self._closed:
+            self._after_id = self.widget.after(self.frame_ms, self._frame)
+
+    def _frame(self):
+        self._after_id = None
+        self._requested = False
+        self.flush()
+
+    def flush(self):
+        """積まれた出力を描画（Tkスレッドから呼ぶこと）"""
+        if self._closed or not self._pending:
+            return
+        try:
+            if not self.widget.winfo_exists():
+                self.close()
+                return
+        except tk.TclError:
+            self.close()
+            return
+
+        # insert(index, text1, tags1, text2, tags2, ...) の引数をまとめる
+        chunks = []
+        last_tags = None
+        while self._pending:
+            item = self._pending.popleft()
+            if item[0] == "text":
+                _, text, tags = item
+                if chunks and tags == last_tags:
+                    chunks[-2] += text
+                else:
+                    chunks.extend([text, tags])
+                    last_tags = tags
+            else:
+                self._insert(chunks)
+                chunks, last_tags = [], None
+                _, fn, args = item
+                fn(*args)
+        self._insert(chunks)
+
+    def _insert(self, chunks):
+        if not chunks:
+            return
+        state = str(self.widget.cget("state"))
+        if state == "disabled":
+            self.widget.config(state="normal")
+        self.widget.insert(tk.END, *chunks)
+        self._trim()
+        if state == "disabled":
+            self.widget.config(state="disabled")
+        self.widget.see(tk.END)
+        if self.on_flush:
+            self.on_flush()
+
+    def line_count(self) -> int:
+        return int(self.widget.index("end-1c").split(".")[0])
+
+    def trim(self):
+        """上限を超えた古い行を削除（Tkスレッドから呼ぶこと）
+
+        バッファを経由せずウィジェットに直接挿入した後に呼ぶ。
+        """
+        state = str(self.widget.cget("state"))
+        if state == "disabled":
+            self.widget.config(state="normal")
+        self._trim()
+        if state == "disabled":
+            self.widget.config(state="disabled")
+
+    def _trim(self):
+        if self.max_lines <= 0:
+            return
+        lines = self.line_count()
+        if lines <= self.max_lines + int(self.max_lines * self.TRIM_SLACK):
+            return
+        excess = lines - self.max_lines
+        cut = f"{excess + 1}.0"
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(
+                mode="w+", encoding="utf-8", newline="", prefix="wp-ai-output-"
+            )
+        self._spill.write(self.widget.get("1.0", cut))
+        self.widget.delete("1.0", cut)
+        self.trimmed_lines += excess
+
+    def save(self, path: str):
+        """削除済みの行と表示中の内容をつなげて保存（Tkスレッドから呼ぶこと）"""
+        self.flush()
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            if self._spill is not None:
+                self._spill.flush()
+                self._spill.seek(0)
+                shutil.copyfileobj(self._spill, f)
+                self._spill.seek(0, 2)
+            f.write(self.widget.get("1.0", "end-1c"))
+
+    def _on_destroy(self, event):
+        if event.widget is self.widget:
+            self.close()
+
+    def close(self):
+        """描画を止めて一時ファイルを削除"""
+        self._closed = True
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        self._channel.close()
+        if self._after_id:
+            try:
+                self.widget.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
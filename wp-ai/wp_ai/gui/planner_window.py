@@ -6,23 +6,24 @@ plan/sayコマンドのGUI統合
 """
 
 import tkinter as tk
-from tkinter import scrolledtext, messagebox, ttk
-import threading
-import queue
+from tkinter import scrolledtext, messagebox, ttk, filedialog
 import json
 from typing import Optional, List, Dict, Any
 
 from .utils import setup_encoding
 from .widgets import ContextControlPanel
+from .output_buffer import OutputBuffer
+from .worker_pool import submit, current_token, TaskCancelled, PRIORITY_HIGH
+from .event_bus import subscribe
+from .context_prefetch import ContextPrefetcher, collect, context_requests, get_context_cache
 
-from ..config import load_config, Config, HostConfig, history_append, DockerComposeConfig
+from ..config import load_config, Config, HostConfig, history_append
 from ..llm import LLMClient
-from ..runner import SSHRunner, DockerComposeRunner, BaseRunner
-from ..api import WPDoctorClient
-from ..auth import get_api_basic_auth_keys
-from ..context import build_context_text
-from ..prompts import build_prompt
-from ..main import PlanModel, _validate_ai_response, _policy_violations
+from ..runner import BaseRunner, create_runner
+from ..scheduler import run_steps
+from ..context import build_context_sections, build_context_text, significant_sections
+from ..prompts import build_prompt_parts
+from ..main import PlanModel, _generate_plan, _policy_violations
 
 
 class PlannerWindow(tk.Toplevel):
@@ -45,13 +46,19 @@ class PlannerWindow(tk.Toplevel):
         self.config = load_config()
         self.current_host = host_config or (self.config.hosts[0] if self.config.hosts else None)
         self.current_plan: Optional[PlanModel] = None
+        self.current_model: Optional[str] = None
+        self.current_llm_usage: Optional[dict] = None
         
         # キュー
-        self.response_queue = queue.Queue()
+        self.events = subscribe(self, self._on_event)
         
         # UI構築
         self._build_ui()
         
+        # 選択中ホストのコンテキストを先読みしておき、Plan生成時はすぐLLMを呼ぶ
+        self.prefetcher = ContextPrefetcher(self, lambda: self.current_host, self.context_panel, self.instruction_text)
+        self.prefetcher.schedule()
+        
     def _build_ui(self):
         """UI構築"""
         # ヘッダー: ホスト選択
@@ -152,6 +159,7 @@ class PlannerWindow(tk.Toplevel):
             if host.name == selected_name:
                 self.current_host = host
                 break
+        self.prefetcher.schedule()
                 
     def generate_plan(self):
         """Plan生成"""
@@ -168,18 +176,21 @@ class PlannerWindow(tk.Toplevel):
         self.progress.start()
         self.plan_btn.config(state='disabled')
         
-        # バックグラウンドスレッドで実行
-        thread = threading.Thread(
-            target=self._generate_plan_thread,
-            args=(instruction,),
-            daemon=True
+        # コンテキスト設定はメインスレッドで読む
+        log_lines, log_level = self.context_panel.get_log_params()
+        requests = context_requests(self.context_panel.get_context_types(), log_lines, log_level)
+        
+        # 共有ワーカープールで実行（ウィンドウを閉じるとキャンセル）
+        submit(
+            self._generate_plan_thread,
+            instruction, requests,
+            name="プラン生成",
+            priority=PRIORITY_HIGH,
+            owner=self,
+            long_running=True,
         )
-        thread.start()
         
-        # キューチェック開始
-        self.after(100, self._check_queue)
-        
-    def _generate_plan_thread(self, instruction: str):
+    def _generate_plan_thread(self, instruction: str, requests: list):
         """Plan生成スレッド"""
         try:
             # デバッグ: 現在のホスト情報を出力
@@ -196,129 +207,159 @@ class PlannerWindow(tk.Toplevel):
                 print(f"SSH設定あり: False")
             print(f"{'='*80}\n")
             
-            # コンテキスト取得
-            context_text = ""
-            context_types = self.context_panel.get_context_types()
-            if context_types and self.current_host.api_url:
+            # コンテキスト取得（先読み済みで新しければそのまま使う）
+            # 期限までに届かないセクションは待たずにプランを生成し、後から確認する
+            payloads, late = {}, {}
+            if requests and self.current_host.api_url:
                 try:
-                    context_text = self._fetch_context(context_types)
+                    payloads, late = self._fetch_context(requests)
+                except TaskCancelled:
+                    raise
                 except Exception as e:
-                    self.response_queue.put({
+                    self.events.post({
                         "type": "warning",
                         "message": f"コンテキスト取得失敗: {str(e)}"
                     })
             
+            # ウィンドウが閉じられていればLLMを呼ばずに終える
+            current_token().raise_if_cancelled()
+            
             # LLM呼び出し
-            client = LLMClient(self.config.llm)
-            prompt = build_prompt(instruction, host_config=self.current_host, context=context_text)
+            client = LLMClient(self.config.llm, call_type="plan")
+            # ホストごとに固定のシステムプロンプトはプロバイダー側でキャッシュされる
+            prompt = build_prompt_parts(instruction, host_config=self.current_host, context=build_context_text(payloads))
             
             # デバッグ: プロンプトの一部を出力
             print(f"【デバッグ】プロンプトに含まれるキーワード:")
-            print(f"  'CRITICAL COMMAND FORMAT REQUIREMENT': {'CRITICAL COMMAND FORMAT REQUIREMENT' in prompt}")
-            print(f"  'wp_path': {'/opt/alt/php81/usr/bin/php' in prompt}")
+            print(f"  'CRITICAL COMMAND FORMAT REQUIREMENT': {'CRITICAL COMMAND FORMAT REQUIREMENT' in prompt.system}")
+            print(f"  'wp_path': {'/opt/alt/php81/usr/bin/php' in prompt.system}")
             print(f"{'='*80}\n")
             
-            response_text = client.generate_content(prompt)
-            
-            # プラン検証
-            plan_model = _validate_ai_response(response_text)
-            
-            # ポリシーチェック
-            violations = _policy_violations(
-                plan_model.normalized_commands(),
-                self.config.policy.blocklist
-            )
+            # プラン生成と検証（スキーマ指定の1回呼び出し、失敗時のみ修復呼び出し）
+            if not self._propose(client, prompt, final=not late):
+                return
+            if not late:
+                return
             
-            if violations:
-                self.response_queue.put({
-                    "type": "policy_violation",
-                    "violations": violations
+            # 遅れて届いたコンテキストに致命的エラーなどがあれば、全コンテキストで作り直す
+            late_payloads, errors, _ = collect(late)
+            if errors:
+                self.events.post({
+                    "type": "warning",
+                    "message": "コンテキスト取得失敗: " + ", ".join(f"{name}: {e}" for name, e in errors.items())
                 })
+            notable = significant_sections(build_context_sections(late_payloads))
+            if not notable or not self.config.gui.context_refine:
+                self.events.post({"type": "plan_final"})
                 return
             
-            # 成功
-            self.response_queue.put({
-                "type": "plan_success",
-                "plan": plan_model
-            })
+            current_token().raise_if_cancelled()
+            self.events.post({"type": "status", "text": f"追加のコンテキスト ({', '.join(notable)}) でプランを再生成中..."})
+            payloads.update(late_payloads)
+            prompt = build_prompt_parts(instruction, host_config=self.current_host, context=build_context_text(payloads))
+            self._propose(client, prompt, final=True)
             
         except Exception as e:
-            self.response_queue.put({
+            self.events.post({
                 "type": "error",
                 "message": str(e)
             })
             
-    def _fetch_context(self, context_types: list) -> str:
-        """コンテキスト取得"""
-        username, password = get_api_basic_auth_keys(self.current_host.name)
-        if not username or not password:
-            return ""
-            
-        client = WPDoctorClient(
-            self.current_host.api_url,
-            username=username,
-            password=password
+    def _propose(self, client: LLMClient, prompt, final: bool) -> bool:
+        """プランを生成して表示に送る（ポリシー違反なら False）
+        
+        final=False のプランは表示するが、遅れているコンテキストの確認が
+        終わる（plan_final / 再生成した plan_success）まで実行できない。
+        """
+        plan_model = _generate_plan(client, prompt)
+        
+        # ポリシーチェック
+        violations = _policy_violations(
+            plan_model.normalized_commands(),
+            self.config.policy.blocklist
         )
         
-        payloads = {}
-        log_lines, log_level = self.context_panel.get_log_params()
-        
-        if 'system' in context_types:
-            payloads['system_info'] = client.system_info()
-            
-        if 'plugins' in context_types:
-            payloads['plugins_analysis'] = client.plugins_analysis(
-                status='active',
-                with_updates=True
+        if violations:
+            self.events.post({
+                "type": "policy_violation",
+                "violations": violations
+            })
+            return False
+        
+        # 成功
+        self.events.post({
+            "type": "plan_success",
+            "plan": plan_model,
+            "model": client.last_model,
+            "llm": client.last_usage,
+            "final": final
+        })
+        return True
+    
+    def _fetch_context(self, requests: list):
+        """コンテキスト取得: (届いたセクション, 期限後も取得中のセクション)"""
+        result = get_context_cache().get(
+            self.current_host, requests, self.config.gui.context_max_age,
+            deadline=self.config.gui.context_deadline,
+        )
+        if result is None:
+            return {}, {}
+        if result.errors:
+            self.events.post({
+                "type": "warning",
+                "message": "コンテキスト取得失敗: " + ", ".join(f"{name}: {e}" for name, e in result.errors.items())
+            })
+        return result.payloads, result.pending
+        
+    def _on_event(self, msg):
+        """ワーカーからのメッセージを処理（Tkスレッド）"""
+        if msg["type"] == "plan_success":
+            self._display_plan(msg["plan"])
+            self.current_model = msg.get("model")
+            self.current_llm_usage = msg.get("llm")
+            if msg.get("final", True):
+                self._on_plan_final()
+            else:
+                # 遅れているコンテキストの確認が終わるまで実行はできない
+                self.status_var.set("プラン生成完了（残りのコンテキストを確認中...）")
+                self.say_btn.config(state='disabled')
+        
+        elif msg["type"] == "plan_final":
+            self._on_plan_final()
+        
+        elif msg["type"] == "status":
+            self.status_var.set(msg["text"])
+        
+        elif msg["type"] == "policy_violation":
+            violations = msg["violations"]
+            violation_text = "\n".join([
+                f"  - {v['command']} (pattern: {v['pattern']})"
+                for v in violations
+            ])
+            messagebox.showerror(
+                "ポリシー違反",
+                f"以下のコマンドがブロックリストに違反しています:\n{violation_text}"
             )
-            
-        if 'logs' in context_types and log_lines and log_level:
-            payloads['error_logs'] = client.error_logs(lines=log_lines, level=log_level)
+            self.status_var.set("ポリシー違反")
+            self.progress.stop()
+            self.plan_btn.config(state='normal')
         
-        return build_context_text(payloads)
+        elif msg["type"] == "warning":
+            messagebox.showwarning("警告", msg["message"])
         
-    def _check_queue(self):
-        """キューチェック"""
-        try:
-            while not self.response_queue.empty():
-                msg = self.response_queue.get_nowait()
-                
-                if msg["type"] == "plan_success":
-                    self._display_plan(msg["plan"])
-                    self.status_var.set("プラン生成完了")
-                    self.progress.stop()
-                    self.plan_btn.config(state='normal')
-                    self.say_btn.config(state='normal')
-                    
-                elif msg["type"] == "policy_violation":
-                    violations = msg["violations"]
-                    violation_text = "\n".join([
-                        f"  - {v['command']} (pattern: {v['pattern']})"
-                        for v in violations
-                    ])
-                    messagebox.showerror(
-                        "ポリシー違反",
-                        f"以下のコマンドがブロックリストに違反しています:\n{violation_text}"
-                    )
-                    self.status_var.set("ポリシー違反")
-                    self.progress.stop()
-                    self.plan_btn.config(state='normal')
-                    
-                elif msg["type"] == "warning":
-                    messagebox.showwarning("警告", msg["message"])
-                    
-                elif msg["type"] == "error":
-                    messagebox.showerror("エラー", f"プラン生成エラー: {msg['message']}")
-                    self.status_var.set("エラー")
-                    self.progress.stop()
-                    self.plan_btn.config(state='normal')
-                    
-        except queue.Empty:
-            pass
-        finally:
-            if self.winfo_exists():
-                self.after(100, self._check_queue)
+        elif msg["type"] == "error":
+            messagebox.showerror("エラー", f"プラン生成エラー: {msg['message']}")
+            self.status_var.set("エラー")
+            self.progress.stop()
+            self.plan_btn.config(state='normal')
                 
+    def _on_plan_final(self):
+        """プラン確定時のUI更新"""
+        self.status_var.set("プラン生成完了")
+        self.progress.stop()
+        self.plan_btn.config(state='normal')
+        self.say_btn.config(state='normal')
+    
     def _display_plan(self, plan: PlanModel):
         """プランを表示"""
         self.current_plan = plan
@@ -363,7 +404,9 @@ class PlannerWindow(tk.Toplevel):
                 self,
                 self.current_host,
                 self.current_plan,
-                instruction
+                instruction,
+                model=self.current_model,
+                llm_usage=self.current_llm_usage
             )
             
     def clear_plan(self):
@@ -435,7 +478,8 @@ class CommandConfirmDialog(tk.Toplevel):
 class SSHExecutionDialog(tk.Toplevel):
     """SSH実行ダイアログ"""
     
-    def __init__(self, parent, host_config: HostConfig, plan: PlanModel, instruction: str):
+    def __init__(self, parent, host_config: HostConfig, plan: PlanModel, instruction: str, model: Optional[str] = None,
+                 llm_usage: Optional[dict] = None):
         super().__init__(parent)
         
         self.title("コマンド実行中")
@@ -446,6 +490,8 @@ class SSHExecutionDialog(tk.Toplevel):
         self.host_config = host_config
         self.plan = plan
         self.instruction = instruction
+        self.model = model  # プランを生成したLLMモデル（フォールバック時は代替モデル）
+        self.llm_usage = llm_usage  # プラン生成のトークン数・レイテンシ
         self.runner: Optional[BaseRunner] = None
         self.results = []
         self.config = load_config()
@@ -479,84 +525,113 @@ class SSHExecutionDialog(tk.Toplevel):
         )
         self.output_display.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
+        # ワーカースレッドからの出力・UI更新はバッファ経由でTkスレッドに渡す
+        # 古い行はスクロールバック上限で削除（全文は「全出力を保存」で保存できる）
+        self.output_buffer = OutputBuffer(
+            self.output_display,
+            max_lines=self.config.gui.scrollback_lines,
+        )
+        
+        button_frame = ttk.Frame(self)
+        button_frame.pack(pady=10)
+        
+        ttk.Button(
+            button_frame,
+            text="全出力を保存...",
+            command=self.save_output
+        ).pack(side=tk.LEFT, padx=5)
+        
         # 閉じるボタン
         self.close_btn = ttk.Button(
-            self,
+            button_frame,
             text="閉じる",
             command=self.destroy,
             state='disabled'
         )
-        self.close_btn.pack(pady=10)
+        self.close_btn.pack(side=tk.LEFT, padx=5)
         
     def start_execution(self):
         """実行開始"""
-        thread = threading.Thread(target=self._execute_commands, daemon=True)
-        thread.start()
+        # 実行中のコマンドは途中で止めない（ダイアログを閉じても履歴まで保存する）
+        submit(self._execute_commands, name="コマンド実行", priority=PRIORITY_HIGH, long_running=True,
+               cancellable=False)
         
     def _execute_commands(self):
         """コマンド実行"""
         try:
-            # Determine which runner to use
-            runner_type = self.host_config.runner or self.config.runner.default
-            
-            if runner_type == "ssh":
-                if not self.host_config.ssh:
-                    raise Exception(f"Runner for host '{self.host_config.name}' is 'ssh' but no SSH config found.")
-                self.runner = SSHRunner(self.host_config.ssh)
-            elif runner_type == "docker_compose":
-                dc_config = self.host_config.docker_compose or DockerComposeConfig()
-                self.runner = DockerComposeRunner(dc_config)
-            else:
-                raise Exception(f"Unknown runner type '{runner_type}' for host '{self.host_config.name}'.")
+            # ホスト設定に応じたランナー（ssh / docker_compose）
+            self.runner = create_runner(self.host_config, self.config.runner.default, self.config.runner.cache_ttl)
             
             self.runner.connect()
             
-            commands = self.plan.normalized_commands()
+            steps = self.plan.execution_steps()
             
-            for i, cmd in enumerate(commands, 1):
-                self.status_var.set(f"実行中 ({i}/{len(commands)}): {cmd[:50]}...")
-                self.append_output(f"\n[コマンド {i}] {cmd}\n")
-                
-                # コールバック付きで実行
-                exit_code = self.runner.run_command_with_callback(
-                    cmd,
-                    output_callback=self.append_output
-                )
-                
-                self.results.append({"command": cmd, "exit_code": exit_code})
-                
-                if exit_code != 0:
-                    self.append_output(f"\n[エラー] 終了コード: {exit_code}\n")
-                    break
+            def on_event(kind, index, payload):
+                # 並列実行でもステップ順に届く（後のステップの出力は前のステップの終了まで保留）
+                if kind == "start":
+                    self.output_buffer.call(self.status_var.set, f"実行中 ({index + 1}/{len(steps)}): {payload[:50]}...")
+                    self.append_output(f"\n[コマンド {index + 1}] {payload}\n")
+                elif kind == "output":
+                    self.append_output(payload)
+                elif payload["exit_code"] != 0:
+                    self.append_output(f"\n[エラー] 終了コード: {payload['exit_code']}\n")
                 else:
-                    self.append_output(f"\n[成功] 終了コード: 0\n")
+                    cached = " (キャッシュ)" if payload.get("cached") else ""
+                    self.append_output(f"\n[成功] 終了コード: 0{cached}\n")
+            
+            # 独立した読み取り専用のステップは同じSSH接続上で並行して実行
+            run_steps(
+                self.runner, steps, on_event, self.results,
+                max_parallel=self.config.runner.max_parallel,
+                output_max_bytes=self.config.history.output_max_bytes,
+            )
             
             # 履歴保存
             history_append({
                 "host": self.host_config.name,
                 "instruction": self.instruction,
                 "plan": self.plan.model_dump(mode="json"),
+                "model": self.model,
+                "llm": self.llm_usage,
                 "results": self.results,
             })
             
-            self.status_var.set("完了")
-            self.progress.stop()
-            self.close_btn.config(state='normal')
+            self.output_buffer.call(self._on_finished, "完了")
             
         except Exception as e:
             self.append_output(f"\n[エラー] {str(e)}\n")
-            self.status_var.set("エラー")
-            self.progress.stop()
-            self.close_btn.config(state='normal')
+            self.output_buffer.call(self._on_finished, "エラー")
             
         finally:
             if self.runner:
                 self.runner.close()
+            # 実行したコマンドでサイトの状態が変わりうるので先読みしたコンテキストは捨てる
+            get_context_cache().invalidate(self.host_config.name)
+                
+    def _on_finished(self, status: str):
+        """実行終了時のUI更新（Tkスレッド）"""
+        self.status_var.set(status)
+        self.progress.stop()
+        self.close_btn.config(state='normal')
                 
     def append_output(self, text: str):
-        """出力を追加"""
-        self.output_display.insert(tk.END, text)
-        self.output_display.see(tk.END)
+        """出力を追加（どのスレッドからでも可。描画は次のフレームでまとめて行う）"""
+        self.output_buffer.write(text)
+        
+    def save_output(self):
+        """実行ログの全文を保存（スクロールバックで削除された行も含む）"""
+        path = filedialog.asksaveasfilename(
+            parent=self,
+            title="実行ログを保存",
+            defaultextension=".log",
+            filetypes=[("Log", "*.log"), ("Text", "*.txt"), ("All files", "*.*")],
+        )
+        if not path:
+            return
+        try:
+            self.output_buffer.save(path)
+        except Exception as e:
+            messagebox.showerror("保存エラー", f"ログの保存に失敗しました:\n{e}", parent=self)
 
 
 def main():
@@ -5,6 +5,9 @@ Custom widgets for WP-AI GUI
 import tkinter as tk
 from tkinter import ttk
 
+from .event_bus import subscribe
+from .worker_pool import get_worker_pool, STATUS_LABELS
+
 
 class StatusBar(tk.Frame):
     """ステータスバーウィジェット"""
@@ -60,6 +63,11 @@ class ContextControlPanel(tk.Frame):
         self.level_menu = tk.OptionMenu(self, self.log_level_var, "all", "error", "warning", "notice")
         self.level_menu.pack(side=tk.LEFT)
     
+    def on_change(self, callback):
+        """チェックボックス・ログパラメータが変わったときに callback() を呼ぶ"""
+        for var in (self.system_var, self.plugins_var, self.logs_var, self.log_lines_var, self.log_level_var):
+            var.trace_add("write", lambda *_: callback())
+    
     def get_context_types(self):
         """選択されたコンテキストタイプのリストを取得"""
         types = []
@@ -83,3 +91,65 @@ class ContextControlPanel(tk.Frame):
         
         level = self.log_level_var.get().strip()
         return lines, level
+
+
+class TaskMonitor(tk.Frame):
+    """共有ワーカープールのタスク数を表示するモニター
+
+    クリックすると待機中/実行中のタスク一覧を表示し、選んだタスクを
+    キャンセルできる。
+    """
+    
+    def __init__(self, parent):
+        super().__init__(parent)
+        
+        self.pool = get_worker_pool()
+        self.text_var = tk.StringVar(value="タスク: なし")
+        self.label = tk.Label(self, textvariable=self.text_var, anchor="w", cursor="hand2", fg="#666666")
+        self.label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.label.bind("<Button-1>", self.show_menu)
+        
+        # プールの変化通知はどのスレッドからも来るので、1回の描画にまとめる
+        self._pending = False
+        self._events = subscribe(self, self.refresh)
+        self.pool.add_listener(self._on_pool_change)
+        self.bind("<Destroy>", self._on_destroy, add="+")
+        self.refresh()
+    
+    def _on_pool_change(self):
+        if not self._pending:
+            self._pending = True
+            self._events.post()
+    
+    def refresh(self, _message=None):
+        """表示を更新（Tkスレッド）"""
+        self._pending = False
+        tasks = self.pool.snapshot()
+        running = sum(1 for t in tasks if t["status"] == "running")
+        queued = len(tasks) - running
+        if not tasks:
+            self.text_var.set("タスク: なし")
+        else:
+            self.text_var.set(f"タスク: 実行中 {running} / 待機中 {queued}")
+    
+    def show_menu(self, event=None):
+        """タスク一覧（選択でキャンセル）"""
+        menu = tk.Menu(self, tearoff=0)
+        tasks = self.pool.snapshot()
+        if not tasks:
+            menu.add_command(label="実行中のタスクはありません", state="disabled")
+        for task in tasks:
+            status = STATUS_LABELS.get(task['status'], task['status'])
+            if not task["cancellable"]:
+                menu.add_command(label=f"{task['name']} ({status}・中断不可)", state="disabled")
+                continue
+            label = f"キャンセル: {task['name']} ({status})"
+            menu.add_command(label=label, command=lambda handles=task["handles"]: [h.cancel() for h in handles])
+        if sum(1 for t in tasks if t["cancellable"]) > 1:
+            menu.add_separator()
+            menu.add_command(label="すべてキャンセル", command=self.pool.cancel_all)
+        menu.tk_popup(event.x_root, event.y_root)
+    
+    def _on_destroy(self, event):
+        if event.widget is self:
+            self.pool.remove_listener(self._on_pool_change)
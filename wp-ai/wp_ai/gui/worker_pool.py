@@ -0,0 +1,370 @@
+"""
+Shared worker pool for WP-AI GUI background tasks
+
+GUIのバックグラウンド処理（プラン生成、チャット、各ビューアのデータ取得、
+モデル一覧の取得など）を共通のスレッドプールで実行する。
+
+- 優先度: 数値が小さいタスクから実行（同じ優先度は投入順）
+- キャンセル: タスクごとの CancelToken。ワーカー内では current_token() で参照する。
+  cancellable=False のタスク（リモートでのコマンド実行など、途中で止めないもの）は
+  キャンセル・cancel_all の対象外
+- 重複排除: 同じ key のタスクが待機中/実行中なら、新しく実行せず結果を共有する
+- 所有ウィジェット: owner が破棄されるとそのウィンドウのタスクをキャンセルする
+- 長時間タスク: long_running=True のタスク（チャットのストリーミング、プラン生成、
+  コマンド実行など）はプールのワーカーを使わず専用スレッドで実行する。
+  実行中のタスクは横取りできないため、これらがワーカーを占有すると
+  ビューアの取得やプリフェッチが待たされ続けてしまう
+
+コールバック（on_done/on_error）はワーカースレッドで呼ばれる。
+UIを更新する場合はイベントバスのチャネルへ post すること。
+"""
+
+import heapq
+import itertools
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+# タスクの状態
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+STATUS_LABELS = {QUEUED: "待機中", RUNNING: "実行中"}
+
+
+class TaskCancelled(Exception):
+    """キャンセルされたタスク内で raise_if_cancelled() が送出する例外"""
+
+
+class CancelToken:
+    """協調的キャンセル用のトークン"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def add_callback(self, callback: Callable[[], None]):
+        """キャンセル時に呼ぶ関数を登録（キャンセル済みなら即座に呼ぶ）"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise TaskCancelled()
+
+    def wait(self, timeout: float) -> bool:
+        """timeout 秒待つ。キャンセルされたら True を返す"""
+        return self._event.wait(timeout)
+
+
+_NEVER_CANCELLED = CancelToken()
+_local = threading.local()
+
+
+def current_token() -> CancelToken:
+    """実行中タスクのキャンセルトークン（プール外では常に未キャンセル）"""
+    return getattr(_local, "token", _NEVER_CANCELLED)
+
+
+class _Task:
+    def __init__(self, pool: "WorkerPool", fn: Callable, args: tuple, name: str, priority: int, key: Optional[Hashable]):
+        self.pool = pool
+        self.fn = fn
+        self.args = args
+        self.name = name
+        self.priority = priority
+        self.key = key
+        self.token = CancelToken()
+        self.status = QUEUED
+        self.handles: List["TaskHandle"] = []
+        self.dedicated = False  # long_running: プール外の専用スレッドで実行
+        self.cancellable = True
+
+
+class TaskHandle:
+    """submit() の戻り値。呼び出し元ごとに1つ作られる"""
+
+    def __init__(self, task: _Task, on_done: Optional[Callable[[Any], None]], on_error: Optional[Callable[[BaseException], None]]):
+        self._task = task
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+
+    @property
+    def name(self) -> str:
+        return self._task.name
+
+    @property
+    def status(self) -> str:
+        return CANCELLED if self.cancelled else self._task.status
+
+    @property
+    def token(self) -> CancelToken:
+        return self._task.token
+
+    def cancel(self):
+        """この呼び出し元の結果を破棄する
+
+        重複排除で共有されているタスクは、全員がキャンセルしたときだけ止める。
+        """
+        self._task.pool._cancel_handle(self)
+
+
+class WorkerPool:
+    """優先度付きのワーカースレッドプール
+
+    MAX_WORKERS は短いタスク用のワーカー数。long_running のタスクは
+    この数に含まれない。
+    """
+
+    MAX_WORKERS = 4
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self.max_workers = max_workers
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._idle = 0
+        self._tasks: List[_Task] = []
+        self._inflight: Dict[Hashable, _Task] = {}
+        self._listeners: List[Callable[[], None]] = []
+
+    # ===== 投入 =====
+
+    def submit(
+        self,
+        fn: Callable,
+        *args,
+        name: str = "",
+        priority: int = PRIORITY_NORMAL,
+        key: Optional[Hashable] = None,
+        owner=None,
+        on_done: Optional[Callable[[Any], None]] = None,
+        on_error: Optional[Callable[[BaseException], None]] = None,
+        long_running: bool = False,
+        cancellable: bool = True,
+    ) -> TaskHandle:
+        """fn(*args) をプールで実行
+
+        key を指定すると、同じ key のタスクが待機中/実行中の間は
+        それに相乗りし、完了時に同じ結果を受け取る。
+        owner（Tkウィジェット）が破棄されるとキャンセルされる。
+        long_running=True なら専用スレッドですぐに実行する（priority は表示用）。
+        cancellable=False のタスクは cancel() / cancel_all() / owner の破棄で止まらない
+        （トークンを見ないまま副作用を続けるタスクを「キャンセル済み」と表示しないため）。
+        """
+        with self._cond:
+            task = self._inflight.get(key) if key is not None else None
+            if task is None or task.token.cancelled:
+                task = _Task(self, fn, args, name or getattr(fn, "__name__", "task"), priority, key)
+                task.cancellable = cancellable
+                if key is not None:
+                    self._inflight[key] = task
+                self._tasks.append(task)
+                if long_running:
+                    task.dedicated = True
+                    threading.Thread(target=self._run_dedicated, args=(task,), name="wp-ai-long-task", daemon=True).start()
+                else:
+                    heapq.heappush(self._heap, (priority, next(self._seq), task))
+                    self._ensure_worker()
+                    self._cond.notify()
+            elif priority < task.priority and task.status == QUEUED and not task.dedicated:
+                # より高い優先度で再投入（古いエントリは取り出し時に読み飛ばす）
+                task.priority = priority
+                heapq.heappush(self._heap, (priority, next(self._seq), task))
+                self._cond.notify()
+            handle = TaskHandle(task, on_done, on_error)
+            task.handles.append(handle)
+
+        if owner is not None and task.cancellable:
+            self._track_owner(owner, handle)
+        self._notify_listeners()
+        return handle
+
+    def _ensure_worker(self):
+        if len(self._heap) > self._idle and len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._worker_loop, name=f"wp-ai-worker-{len(self._workers) + 1}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    # ===== 実行 =====
+
+    def _next_task(self) -> _Task:
+        with self._cond:
+            while True:
+                while self._heap:
+                    _, _, task = heapq.heappop(self._heap)
+                    if task.status == QUEUED and not task.token.cancelled:
+                        task.status = RUNNING
+                        return task
+                self._idle += 1
+                self._cond.wait()
+                self._idle -= 1
+
+    def _worker_loop(self):
+        while True:
+            self._run(self._next_task())
+
+    def _run_dedicated(self, task: _Task):
+        with self._cond:
+            if task.status != QUEUED or task.token.cancelled:
+                return
+            task.status = RUNNING
+        self._run(task)
+
+    def _run(self, task: _Task):
+        self._notify_listeners()
+        _local.token = task.token
+        result, error = None, None
+        try:
+            result = task.fn(*task.args)
+        except BaseException as e:
+            error = e
+        finally:
+            _local.token = _NEVER_CANCELLED
+        self._finish(task, result, error)
+
+    def _finish(self, task: _Task, result, error):
+        with self._cond:
+            if task.token.cancelled or isinstance(error, TaskCancelled):
+                task.status = CANCELLED
+            else:
+                task.status = FAILED if error is not None else DONE
+            self._forget(task)
+            handles = [h for h in task.handles if not h.cancelled]
+
+        if task.status == FAILED and not any(h.on_error for h in handles):
+            print(f"タスクでエラー ({task.name}): {error}")
+        if task.status != CANCELLED:
+            for handle in handles:
+                callback = handle.on_error if error is not None else handle.on_done
+                if callback is None:
+                    continue
+                try:
+                    callback(error if error is not None else result)
+                except Exception as e:
+                    print(f"タスクのコールバックでエラー ({task.name}): {e}")
+        self._notify_listeners()
+
+    def _forget(self, task: _Task):
+        if task in self._tasks:
+            self._tasks.remove(task)
+        if task.key is not None and self._inflight.get(task.key) is task:
+            del self._inflight[task.key]
+
+    # ===== キャンセル =====
+
+    def _cancel_handle(self, handle: TaskHandle):
+        task = handle._task
+        with self._cond:
+            if handle.cancelled or not task.cancellable:
+                return
+            handle.cancelled = True
+            if any(not h.cancelled for h in task.handles):
+                return
+            if task.status == QUEUED:
+                task.status = CANCELLED
+                self._forget(task)
+        task.token.cancel()
+        self._notify_listeners()
+
+    def cancel_all(self):
+        """待機中・実行中の全タスクをキャンセル"""
+        with self._cond:
+            handles = [h for t in self._tasks for h in t.handles]
+        for handle in handles:
+            handle.cancel()
+
+    def _track_owner(self, owner, handle: TaskHandle):
+        """owner の <Destroy> でキャンセルする（バインドはウィジェットごとに1回）"""
+        handles = getattr(owner, "_wpai_pool_handles", None)
+        if handles is None:
+            handles = owner._wpai_pool_handles = []
+
+            def on_destroy(event, owner=owner):
+                if event.widget is owner:
+                    for h in owner._wpai_pool_handles:
+                        h.cancel()
+                    owner._wpai_pool_handles = []
+
+            owner.bind("<Destroy>", on_destroy, add="+")
+        # 終了済みのハンドルは捨てる
+        handles[:] = [h for h in handles if h.status in (QUEUED, RUNNING)]
+        handles.append(handle)
+
+    # ===== モニター =====
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """待機中/実行中のタスク一覧（実行中が先、次に優先度順）"""
+        with self._cond:
+            tasks = [t for t in self._tasks if t.status in (QUEUED, RUNNING) and not t.token.cancelled]
+            tasks.sort(key=lambda t: (t.status != RUNNING, t.priority))
+            return [
+                {"name": t.name, "status": t.status, "priority": t.priority, "cancellable": t.cancellable,
+                 "handles": [h for h in t.handles if not h.cancelled]}
+                for t in tasks
+            ]
+
+    def add_listener(self, listener: Callable[[], None]):
+        """タスクの状態変化時に呼ぶ関数を登録（どのスレッドからも呼ばれる）"""
+        with self._cond:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]):
+        with self._cond:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _notify_listeners(self):
+        with self._cond:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener()
+            except Exception:
+                pass
+
+
+_pool: Optional[WorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> WorkerPool:
+    """GUI全体で共有するワーカープール"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+        return _pool
+
+
+def submit(fn: Callable, *args, **kwargs) -> TaskHandle:
+    """get_worker_pool().submit(...) の省略形"""
+    return get_worker_pool().submit(fn, *args, **kwargs)
@@ -0,0 +1,854 @@
+"""
+History storage backends for WP-AI
+
+- SQLiteHistoryStore: indexed store (WAL, ts/host/status indexes, FTS)
+- JsonlHistoryStore: history.jsonl with rotated, compressed segments
+
+Both also keep the LLM call records of llm_metrics (append_llm_call /
+iter_llm_calls), under the same rotation and retention as the history.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import zlib
+import re
+import sqlite3
+import threading
+import warnings
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from .config import HISTORY_DB, HISTORY_FILE, LLM_CALLS_FILE, HistoryConfig, ensure_config_dir
+
+
+def utc_timestamp() -> str:
+    """Timestamp in the format used by history entries."""
+    return datetime.datetime.utcnow().isoformat() + "Z"
+
+
+def entry_status(entry: Dict[str, Any]) -> str:
+    """Return 'success', 'failed' or 'unknown' based on the last result."""
+    results = entry.get("results") or []
+    if not results:
+        return "unknown"
+    return "success" if results[-1].get("exit_code", -1) == 0 else "failed"
+
+
+def entry_commands(entry: Dict[str, Any]) -> List[str]:
+    """Commands of the plan stored in an entry (commands or steps[*].cmd)."""
+    plan = entry.get("plan") or {}
+    commands = plan.get("commands") or [s.get("cmd") for s in plan.get("steps") or [] if s.get("cmd")]
+    return [c for c in commands if c]
+
+
+def entry_search_fields(entry: Dict[str, Any]) -> Dict[str, str]:
+    """Text indexed for full-text search: instruction, commands, intent/reason, output."""
+    plan = entry.get("plan") or {}
+    outputs = [r.get("output") for r in entry.get("results") or [] if isinstance(r.get("output"), str)]
+    return {
+        "instruction": entry.get("instruction") or "",
+        "commands": "\n".join(entry_commands(entry)),
+        "plan_text": "\n".join(t for t in (plan.get("intent"), plan.get("reason")) if t),
+        "output": "\n".join(outputs),
+    }
+
+
+def parse_since(value: str) -> str:
+    """Convert '7d' / '12h' / '30m' or an ISO date(time) into a comparable ts string."""
+    value = value.strip()
+    m = re.fullmatch(r"(\d+)([dhm])", value)
+    if m:
+        unit = {"d": "days", "h": "hours", "m": "minutes"}[m.group(2)]
+        dt = datetime.datetime.utcnow() - datetime.timedelta(**{unit: int(m.group(1))})
+        return dt.isoformat() + "Z"
+    # Validate; ISO strings compare correctly against stored timestamps
+    datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value
+
+
+def read_lines_reverse(path: Path, block_size: int = 64 * 1024) -> Iterator[str]:
+    """Yield the lines of a text file from last to first.
+
+    Reads fixed-size blocks backwards from the end of the file, so only the
+    trailing bytes are touched when the caller stops early.
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b""
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size) + remainder
+            lines = block.split(b"\n")
+            # The first piece may be a partial line; keep it for the next block
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line.decode("utf-8", errors="replace")
+        if remainder.strip():
+            yield remainder.decode("utf-8", errors="replace")
+
+
+class OutputCapture:
+    """Collects command output, keeping only the head and tail within max_bytes.
+
+    max_bytes = 0 disables capturing.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.head_limit = max_bytes // 2
+        self.tail_limit = max_bytes - self.head_limit
+        self._head = bytearray()
+        self._tail = bytearray()
+        self.total_bytes = 0
+
+    def write(self, text: str) -> None:
+        if self.max_bytes <= 0:
+            return
+        data = text.encode("utf-8", errors="replace")
+        self.total_bytes += len(data)
+        room = self.head_limit - len(self._head)
+        if room > 0:
+            self._head += data[:room]
+            data = data[room:]
+        if data:
+            self._tail += data
+            if len(self._tail) > self.tail_limit:
+                del self._tail[:len(self._tail) - self.tail_limit]
+
+    @property
+    def omitted_bytes(self) -> int:
+        return self.total_bytes - len(self._head) - len(self._tail)
+
+    def text(self) -> str:
+        head = self._head.decode("utf-8", errors="ignore")
+        tail = self._tail.decode("utf-8", errors="ignore")
+        if self.omitted_bytes > 0:
+            return f"{head}\n... [{self.omitted_bytes} bytes omitted] ...\n{tail}"
+        return head + tail
+
+    def result_fields(self) -> Dict[str, Any]:
+        """Fields to merge into a history result (empty when capturing is off)"""
+        if self.max_bytes <= 0:
+            return {}
+        return {"output": self.text(), "output_bytes": self.total_bytes, "output_truncated": self.omitted_bytes > 0}
+
+
+def output_digest(text: str) -> str:
+    """Content address used as output_ref (identical outputs share one blob)"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+class HistoryStore:
+    """Base class for history backends
+
+    Results may carry an "output" string; append() moves it into a
+    compressed blob and stores only "output_ref" in the entry.
+    """
+
+    # True when search() is backed by an index (otherwise it scans)
+    supports_search = False
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        """Store one entry (must already contain 'ts')"""
+        raise NotImplementedError
+
+    def query(self, limit: Optional[int] = 20, host: Optional[str] = None, status: Optional[str] = None,
+              since: Optional[str] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """Return matching entries, newest first"""
+        raise NotImplementedError
+
+    def put_output(self, text: str) -> str:
+        """Store command output and return its reference"""
+        raise NotImplementedError
+
+    def get_output(self, ref: str) -> Optional[str]:
+        """Load command output stored by put_output (None if missing)"""
+        raise NotImplementedError
+
+    def _extract_outputs(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Replace results[*].output with output_ref blobs"""
+        if not any("output" in r for r in entry.get("results") or []):
+            return entry
+        results = []
+        for result in entry["results"]:
+            result = dict(result)
+            text = result.pop("output", None)
+            if isinstance(text, str) and text:
+                result["output_ref"] = self.put_output(text)
+            results.append(result)
+        return {**entry, "results": results}
+
+    def _inline_outputs(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Inverse of _extract_outputs (used for self-contained exports)"""
+        if not any("output_ref" in r for r in entry.get("results") or []):
+            return entry
+        results = []
+        for result in entry["results"]:
+            result = dict(result)
+            ref = result.pop("output_ref", None)
+            if ref:
+                text = self.get_output(ref)
+                if text is not None:
+                    result["output"] = text
+            results.append(result)
+        return {**entry, "results": results}
+
+    def iter_entries(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over all entries, oldest first"""
+        raise NotImplementedError
+
+    def append_llm_call(self, record: Dict[str, Any]) -> None:
+        """Store one LLM call record (see llm_metrics; must contain 'ts')"""
+        raise NotImplementedError
+
+    def iter_llm_calls(self, since: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Iterate over LLM call records with ts >= since (all if None)"""
+        raise NotImplementedError
+
+    def iter_recent(self, page_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """Iterate over all entries, newest first, fetching page_size at a time"""
+        offset = 0
+        while True:
+            page = self.query(limit=page_size, offset=offset)
+            if not page:
+                return
+            yield from page
+            offset += len(page)
+
+    def search(self, text: str, limit: int = 50, host: Optional[str] = None,
+               since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return entries containing every term of text, best matches first.
+
+        Generic implementation: scans newest first and ranks by the number of
+        term occurrences.
+        """
+        terms = [t.lower() for t in text.split() if t]
+        if not terms:
+            return []
+        scored = []
+        for position, entry in enumerate(self.iter_recent()):
+            if since and entry.get("ts", "") < since:
+                break
+            if not _matches(entry, host, None, None):
+                continue
+            haystack = "\n".join(entry_search_fields(entry).values()).lower()
+            if all(t in haystack for t in terms):
+                scored.append((-sum(haystack.count(t) for t in terms), position, entry))
+        scored.sort(key=lambda x: (x[0], x[1]))
+        return [entry for _, _, entry in scored[:limit]]
+
+    def export_jsonl(self, path: Path) -> int:
+        """Write all entries (with output inlined) to a jsonl file. Returns the number written."""
+        count = 0
+        with open(path, "w", encoding="utf-8") as f:
+            for entry in map(self._inline_outputs, self.iter_entries()):
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                count += 1
+        return count
+
+    def close(self) -> None:
+        pass
+
+
+class JsonlHistoryStore(HistoryStore):
+    """history.jsonl backend (one JSON object per line)
+
+    The active file is rotated into segments named
+    ``history-<first ts>.jsonl[.gz|.zst]`` next to it, monthly and/or by
+    size. Readers go through the active file and then the segments,
+    newest first. LLM call records go to a sibling llm_calls.jsonl that is
+    rotated the same way.
+    """
+
+    SEGMENT_SUFFIXES = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+
+    def __init__(self, path: Path = HISTORY_FILE, config: Optional[HistoryConfig] = None):
+        self.path = path
+        self.config = config or HistoryConfig()
+        self.output_dir = path.parent / "outputs"
+        self._lock = threading.Lock()
+        self._active_period: Optional[str] = None
+        self._llm_calls: Optional["JsonlHistoryStore"] = None
+
+    def put_output(self, text: str) -> str:
+        ref = output_digest(text)
+        blob = self.output_dir / f"{ref}.z"
+        if blob.exists():
+            # Keep shared blobs alive for retention
+            os.utime(blob)
+        else:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            blob.write_bytes(zlib.compress(text.encode("utf-8")))
+        return ref
+
+    def get_output(self, ref: str) -> Optional[str]:
+        blob = self.output_dir / f"{ref}.z"
+        if not blob.exists():
+            return None
+        return zlib.decompress(blob.read_bytes()).decode("utf-8", errors="replace")
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        entry = self._extract_outputs(entry)
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._maybe_rotate(entry.get("ts", ""))
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            if self._active_period is None:
+                self._active_period = entry.get("ts", "")[:7]
+
+    # ----- rotation -----
+
+    def _first_ts(self) -> str:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        return json.loads(line).get("ts", "")
+                    except json.JSONDecodeError:
+                        return ""
+        return ""
+
+    def _maybe_rotate(self, ts: str) -> None:
+        if not self.path.exists() or self.path.stat().st_size == 0:
+            self._active_period = None
+            return
+        if self._active_period is None:
+            self._active_period = self._first_ts()[:7]
+        monthly = self.config.rotate == "monthly" and self._active_period and ts[:7] != self._active_period
+        too_big = self.config.max_bytes > 0 and self.path.stat().st_size >= self.config.max_bytes
+        if monthly or too_big:
+            self.rotate()
+
+    def rotate(self) -> Optional[Path]:
+        """Move the active file into a (compressed) segment and apply retention."""
+        if not self.path.exists():
+            return None
+        segment = self._segment_path(self._first_ts() or utc_timestamp())
+        os.replace(self.path, segment)
+        self._active_period = None
+
+        compression = self.config.compression
+        if compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                warnings.warn("history compression 'zstd' needs the zstandard package "
+                              "(pip install 'wp-ai[zstd]'); using gzip", RuntimeWarning)
+                compression = "gzip"
+        if compression != "none":
+            target = segment.with_name(segment.name + self.SEGMENT_SUFFIXES[compression])
+            data = segment.read_bytes()
+            if compression == "zstd":
+                target.write_bytes(zstandard.ZstdCompressor().compress(data))
+            else:
+                import gzip
+                target.write_bytes(gzip.compress(data))
+            segment.unlink()
+            segment = target
+
+        self.apply_retention()
+        return segment
+
+    def _segment_path(self, first_ts: str) -> Path:
+        """Unused (uncompressed) segment name for entries starting at first_ts"""
+        stamp = re.sub(r"[^0-9T]", "", first_ts.split(".")[0])
+        segment = self.path.with_name(f"{self.path.stem}-{stamp}{self.path.suffix}")
+        n = 1
+        while any(segment.with_name(segment.name + sfx).exists() for sfx in self.SEGMENT_SUFFIXES.values()):
+            segment = self.path.with_name(f"{self.path.stem}-{stamp}.{n}{self.path.suffix}")
+            n += 1
+        return segment
+
+    def segments(self) -> List[Path]:
+        """Rotated segments, newest first"""
+        pattern = f"{self.path.stem}-*{self.path.suffix}*"
+        return sorted(self.path.parent.glob(pattern), key=lambda p: p.name, reverse=True)
+
+    def apply_retention(self) -> int:
+        """Delete segments older than retention_days. Returns the number removed."""
+        if self.config.retention_days <= 0:
+            return 0
+        cutoff = datetime.datetime.now().timestamp() - self.config.retention_days * 86400
+        removed = 0
+        for segment in self.segments():
+            # mtime is the rotation time, i.e. roughly the newest entry in the segment
+            if segment.stat().st_mtime < cutoff:
+                segment.unlink()
+                removed += 1
+        if self.output_dir.exists():
+            for blob in self.output_dir.glob("*.z"):
+                if blob.stat().st_mtime < cutoff:
+                    blob.unlink()
+        return removed
+
+    # ----- reading -----
+
+    @staticmethod
+    def _read_segment_lines(segment: Path) -> List[str]:
+        if segment.suffix == ".gz":
+            import gzip
+            data = gzip.decompress(segment.read_bytes())
+        elif segment.suffix == ".zst":
+            import zstandard
+            data = zstandard.ZstdDecompressor().decompressobj().decompress(segment.read_bytes())
+        else:
+            data = segment.read_bytes()
+        return data.decode("utf-8", errors="replace").splitlines()
+
+    @staticmethod
+    def _parse_lines(lines) -> Iterator[Dict[str, Any]]:
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+    def has_entries(self) -> bool:
+        return self.path.exists() or bool(self.segments())
+
+    def iter_entries(self) -> Iterator[Dict[str, Any]]:
+        for segment in reversed(self.segments()):
+            yield from self._parse_lines(self._read_segment_lines(segment))
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                yield from self._parse_lines(f)
+
+    def iter_entries_reverse(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over all entries, newest first.
+
+        The active file is read backwards block by block; older segments are
+        only opened (and decompressed) when the caller keeps iterating.
+        """
+        if self.path.exists():
+            yield from self._parse_lines(read_lines_reverse(self.path))
+        for segment in self.segments():
+            if segment.suffix in (".gz", ".zst"):
+                yield from self._parse_lines(reversed(self._read_segment_lines(segment)))
+            else:
+                yield from self._parse_lines(read_lines_reverse(segment))
+
+    def iter_recent(self, page_size: int = 500) -> Iterator[Dict[str, Any]]:
+        return self.iter_entries_reverse()
+
+    def query(self, limit: Optional[int] = 20, host: Optional[str] = None, status: Optional[str] = None,
+              since: Optional[str] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        matched: List[Dict[str, Any]] = []
+        skipped = 0
+        for entry in self.iter_entries_reverse():
+            # Entries are appended in time order, so everything further back is older
+            if since and entry.get("ts", "") < since:
+                break
+            if not _matches(entry, host, status, None):
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            matched.append(entry)
+            if limit is not None and len(matched) >= limit:
+                break
+        return matched
+
+    # ----- LLM call records -----
+
+    @property
+    def llm_calls(self) -> "JsonlHistoryStore":
+        """Store of the LLM call records (llm_calls.jsonl next to the history file)"""
+        if self._llm_calls is None:
+            self._llm_calls = JsonlHistoryStore(self.path.with_name(LLM_CALLS_FILE.name), self.config)
+        return self._llm_calls
+
+    def append_llm_call(self, record: Dict[str, Any]) -> None:
+        self.llm_calls.append(record)
+
+    def iter_llm_calls(self, since: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        for record in self.llm_calls.iter_entries_reverse():
+            if since and record.get("ts", "") < since:
+                break
+            yield record
+
+    def adopt_legacy_llm_calls(self) -> None:
+        """Turn llm_calls.jsonl.1 (the former size-based rotation) into a regular segment."""
+        store = self.llm_calls
+        legacy = store.path.with_name(store.path.name + ".1")
+        if legacy.exists():
+            first_ts = JsonlHistoryStore(legacy)._first_ts() or utc_timestamp()
+            os.replace(legacy, store._segment_path(first_ts))
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """SQLite backend with indexes on ts/host/status and FTS on instruction/commands
+
+    LLM call records live in their own llm_calls table.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TEXT NOT NULL,
+            host TEXT,
+            instruction TEXT,
+            status TEXT,
+            entry TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_history_ts ON history(ts);
+        CREATE INDEX IF NOT EXISTS idx_history_host_ts ON history(host, ts);
+        CREATE INDEX IF NOT EXISTS idx_history_status_ts ON history(status, ts);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS outputs (
+            ref TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS llm_calls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TEXT NOT NULL,
+            record TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_llm_calls_ts ON llm_calls(ts);
+    """
+
+    # Bump when the history_fts columns change; the index is rebuilt on open
+    FTS_VERSION = "2"
+    FTS_COLUMNS = ("instruction", "commands", "plan_text", "output")
+
+    def __init__(self, path: Path = HISTORY_DB):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Reentrant: put_output is also called while an append holds the lock
+        self._lock = threading.RLock()
+        # GUI workers append from background threads; access is serialized by _lock
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.has_fts = False
+        self.trigram = False
+        self._init_fts()
+        self.supports_search = self.has_fts
+        self.conn.commit()
+
+    def _init_fts(self) -> None:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'fts_version'").fetchone()
+        rebuild = not row or row[0] != self.FTS_VERSION
+        if rebuild:
+            self.conn.execute("DROP TABLE IF EXISTS history_fts")
+        columns = ", ".join(self.FTS_COLUMNS)
+        # trigram matches substrings, which also works for Japanese text without word breaks
+        for tokenize in ("trigram", "unicode61"):
+            try:
+                self.conn.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5({columns}, tokenize='{tokenize}')"
+                )
+            except sqlite3.OperationalError:
+                # Tokenizer (or FTS5 itself) not available in this SQLite build
+                continue
+            self.has_fts = True
+            sql = self.conn.execute("SELECT sql FROM sqlite_master WHERE name = 'history_fts'").fetchone()[0]
+            self.trigram = "trigram" in sql
+            break
+        if not self.has_fts:
+            return
+        if rebuild:
+            for row_id, entry in self.conn.execute("SELECT id, entry FROM history").fetchall():
+                self._index(row_id, entry_search_fields(self._inline_outputs(json.loads(entry))))
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fts_version', ?)", (self.FTS_VERSION,))
+
+    def _index(self, row_id: int, fields: Dict[str, str]) -> None:
+        self.conn.execute(
+            f"INSERT INTO history_fts (rowid, {', '.join(self.FTS_COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+            (row_id, *[fields[c] for c in self.FTS_COLUMNS]),
+        )
+
+    def put_output(self, text: str) -> str:
+        ref = output_digest(text)
+        data = zlib.compress(text.encode("utf-8"))
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO outputs (ref, size, data) VALUES (?, ?, ?)", (ref, len(text), data)
+            )
+        return ref
+
+    def get_output(self, ref: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute("SELECT data FROM outputs WHERE ref = ?", (ref,)).fetchone()
+        if not row:
+            return None
+        return zlib.decompress(row[0]).decode("utf-8", errors="replace")
+
+    def _insert(self, entry: Dict[str, Any]) -> None:
+        # Index the full text before outputs are moved into blobs
+        fields = entry_search_fields(entry)
+        entry = self._extract_outputs(entry)
+        cur = self.conn.execute(
+            "INSERT INTO history (ts, host, instruction, status, entry) VALUES (?, ?, ?, ?, ?)",
+            (
+                entry.get("ts", ""),
+                entry.get("host"),
+                entry.get("instruction"),
+                entry_status(entry),
+                json.dumps(entry, ensure_ascii=False),
+            ),
+        )
+        if self.has_fts:
+            self._index(cur.lastrowid, fields)
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            with self.conn:
+                self._insert(entry)
+
+    def _where(self, host: Optional[str], status: Optional[str], since: Optional[str]):
+        clauses, params = [], []
+        if host:
+            clauses.append("host = ?")
+            params.append(host)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if since:
+            clauses.append("ts >= ?")
+            params.append(since)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, limit: Optional[int] = 20, host: Optional[str] = None, status: Optional[str] = None,
+              since: Optional[str] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        where, params = self._where(host, status, since)
+        sql = f"SELECT entry FROM history{where} ORDER BY ts DESC, id DESC LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def search(self, text: str, limit: int = 50, host: Optional[str] = None,
+               since: Optional[str] = None) -> List[Dict[str, Any]]:
+        if not self.has_fts:
+            return super().search(text, limit=limit, host=host, since=since)
+        terms = [t for t in text.split() if t]
+        if not terms:
+            return []
+
+        where, params = self._where(host, None, since)
+        extra = where.replace(" WHERE ", " AND ") if where else ""
+        if self.trigram and any(len(t) < 3 for t in terms):
+            # trigram needs 3+ characters per term; fall back to LIKE on the FTS columns
+            like = " AND ".join(
+                "(" + " OR ".join(f"f.{c} LIKE ? ESCAPE '\\'" for c in self.FTS_COLUMNS) + ")" for _ in terms
+            )
+            like_params = [f"%{_escape_like(t)}%" for t in terms for _ in self.FTS_COLUMNS]
+            sql = (f"SELECT h.entry FROM history_fts f JOIN history h ON h.id = f.rowid "
+                   f"WHERE {like}{extra} ORDER BY h.ts DESC LIMIT ?")
+            query_params = like_params + params + [limit]
+        else:
+            match = " ".join('"' + t.replace('"', '""') + '"' for t in terms)
+            sql = (f"SELECT h.entry FROM history_fts f JOIN history h ON h.id = f.rowid "
+                   f"WHERE history_fts MATCH ?{extra} ORDER BY bm25(history_fts), h.ts DESC LIMIT ?")
+            query_params = [match] + params + [limit]
+        with self._lock:
+            rows = self.conn.execute(sql, query_params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def iter_recent(self, page_size: int = 500) -> Iterator[Dict[str, Any]]:
+        # Keyset pagination on (ts, id) keeps every page an index range scan
+        cursor = None
+        while True:
+            if cursor is None:
+                sql, params = "SELECT ts, id, entry FROM history ORDER BY ts DESC, id DESC LIMIT ?", [page_size]
+            else:
+                sql = ("SELECT ts, id, entry FROM history WHERE ts < ? OR (ts = ? AND id < ?) "
+                       "ORDER BY ts DESC, id DESC LIMIT ?")
+                params = [cursor[0], cursor[0], cursor[1], page_size]
+            with self._lock:
+                rows = self.conn.execute(sql, params).fetchall()
+            if not rows:
+                return
+            for ts, row_id, entry in rows:
+                yield json.loads(entry)
+            cursor = (rows[-1][0], rows[-1][1])
+
+    def count(self, host: Optional[str] = None, status: Optional[str] = None, since: Optional[str] = None) -> int:
+        where, params = self._where(host, status, since)
+        with self._lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM history{where}", params).fetchone()[0]
+
+    def iter_entries(self) -> Iterator[Dict[str, Any]]:
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT id, entry FROM history WHERE id > ? ORDER BY id LIMIT 1000", (last_id,)
+                ).fetchall()
+            if not rows:
+                return
+            for row_id, entry in rows:
+                last_id = row_id
+                yield json.loads(entry)
+
+    def append_llm_call(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO llm_calls (ts, record) VALUES (?, ?)",
+                    (record.get("ts", ""), json.dumps(record, ensure_ascii=False)),
+                )
+
+    def iter_llm_calls(self, since: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT id, record FROM llm_calls WHERE id > ? AND ts >= ? ORDER BY id LIMIT 1000",
+                    (last_id, since or ""),
+                ).fetchall()
+            if not rows:
+                return
+            for row_id, record in rows:
+                last_id = row_id
+                yield json.loads(record)
+
+    def import_llm_calls(self, path: Path) -> int:
+        """Import LLM call records from llm_calls.jsonl (and its former .1 rotation).
+
+        Returns the number imported.
+        """
+        count = 0
+        with self._lock:
+            with self.conn:
+                for source in (path.with_name(path.name + ".1"), path):
+                    if not source.exists():
+                        continue
+                    with open(source, "r", encoding="utf-8") as f:
+                        for record in JsonlHistoryStore._parse_lines(f):
+                            self.conn.execute(
+                                "INSERT INTO llm_calls (ts, record) VALUES (?, ?)",
+                                (record.get("ts", ""), json.dumps(record, ensure_ascii=False)),
+                            )
+                            count += 1
+        return count
+
+    def import_jsonl(self, path: Path) -> int:
+        """Import entries from a history.jsonl file (and its rotated segments).
+
+        Returns the number imported.
+        """
+        count = 0
+        with self._lock:
+            with self.conn:
+                for entry in JsonlHistoryStore(path).iter_entries():
+                    self._insert(entry)
+                    count += 1
+        return count
+
+    def prune(self, before_ts: str) -> int:
+        """Delete entries older than before_ts. Returns the number deleted."""
+        with self._lock:
+            with self.conn:
+                if self.has_fts:
+                    self.conn.execute(
+                        "DELETE FROM history_fts WHERE rowid IN (SELECT id FROM history WHERE ts < ?)", (before_ts,)
+                    )
+                cur = self.conn.execute("DELETE FROM history WHERE ts < ?", (before_ts,))
+                if cur.rowcount:
+                    self._delete_orphan_outputs()
+                self.conn.execute("DELETE FROM llm_calls WHERE ts < ?", (before_ts,))
+        return cur.rowcount
+
+    def _delete_orphan_outputs(self) -> None:
+        try:
+            self.conn.execute(
+                "DELETE FROM outputs WHERE ref NOT IN ("
+                " SELECT json_extract(r.value, '$.output_ref')"
+                " FROM history, json_each(history.entry, '$.results') AS r"
+                " WHERE json_extract(r.value, '$.output_ref') IS NOT NULL)"
+            )
+        except sqlite3.OperationalError:
+            # SQLite without JSON1: keep the blobs
+            pass
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            with self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self) -> None:
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+def _escape_like(term: str) -> str:
+    """Make % and _ in a search term match literally (with ESCAPE '\\')"""
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _matches(entry: Dict[str, Any], host: Optional[str], status: Optional[str], since: Optional[str]) -> bool:
+    if host and entry.get("host") != host:
+        return False
+    if status and entry_status(entry) != status:
+        return False
+    if since and entry.get("ts", "") < since:
+        return False
+    return True
+
+
+_store: Optional[HistoryStore] = None
+_store_lock = threading.Lock()
+
+
+def open_history_store(config: Optional[HistoryConfig] = None) -> HistoryStore:
+    """Create a history store for the configured backend.
+
+    On the first open of the SQLite backend, an existing history.jsonl and
+    llm_calls.jsonl are imported once so earlier runs stay visible.
+    """
+    ensure_config_dir()
+    config = config or HistoryConfig()
+    if config.backend == "jsonl":
+        store = JsonlHistoryStore(HISTORY_FILE, config)
+        store.adopt_legacy_llm_calls()
+        store.apply_retention()
+        store.llm_calls.apply_retention()
+        return store
+    if config.backend != "sqlite":
+        raise ValueError(f"Unknown history backend '{config.backend}'.")
+
+    store = SQLiteHistoryStore(HISTORY_DB)
+    if JsonlHistoryStore(HISTORY_FILE).has_entries() and not store.get_meta("jsonl_imported"):
+        store.import_jsonl(HISTORY_FILE)
+        store.set_meta("jsonl_imported", utc_timestamp())
+    if not store.get_meta("llm_calls_imported"):
+        store.import_llm_calls(LLM_CALLS_FILE)
+        store.set_meta("llm_calls_imported", utc_timestamp())
+    if config.retention_days > 0:
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=config.retention_days)
+        store.prune(cutoff.isoformat() + "Z")
+    return store
+
+
+def get_history_store() -> HistoryStore:
+    """Shared history store for the current process"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            from .config import load_config
+            _store = open_history_store(load_config().history)
+        return _store
@@ -0,0 +1,183 @@
+"""
+asyncio HTTP client for WP-AI
+
+A thin layer over httpx.AsyncClient that keeps the small interface the rest
+of the code uses (status / raise_for_status / json / iter_lines ...) and
+maps transport failures to HTTPError. httpx does the protocol work:
+keep-alive pooling, redirects, gzip/deflate, and -- with trust_env --
+HTTP(S)_PROXY / NO_PROXY and SSL_CERT_FILE / SSL_CERT_DIR. A CA bundle in
+REQUESTS_CA_BUNDLE or CURL_CA_BUNDLE is honoured as well, as the
+requests-based code did.
+
+The timeout applies to each network operation (connect, each read), not to
+the whole response, so long streams stay open while data keeps arriving.
+"""
+
+import os
+import ssl
+import threading
+from typing import Any, AsyncIterator, Dict, Optional, Tuple, Union
+
+import httpx
+
+DEFAULT_TIMEOUT = 15.0
+MAX_REDIRECTS = 5
+USER_AGENT = "wp-ai"
+
+
+class HTTPError(Exception):
+    """Transport-level HTTP failure (connection, protocol, timeout)."""
+
+
+class HTTPStatusError(HTTPError):
+    """Raised by Response.raise_for_status() for 4xx/5xx responses."""
+
+    def __init__(self, status: int, reason: str, url: str, body: bytes = b""):
+        kind = "Client" if status < 500 else "Server"
+        super().__init__(f"{status} {kind} Error: {reason} for url: {url}")
+        self.status = status
+        self.reason = reason
+        self.url = url
+        self.body = body
+
+
+def _transport_error(e: httpx.HTTPError, url: str) -> HTTPError:
+    if isinstance(e, httpx.TimeoutException):
+        return HTTPError(f"Read timed out for url: {url}")
+    return HTTPError(f"Request to {url} failed: {e}")
+
+
+def _ssl_verify(verify: bool) -> Union[bool, ssl.SSLContext]:
+    if not verify:
+        return False
+    bundle = os.environ.get("REQUESTS_CA_BUNDLE") or os.environ.get("CURL_CA_BUNDLE")
+    if bundle:
+        if os.path.isdir(bundle):
+            return ssl.create_default_context(capath=bundle)
+        return ssl.create_default_context(cafile=bundle)
+    return True
+
+
+class Response:
+    """HTTP response. The body is read lazily for streaming requests."""
+
+    def __init__(self, response: httpx.Response):
+        self._response = response
+        self.url = str(response.url)
+        self.status = response.status_code
+        self.reason = response.reason_phrase
+        self.headers = response.headers
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            body = self._response.content if self._response.is_stream_consumed else b""
+            raise HTTPStatusError(self.status, self.reason, self.url, body)
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        """Yield the (decompressed) body as it arrives."""
+        try:
+            async for chunk in self._response.aiter_bytes():
+                yield chunk
+        except httpx.HTTPError as e:
+            raise _transport_error(e, self.url) from e
+        except httpx.StreamConsumed as e:
+            raise HTTPError("Response body already consumed") from e
+
+    async def iter_lines(self) -> AsyncIterator[str]:
+        """Yield decoded lines (without line endings) as they arrive."""
+        try:
+            async for line in self._response.aiter_lines():
+                yield line
+        except httpx.HTTPError as e:
+            raise _transport_error(e, self.url) from e
+
+    async def read(self) -> bytes:
+        try:
+            return await self._response.aread()
+        except httpx.HTTPError as e:
+            raise _transport_error(e, self.url) from e
+
+    async def text(self) -> str:
+        await self.read()
+        return self._response.text
+
+    async def json(self) -> Any:
+        await self.read()
+        return self._response.json()
+
+    async def aclose(self):
+        """Discard the rest of the body and release the connection."""
+        await self._response.aclose()
+
+
+class AsyncHTTPClient:
+    """Keep-alive HTTP client bound to the event loop it is first used on."""
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, max_idle_per_host: int = 4,
+                 headers: Optional[Dict[str, str]] = None, verify: bool = True):
+        self.timeout = timeout
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            headers={"User-Agent": USER_AGENT, **(headers or {})},
+            verify=_ssl_verify(verify),
+            trust_env=True,
+            follow_redirects=True,
+            max_redirects=MAX_REDIRECTS,
+            limits=httpx.Limits(max_keepalive_connections=max_idle_per_host * 4),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def request(self, method: str, url: str, *, params: Optional[Dict[str, Any]] = None,
+                      json: Any = None, data: Optional[bytes] = None,
+                      headers: Optional[Dict[str, str]] = None,
+                      auth: Optional[Tuple[str, str]] = None,
+                      timeout: Optional[float] = None, stream: bool = False) -> Response:
+        """Send a request. With stream=False the body is read before returning."""
+        if params:
+            params = {k: v for k, v in params.items() if v is not None}
+        try:
+            request = self._client.build_request(
+                method.upper(), url, params=params or None, json=json, content=data, headers=headers,
+                timeout=self.timeout if timeout is None else timeout,
+            )
+            response = await self._client.send(request, auth=auth, stream=stream)
+        except httpx.HTTPError as e:
+            raise _transport_error(e, url) from e
+        except httpx.InvalidURL as e:
+            raise HTTPError(f"Unsupported URL: {url}") from e
+        return Response(response)
+
+    async def get(self, url: str, **kwargs) -> Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> Response:
+        return await self.request("POST", url, **kwargs)
+
+
+_shared: Optional[AsyncHTTPClient] = None
+_shared_lock = threading.Lock()
+
+
+def shared_client() -> AsyncHTTPClient:
+    """Client for the shared aio loop (used by the sync wrappers).
+
+    Connections belong to the loop they were opened on, so only use this
+    from coroutines running via wp_ai.aio.run_sync().
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = AsyncHTTPClient()
+        return _shared
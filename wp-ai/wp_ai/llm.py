@@ -1,80 +1,393 @@
+import asyncio
+import datetime
+import itertools
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Type
+
 import google.generativeai as genai
+from pydantic import BaseModel
+from .aio import iterate_sync, run_sync
 from .config import get_api_key, LLMConfig
+from .http_client import shared_client
+from .openai_compat import AsyncOpenAICompatClient, OpenAIStatusError
+from .llm_metrics import CallMeter
+from .prompt_cache import get_prompt_cache, prompt_key
+from .resilience import ResilientCall, classify_error, FATAL, NOT_FOUND, RATE_LIMIT, TRANSIENT
+from .structured import json_schema, openapi_schema
+
+# Gemini models bound to cached content, shared by all clients: prompt key -> (handle, model)
+_cached_models: Dict[str, Tuple[str, Any]] = {}
+_cached_models_lock = threading.Lock()
 
 class LLMClient:
-    def __init__(self, config: LLMConfig):
+    """LLM client with per-call deadline, retries and model fallback.
+
+    Every call goes through a ResilientCall over [model] + fallback_models;
+    the model that answered is kept in ``last_model``, and the call's token
+    and latency record (see llm_metrics) in ``last_usage``.
+
+    Providers: "gemini" (google-generativeai) and "openai", which speaks the
+    OpenAI chat completions API to ``base_url`` (api.openai.com by default,
+    or a self-hosted vLLM / llama.cpp server; no API key needed there).
+    """
+
+    def __init__(self, config: LLMConfig, call_type: str = "generate"):
         self.config = config
+        self.call_type = call_type  # e.g. "plan", "chat"; groups calls in `wp-ai stats llm`
         self.api_key = get_api_key(config.provider)
-        if not self.api_key:
+        if not self.api_key and not (config.provider == "openai" and config.base_url):
             raise ValueError(f"API Key for {config.provider} not found. Please set it using 'wp-ai init' or environment variable.")
 
+        self.last_model: Optional[str] = None
+        self.last_usage: Optional[Dict[str, Any]] = None
+        self._models = {}
+        self._openai_client: Optional[AsyncOpenAICompatClient] = None
+        self._schema_unsupported = False  # the OpenAI-compatible server rejected response_format
         if config.provider == "gemini":
             genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel(config.model)
-        else:
-            # TODO: Implement OpenAI
+            self.model = self._gemini_model(config.model)
+        elif config.provider != "openai":
             raise NotImplementedError(f"Provider {config.provider} not yet implemented.")
 
-    def generate_content(self, prompt: str) -> str:
-        """Generate content from the LLM."""
+    def models(self) -> List[str]:
+        """Models to try, in order."""
+        return [self.config.model] + list(self.config.fallback_models)
+
+    def _call(self) -> ResilientCall:
+        return ResilientCall(self.config.provider, self.models(), self.config)
+
+    def _gemini_model(self, name: str, system_instruction: Optional[str] = None):
+        if system_instruction:
+            return genai.GenerativeModel(name, system_instruction=system_instruction)
+        if name not in self._models:
+            self._models[name] = genai.GenerativeModel(name)
+        return self._models[name]
+
+    @staticmethod
+    def _request_options(timeout: Optional[float]) -> dict:
+        return {"timeout": timeout} if timeout else {}
+
+    def _openai(self) -> AsyncOpenAICompatClient:
+        """OpenAI-compatible client on the shared aio loop and its connection pool."""
+        if self._openai_client is None:
+            self._openai_client = AsyncOpenAICompatClient(self.config.base_url, self.api_key, http=shared_client())
+        return self._openai_client
+
+    def generate_content(self, prompt: str, system_instruction: Optional[str] = None,
+                         call_type: Optional[str] = None,
+                         response_model: Optional[Type[BaseModel]] = None) -> str:
+        """Generate content from the LLM.
+
+        A separate ``system_instruction`` (e.g. the planner's per-host system
+        prompt) is cached on the provider side when [llm].prompt_cache is on,
+        so repeated calls only pay for ``prompt``. Tokens and latency are
+        recorded under ``call_type`` (default: the client's call_type).
+        With ``response_model`` the reply is constrained to JSON matching the
+        model's schema where the provider supports it ([llm].structured_output);
+        it is still returned as text, to be parsed by the caller.
+        """
+        meter = self._meter(call_type, False, (system_instruction or "") + prompt)
+        call = self._call()
+        try:
+            for model, timeout in call.attempts():
+                try:
+                    text = self._generate_once(model, prompt, timeout, system_instruction, meter, response_model)
+                except Exception as e:
+                    time.sleep(call.failed(model, e))
+                    continue
+                call.succeeded(model)
+                self._finish(meter, model, text)
+                return text
+            raise call.exhausted()
+        except Exception as e:
+            self._finish(meter, call.errors[-1][0] if call.errors else None, error=e)
+            raise
+
+    def _generate_once(self, model: str, prompt: str, timeout: Optional[float],
+                       system_instruction: Optional[str] = None, meter: Optional[CallMeter] = None,
+                       response_model: Optional[Type[BaseModel]] = None) -> str:
+        if self.config.provider == "gemini":
+            options = self._request_options(timeout)
+            generation_config = self._gemini_generation_config(response_model)
+            if not system_instruction:
+                response = self._gemini_model(model).generate_content(
+                    prompt, generation_config=generation_config, request_options=options)
+                return self._gemini_text(response, meter)
+            gemini_model, cache_key = self._gemini_prompt_model(model, system_instruction)
+            try:
+                response = gemini_model.generate_content(
+                    prompt, generation_config=generation_config, request_options=options)
+            except Exception as e:
+                if cache_key is None or classify_error(e) not in (NOT_FOUND, FATAL):
+                    raise
+                # the cache expired or was deleted early: drop the handle, send the prompt in full
+                self._forget_cached_prompt(cache_key)
+                gemini_model = self._gemini_model(model, system_instruction)
+                response = gemini_model.generate_content(
+                    prompt, generation_config=generation_config, request_options=options)
+            return self._gemini_text(response, meter)
+        messages, params = self._openai_request(prompt, system_instruction, response_model)
+        client = self._openai()
+        try:
+            return run_sync(client.chat(model, messages, timeout, on_usage=self._openai_usage_sink(meter), **params))
+        except OpenAIStatusError as e:
+            if not self._reject_schema(e, params):
+                raise
+            return run_sync(client.chat(model, messages, timeout, on_usage=self._openai_usage_sink(meter), **params))
+
+    # ===== accounting =====
+
+    def _meter(self, call_type: Optional[str], stream: bool, prompt_text: str) -> CallMeter:
+        return CallMeter(self.config.provider, call_type or self.call_type, stream, prompt_text)
+
+    def _finish(self, meter: CallMeter, model: Optional[str], response_text: str = "",
+                error: Optional[BaseException] = None):
+        if error is None:
+            self.last_model = model
+        self.last_usage = meter.finish(model, response_text, error)
+
+    @staticmethod
+    def _gemini_usage(meter: Optional[CallMeter], response):
+        usage = getattr(response, "usage_metadata", None)
+        if meter is not None and usage is not None and getattr(usage, "prompt_token_count", 0):
+            meter.update_usage(usage.prompt_token_count, usage.candidates_token_count,
+                               getattr(usage, "cached_content_token_count", 0))
+
+    def _gemini_text(self, response, meter: Optional[CallMeter]) -> str:
+        self._gemini_usage(meter, response)
+        return response.text
+
+    @staticmethod
+    def _openai_usage_sink(meter: Optional[CallMeter]):
+        if meter is None:
+            return None
+
+        def sink(usage: Dict[str, Any]):
+            details = usage.get("prompt_tokens_details") or {}
+            meter.update_usage(usage.get("prompt_tokens"), usage.get("completion_tokens"),
+                               details.get("cached_tokens") if isinstance(details, dict) else None)
+        return sink
+
+    # ===== prompt caching =====
+
+    def _openai_request(self, prompt: str, system_instruction: Optional[str],
+                        response_model: Optional[Type[BaseModel]] = None):
+        """Messages and extra parameters for a one-shot OpenAI-compatible request.
+
+        OpenAI-compatible servers reuse a cached prefix automatically, so the
+        static system prompt goes first, as its own message. We only add hints:
+        ``prompt_cache_key`` routes api.openai.com requests with the same prefix
+        together; ``cache_prompt`` asks llama.cpp servers to keep the prefix
+        (vLLM ignores it).
+        """
+        messages = [{"role": "user", "content": prompt}]
+        params = {}
+        if response_model is not None and self.config.structured_output and not self._schema_unsupported:
+            params["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": response_model.__name__, "schema": json_schema(response_model)},
+            }
+        if system_instruction:
+            messages.insert(0, {"role": "system", "content": system_instruction})
+            if self.config.prompt_cache:
+                if self.config.base_url:
+                    params["cache_prompt"] = True
+                else:
+                    params["prompt_cache_key"] = prompt_key("openai", "", system_instruction).rsplit(":", 1)[1]
+        return messages, params
+
+    def _reject_schema(self, error: OpenAIStatusError, params: dict) -> bool:
+        """True (and drops response_format from params) if the server refused structured output.
+
+        Older llama.cpp / Ollama builds answer 400/422 to response_format;
+        the reply is then parsed leniently instead.
+        """
+        if "response_format" not in params or error.status not in (400, 422):
+            return False
+        self._schema_unsupported = True
+        del params["response_format"]
+        return True
+
+    def _gemini_generation_config(self, response_model: Optional[Type[BaseModel]]) -> dict:
+        if response_model is None or not self.config.structured_output:
+            return {}
+        return {"response_mime_type": "application/json", "response_schema": openapi_schema(response_model)}
+
+    def _gemini_prompt_model(self, name: str, system_instruction: str):
+        """(GenerativeModel, cache key or None) for a system prompt, using Gemini cached content when possible."""
+        if not self.config.prompt_cache:
+            return self._gemini_model(name, system_instruction), None
+        key = prompt_key("gemini", name, system_instruction)
+        registry = get_prompt_cache()
+        entry = registry.lookup(key)
+        if entry and entry.get("uncacheable"):
+            return self._gemini_model(name, system_instruction), None
+
+        with _cached_models_lock:
+            memo = _cached_models.get(key)
+        if memo and entry and memo[0] == entry["name"]:
+            return memo[1], key
+
+        try:
+            model = None
+            if entry:
+                try:
+                    model = genai.GenerativeModel.from_cached_content(entry["name"])
+                    handle = entry["name"]
+                except Exception:
+                    registry.forget(key)  # expired or deleted on the provider side
+            if model is None:
+                ttl = max(60, int(self.config.prompt_cache_ttl))
+                cached = genai.caching.CachedContent.create(
+                    model=name,
+                    display_name="wp-ai system prompt",
+                    system_instruction=system_instruction,
+                    ttl=datetime.timedelta(seconds=ttl),
+                )
+                handle = cached.name
+                registry.store(key, handle, time.time() + ttl)
+                model = genai.GenerativeModel.from_cached_content(cached)
+        except Exception as e:
+            # too short for the model's minimum, or no caching for this model:
+            # remember it so we don't ask again (transient errors: just skip this time)
+            if classify_error(e) not in (RATE_LIMIT, TRANSIENT):
+                registry.mark_uncacheable(key, str(e))
+            return self._gemini_model(name, system_instruction), None
+
+        with _cached_models_lock:
+            _cached_models[key] = (handle, model)
+        return model, key
+
+    @staticmethod
+    def _forget_cached_prompt(key: str):
+        get_prompt_cache().forget(key)
+        with _cached_models_lock:
+            _cached_models.pop(key, None)
+
+    @staticmethod
+    def _gemini_contents(messages: list):
+        """Split chat messages into a Gemini system instruction and contents."""
+        # For Gemini, we need to build a conversation history
+        # System message is handled separately, user/assistant messages go in history
+
+        # Extract system message if present
+        system_instruction = None
+        conversation_parts = []
+
+        for msg in messages:
+            role = msg.get("role", "user")
+            content = msg.get("content", "")
+
+            if role == "system":
+                system_instruction = content
+            elif role == "user":
+                conversation_parts.append({"role": "user", "parts": [content]})
+            elif role == "assistant":
+                conversation_parts.append({"role": "model", "parts": [content]})
+        return system_instruction, conversation_parts
+
+    @staticmethod
+    def _has_turns(messages: list) -> bool:
+        return any(msg.get("role", "user") in ("user", "assistant") for msg in messages)
+
+    def _open_stream(self, model: str, messages: list, timeout: Optional[float],
+                     meter: Optional[CallMeter] = None) -> Iterator[str]:
+        """Start a stream on one model; the request is sent by the first next()."""
         if self.config.provider == "gemini":
-            response = self.model.generate_content(prompt)
-            return response.text
-        return ""
-    
+            # runs the async stream on the shared aio loop, where timeouts can cancel it
+            return iterate_sync(self._agemini_stream(model, messages, timeout, meter))
+        # OpenAI takes the ChatWindow message format (system/user/assistant) as is
+        return iterate_sync(self._openai().chat_stream(
+            model, messages, timeout, on_usage=self._openai_usage_sink(meter), **self._openai_stream_params()
+        ))
+
+    async def _agemini_stream(self, model: str, messages: list, timeout: Optional[float],
+                              meter: Optional[CallMeter] = None) -> AsyncIterator[str]:
+        """Gemini stream; the request is sent by the first __anext__().
+
+        A request_options timeout would be a deadline for the whole stream
+        and cut long answers off. Instead ``timeout`` bounds the wait for the
+        first chunk (generate_content_async returns once it has arrived) and,
+        as an idle timeout, the wait for each later chunk -- the way the
+        OpenAI stream applies it per read.
+        """
+        system_instruction, conversation_parts = self._gemini_contents(messages)
+        # For streaming, we pass the full conversation history
+        try:
+            response = await asyncio.wait_for(
+                self._gemini_model(model, system_instruction).generate_content_async(conversation_parts, stream=True),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No response from {model} within {timeout:.1f}s") from None
+        chunks = response.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"No data from {model} for {timeout:.1f}s") from None
+                # the last chunk carries the usage metadata
+                self._gemini_usage(meter, chunk)
+                yield chunk.text
+        finally:
+            await chunks.aclose()
+
+    def _openai_stream_params(self) -> dict:
+        # api.openai.com reports usage on streams only when asked; local servers may not know the option
+        return {} if self.config.base_url else {"stream_options": {"include_usage": True}}
+
     def generate_content_stream(self, messages: list):
         """Generate content from the LLM with streaming support.
-        
+
+        Retries and fallback apply until the first chunk arrives; after that
+        the stream is committed to one model. Raises LLMCallError when no
+        model could start a stream. The call is recorded (tokens, time to
+        first chunk, total latency) when the stream ends or is closed.
+
         Args:
             messages: List of message dicts with 'role' and 'content' keys
-            
+
         Yields:
             bytes: Chunks of the response as they arrive
         """
-        if self.config.provider == "gemini":
-            # Convert messages to Gemini format
-            # For Gemini, we need to build a conversation history
-            # System message is handled separately, user/assistant messages go in history
-            
-            # Extract system message if present
-            system_instruction = None
-            conversation_parts = []
-            
-            for msg in messages:
-                role = msg.get("role", "user")
-                content = msg.get("content", "")
-                
-                if role == "system":
-                    system_instruction = content
-                elif role == "user":
-                    conversation_parts.append({"role": "user", "parts": [content]})
-                elif role == "assistant":
-                    conversation_parts.append({"role": "model", "parts": [content]})
-            
-            # Use streaming generate_content
-            try:
-                # If we have system instruction, we should recreate the model with it
-                if system_instruction:
-                    import google.generativeai as genai
-                    model = genai.GenerativeModel(
-                        self.config.model,
-                        system_instruction=system_instruction
-                    )
-                else:
-                    model = self.model
-                
-                # For streaming, we pass the full conversation history
-                if conversation_parts:
-                    response = model.generate_content(conversation_parts, stream=True)
-                    
-                    for chunk in response:
-                        if chunk.text:
-                            yield chunk.text.encode('utf-8')
-                else:
-                    yield b""
-            except Exception as e:
-                error_msg = f"Streaming error: {str(e)}"
-                yield error_msg.encode('utf-8')
-        else:
-            # TODO: Implement OpenAI streaming
-            yield b"Streaming not implemented for this provider"
+        if not self._has_turns(messages):
+            yield b""
+            return
+
+        meter = self._meter(None, True, "\n".join(str(m.get("content", "")) for m in messages))
+        call = self._call()
+        served, parts, error, chunks = None, [], None, None
+        try:
+            for model, timeout in call.attempts():
+                try:
+                    chunks = self._open_stream(model, messages, timeout, meter)
+                    first = next(chunks, None)
+                except Exception as e:
+                    time.sleep(call.failed(model, e))
+                    continue
+                call.succeeded(model)
+                served = model
+                meter.first_chunk()
+                head = [first] if first is not None else []
+                for text in itertools.chain(head, chunks):
+                    if text:
+                        parts.append(text)
+                        yield text.encode('utf-8')
+                return
+            raise call.exhausted()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # also runs when the consumer stops early (GeneratorExit): close the
+            # underlying stream now rather than leaving it to the garbage collector
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            # and record the partial reply
+            self._finish(meter, served or (call.errors[-1][0] if call.errors else None), "".join(parts), error)
+
@@ -0,0 +1,135 @@
+"""
+Token and latency accounting for LLM calls
+
+Every LLMClient call produces one record:
+
+    {"ts", "provider", "model", "call_type", "stream", "ok",
+     "prompt_tokens", "response_tokens", "cached_tokens", "tokens_estimated",
+     "ttft_ms", "latency_ms", "error"}
+
+Token counts come from the provider's usage metadata when available, or
+from a local estimate (tokens_estimated = true). Latency covers the whole
+logical call, retries and fallbacks included; ttft_ms is the time to the
+first streamed chunk (equal to latency for non-streaming calls).
+
+Records are stored through the history backend (the llm_calls table of
+history.db, or llm_calls.jsonl rotated like history.jsonl), so they follow
+[history] rotation and retention; the record of the plan call is also
+stored in the history entry ("llm"). `wp-ai stats llm` summarizes them with
+percentiles per model and call type.
+"""
+
+import datetime
+import math
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate: ~4 ASCII characters per token, ~1 token per CJK character."""
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return (len(text) - non_ascii) // 4 + non_ascii + 1
+
+
+class CallMeter:
+    """Measures one logical LLM call; finish() builds and stores the record."""
+
+    def __init__(self, provider: str, call_type: str, stream: bool, prompt_text: str):
+        self.provider = provider
+        self.call_type = call_type or "generate"
+        self.stream = stream
+        self.prompt_text = prompt_text
+        self.usage: Dict[str, int] = {}  # filled from provider usage metadata
+        self._start = time.perf_counter()
+        self._first: Optional[float] = None
+
+    def first_chunk(self):
+        if self._first is None:
+            self._first = time.perf_counter()
+
+    def update_usage(self, prompt_tokens=None, response_tokens=None, cached_tokens=None):
+        for name, value in (("prompt_tokens", prompt_tokens), ("response_tokens", response_tokens),
+                            ("cached_tokens", cached_tokens)):
+            if isinstance(value, int) and value >= 0:
+                self.usage[name] = value
+
+    def finish(self, model: Optional[str], response_text: str = "", error: Optional[BaseException] = None) -> Dict[str, Any]:
+        end = time.perf_counter()
+        estimated = "prompt_tokens" not in self.usage or "response_tokens" not in self.usage
+        record: Dict[str, Any] = {
+            "ts": datetime.datetime.utcnow().isoformat() + "Z",
+            "provider": self.provider,
+            "model": model,
+            "call_type": self.call_type,
+            "stream": self.stream,
+            "ok": error is None,
+            "prompt_tokens": self.usage.get("prompt_tokens", estimate_tokens(self.prompt_text)),
+            "response_tokens": self.usage.get("response_tokens", estimate_tokens(response_text)),
+            "cached_tokens": self.usage.get("cached_tokens", 0),
+            "tokens_estimated": estimated,
+            "ttft_ms": round(((self._first or end) - self._start) * 1000, 1),
+            "latency_ms": round((end - self._start) * 1000, 1),
+        }
+        if error is not None:
+            record["error"] = str(error)[:200]
+        record_llm_call(record)
+        return record
+
+
+def record_llm_call(record: Dict[str, Any], store=None):
+    """Store a record in the history backend (never raises)."""
+    try:
+        if store is None:
+            from .history import get_history_store
+            store = get_history_store()
+        store.append_llm_call(record)
+    except Exception:
+        pass
+
+
+def iter_llm_calls(since: Optional[str] = None, store=None) -> Iterator[Dict[str, Any]]:
+    """Stored records, optionally only those with ts >= since."""
+    if store is None:
+        from .history import get_history_store
+        store = get_history_store()
+    return store.iter_llm_calls(since=since)
+
+
+def percentile(values: Sequence[float], p: float) -> Optional[float]:
+    """Linear-interpolated percentile (p in 0..100) of unsorted values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100.0
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize_llm_calls(records: Iterable[Dict[str, Any]], group_by: Sequence[str] = ("model", "call_type")) -> List[Dict[str, Any]]:
+    """Per-group count, error count, token totals and latency / TTFT percentiles."""
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for record in records:
+        key = tuple(str(record.get(field) or "-") for field in group_by)
+        groups.setdefault(key, []).append(record)
+
+    rows = []
+    for key, items in sorted(groups.items()):
+        ok = [r for r in items if r.get("ok", True)]
+        latency = [r["latency_ms"] for r in ok if isinstance(r.get("latency_ms"), (int, float))]
+        ttft = [r["ttft_ms"] for r in ok if isinstance(r.get("ttft_ms"), (int, float))]
+        row: Dict[str, Any] = dict(zip(group_by, key))
+        row.update({
+            "calls": len(items),
+            "errors": len(items) - len(ok),
+            "prompt_tokens": sum(r.get("prompt_tokens") or 0 for r in items),
+            "response_tokens": sum(r.get("response_tokens") or 0 for r in items),
+            "cached_tokens": sum(r.get("cached_tokens") or 0 for r in items),
+            "estimated": sum(1 for r in items if r.get("tokens_estimated")),
+        })
+        for name, values in (("latency", latency), ("ttft", ttft)):
+            for p in (50, 90, 99):
+                row[f"{name}_p{p}"] = percentile(values, p)
+        rows.append(row)
+    return rows
@@ -6,11 +6,13 @@ from .llm import LLMClient
 
 import json
 import re
+import sys
 from typing import Optional, List
-from pydantic import BaseModel, ValidationError, field_validator
+from pydantic import BaseModel, Field, ValidationError, field_validator
 from .api import WPDoctorClient
 from .context import build_context_text
 from .auth import get_api_basic_auth_keys, set_api_basic_auth_keys
+from .structured import TruncatedJSONError, extract_json_object, repair_prompt
 
 app = typer.Typer()
 
@@ -23,6 +25,8 @@ logs_app = typer.Typer(help="WP Doctor logs subcommands")
 actions_app = typer.Typer(help="Common WP-CLI actions")
 llm_config_app = typer.Typer(help="Configure LLM provider and model")
 aichat_app = typer.Typer(help="Direct chat with the configured LLM")
+history_app = typer.Typer(help="Show and manage execution history")
+stats_app = typer.Typer(help="Usage statistics")
 
 # Register sub-apps
 app.add_typer(creds_app, name="creds")
@@ -33,16 +37,22 @@ app.add_typer(logs_app, name="logs")
 app.add_typer(actions_app, name="actions")
 app.add_typer(llm_config_app, name="llm-config")
 app.add_typer(aichat_app, name="aichat")
+app.add_typer(history_app, name="history")
+app.add_typer(stats_app, name="stats")
 
 
 class PlanStep(BaseModel):
     cmd: str
     risk: Optional[str] = None
     explain: Optional[str] = None
+    depends_on: Optional[List[int]] = None  # 1-based numbers of earlier steps this one needs
+    parallel_safe: Optional[bool] = None  # true: may run alongside other steps (only if also read-only)
+
+RISK_LEVELS = ("low", "medium", "high", "unknown")
 
 class PlanModel(BaseModel):
     intent: Optional[str] = None
-    risk: Optional[str] = None
+    risk: Optional[str] = Field(None, json_schema_extra={"enum": list(RISK_LEVELS)})
     reason: Optional[str] = None
     commands: Optional[List[str]] = None
     steps: Optional[List[PlanStep]] = None
@@ -53,7 +63,8 @@ class PlanModel(BaseModel):
     def validate_risk(cls, v):
         if v is None:
             return v
-        allowed = {"low", "medium", "high", "unknown"}
+        v = v.strip().lower()
+        allowed = set(RISK_LEVELS)
         if v not in allowed:
             raise ValueError(f"risk must be one of {allowed}")
         return v
@@ -65,6 +76,12 @@ class PlanModel(BaseModel):
             return [s.cmd for s in self.steps if s.cmd]
         return []
 
+    def execution_steps(self) -> List[PlanStep]:
+        """The steps to run, in order (a plain command list becomes steps without hints)."""
+        if self.commands:
+            return [PlanStep(cmd=cmd) for cmd in self.commands]
+        return [s for s in self.steps or [] if s.cmd]
+
 
 def _policy_violations(commands, blocklist_patterns):
     violations = []
@@ -75,15 +92,17 @@ def _policy_violations(commands, blocklist_patterns):
     return violations
 
 
+class InvalidPlanError(ValueError):
+    """The LLM reply could not be turned into a plan, even after the repair call."""
+
+    def __init__(self, message: str, response_text: str):
+        super().__init__(message)
+        self.response_text = response_text
+
+
 def _validate_ai_response(response_text: str) -> PlanModel:
-    # Strip code fences if present
-    text = response_text.strip()
-    if "```json" in text:
-        text = text.split("```json", 1)[1].split("```", 1)[0].strip()
-    elif text.startswith("```"):
-        text = text.split("```", 1)[1].split("```", 1)[0].strip()
-
-    data = json.loads(text)
+    # Tolerant: code fences, surrounding prose, trailing commas (not truncated output)
+    data = extract_json_object(response_text)
     plan = PlanModel(**data)
     cmds = plan.normalized_commands()
     if not cmds:
@@ -91,6 +110,32 @@ def _validate_ai_response(response_text: str) -> PlanModel:
     return plan
 
 
+def _generate_plan(client: LLMClient, prompt) -> PlanModel:
+    """Ask the LLM for a plan (PromptParts) and validate it.
+
+    The reply is schema-constrained where the provider supports it, so this
+    is one model call in the common case. A reply that still doesn't
+    validate gets one repair call, which sends only the broken reply and
+    the error (no context). Raises InvalidPlanError if that fails too, and
+    right away for a truncated reply: a repair would have to make up the
+    cut-off command.
+    """
+    response_text = client.generate_content(prompt.user_text(), system_instruction=prompt.system,
+                                            response_model=PlanModel)
+    try:
+        return _validate_ai_response(response_text)
+    except TruncatedJSONError as e:
+        raise InvalidPlanError(f"Invalid AI response (truncated): {e}", response_text) from e
+    except (ValidationError, ValueError) as e:
+        error = e
+    repaired = client.generate_content(repair_prompt(response_text, error, PlanModel),
+                                       call_type="plan_repair", response_model=PlanModel)
+    try:
+        return _validate_ai_response(repaired)
+    except (ValidationError, ValueError) as e:
+        raise InvalidPlanError(f"Invalid AI response: {e}", response_text) from e
+
+
 @app.command()
 def init(path: str = typer.Option("", help="Optional path to write config.toml")):
     """
@@ -116,7 +161,7 @@ def init(path: str = typer.Option("", help="Optional path to write config.toml")
     print("[green]config.toml generated (or updated) with defaults.[/green]\n[dim]Edit hosts and policy as needed.[/dim]")
 
 
-from .prompts import build_prompt
+from .prompts import build_prompt_parts
 
 
 @app.command()
@@ -149,17 +194,15 @@ def plan(instruction: str, host: str = typer.Option("default", help="Target host
             print(f"[yellow]Context fetch failed:[/] {e}")
 
     try:
-        client = LLMClient(config.llm)
-        prompt = build_prompt(instruction, host_config=host_config, context=context_text)
+        client = LLMClient(config.llm, call_type="plan")
+        prompt = build_prompt_parts(instruction, host_config=host_config, context=context_text)
 
         print("[bold blue]Thinking...[/bold blue]")
-        response_text = client.generate_content(prompt)
-
         try:
-            plan_model = _validate_ai_response(response_text)
-        except (ValidationError, ValueError, json.JSONDecodeError) as e:
-            print(f"[bold red]Error:[/bold] Invalid AI response: {e}")
-            print(response_text)
+            plan_model = _generate_plan(client, prompt)
+        except InvalidPlanError as e:
+            print(f"[bold red]Error:[/bold] {e}")
+            print(e.response_text)
             return
 
         violations = _policy_violations(plan_model.normalized_commands(), load_config().policy.blocklist)
@@ -181,7 +224,8 @@ def plan(instruction: str, host: str = typer.Option("default", help="Target host
 
 
 @app.command()
-def say(instruction: str, host: str = typer.Option("default", help="Target host name"), yes: bool = typer.Option(False, help="Skip confirmation"), with_context: bool = typer.Option(True, help="Include live system context from API")):
+def say(instruction: str, host: str = typer.Option("default", help="Target host name"), yes: bool = typer.Option(False, help="Skip confirmation"), with_context: bool = typer.Option(True, help="Include live system context from API"),
+        no_cache: bool = typer.Option(False, "--no-cache", help="Run read-only commands even if a cached result exists")):
     """
     Execute an instruction via AI planning.
     """
@@ -212,23 +256,15 @@ def say(instruction: str, host: str = typer.Option("default", help="Target host
             print(f"[yellow]Context fetch failed:[/] {e}")
 
     try:
-        client = LLMClient(config.llm)
-        prompt = build_prompt(instruction, host_config=host_config, context=context_text)
+        client = LLMClient(config.llm, call_type="say")
+        prompt = build_prompt_parts(instruction, host_config=host_config, context=context_text)
 
         print("[bold blue]Thinking...[/bold blue]")
-        response_text = client.generate_content(prompt)
-
-        # Clean up markdown code blocks if present
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-
         try:
-            plan_model = _validate_ai_response(response_text)
-        except (ValidationError, ValueError, json.JSONDecodeError) as e:
-            print(f"[bold red]Error:[/bold] Invalid AI response: {e}")
-            print(response_text)
+            plan_model = _generate_plan(client, prompt)
+        except InvalidPlanError as e:
+            print(f"[bold red]Error:[/bold] {e}")
+            print(e.response_text)
             return
 
         violations = _policy_violations(plan_model.normalized_commands(), config.policy.blocklist)
@@ -250,25 +286,34 @@ def say(instruction: str, host: str = typer.Option("default", help="Target host
                 print("[yellow]Aborted.[/yellow]")
                 return
 
-        # Execute
-        from .ssh import SSHRunner
-        runner = SSHRunner(host_config.ssh)
+        # Execute (independent read-only steps concurrently, output in step order)
+        from .runner import create_runner
+        from .scheduler import run_steps
+        runner = create_runner(host_config, config.runner.default, 0.0 if no_cache else config.runner.cache_ttl)
         results = []
+
+        def on_event(kind, index, payload):
+            if kind == "start":
+                print(f"\n[bold]Running:[/] {payload}")
+            elif kind == "output":
+                sys.stdout.write(payload)
+                sys.stdout.flush()
+            elif payload["exit_code"] != 0:
+                print(f"[bold red]Command failed with exit code {payload['exit_code']}[/bold]")
+
         try:
             runner.connect()
-            for cmd in plan_model.normalized_commands():
-                print(f"\n[bold]Running:[/] {cmd}")
-                exit_code = runner.run_command(cmd)
-                results.append({"command": cmd, "exit_code": exit_code})
-                if exit_code != 0:
-                    print(f"[bold red]Command failed with exit code {exit_code}[/bold]")
-                    break
+            run_steps(runner, plan_model.execution_steps(), on_event, results,
+                      max_parallel=config.runner.max_parallel,
+                      output_max_bytes=config.history.output_max_bytes)
         finally:
             runner.close()
             history_append({
                 "host": host_config.name,
                 "instruction": instruction,
                 "plan": plan_model.model_dump(mode="json"),
+                "model": client.last_model,
+                "llm": client.last_usage,
                 "results": results,
             })
 
@@ -277,7 +322,8 @@ def say(instruction: str, host: str = typer.Option("default", help="Target host
 
 
 @app.command()
-def run(command: str, host: str = typer.Option("default", help="Target host name")):
+def run(command: str, host: str = typer.Option("default", help="Target host name"),
+        no_cache: bool = typer.Option(False, "--no-cache", help="Run even if a cached result exists")):
     """
     Run a raw WP-CLI command.
     """
@@ -288,9 +334,9 @@ def run(command: str, host: str = typer.Option("default", help="Target host name
         print(f"[bold red]Error:[/bold] Host '{host}' not found in config.")
         return
 
-    from .ssh import SSHRunner
+    from .runner import create_runner
     try:
-        runner = SSHRunner(host_config.ssh)
+        runner = create_runner(host_config, config.runner.default, 0.0 if no_cache else config.runner.cache_ttl)
         print(f"[bold]Running:[/] {command} on {host}")
         exit_code = runner.run_command(command)
         if exit_code != 0:
@@ -304,21 +350,136 @@ def run(command: str, host: str = typer.Option("default", help="Target host name
             runner.close()
 
 
-@app.command()
-def history(limit: int = typer.Option(20, help="Number of recent entries to show")):
+@history_app.callback(invoke_without_command=True)
+def history(ctx: typer.Context,
+            limit: int = typer.Option(20, help="Number of recent entries to show"),
+            host: str = typer.Option("", help="Only entries for this host"),
+            status: str = typer.Option("", help="success|failed|unknown"),
+            since: str = typer.Option("", help="ISO date/time or relative (e.g. 7d, 12h)")):
     """Show recent execution history."""
-    from .config import HISTORY_FILE
+    if ctx.invoked_subcommand is not None:
+        return
+    from .history import get_history_store, parse_since
+    if status and status not in ("success", "failed", "unknown"):
+        print("[bold red]Error:[/] --status must be one of success, failed, unknown.")
+        raise typer.Exit(code=1)
     try:
-        if not HISTORY_FILE.exists():
+        since_ts = parse_since(since) if since else None
+    except ValueError:
+        print(f"[bold red]Error:[/] Invalid --since value: {since}")
+        raise typer.Exit(code=1)
+    try:
+        entries = get_history_store().query(limit=limit, host=host or None, status=status or None, since=since_ts)
+        if not entries:
             print("[yellow]No history yet.[/yellow]")
             return
-        lines = HISTORY_FILE.read_text(encoding="utf-8").strip().splitlines()
-        for line in lines[-limit:]:
-            print(line)
+        for entry in reversed(entries):
+            print(json.dumps(entry, ensure_ascii=False))
     except Exception as e:
         print(f"[bold red]Error reading history:[/] {e}")
 
 
+@history_app.command("search")
+def history_search(query: str = typer.Argument(..., help="Words to search for (all must match)"),
+                   limit: int = typer.Option(20, help="Maximum number of results"),
+                   host: str = typer.Option("", help="Only entries for this host"),
+                   since: str = typer.Option("", help="ISO date/time or relative (e.g. 30d)")):
+    """Full-text search over instructions, commands, intent/reason and output."""
+    from .history import get_history_store, parse_since, entry_status
+    try:
+        since_ts = parse_since(since) if since else None
+    except ValueError:
+        print(f"[bold red]Error:[/] Invalid --since value: {since}")
+        raise typer.Exit(code=1)
+    try:
+        entries = get_history_store().search(query, limit=limit, host=host or None, since=since_ts)
+    except Exception as e:
+        print(f"[bold red]Error searching history:[/] {e}")
+        raise typer.Exit(code=1)
+    if not entries:
+        print("[yellow]No matching history entries.[/yellow]")
+        return
+    from rich.markup import escape
+    for entry in entries:
+        print(f"{entry.get('ts', '')}  {escape(entry.get('host') or '-')}  {entry_status(entry)}  "
+              f"{escape(entry.get('instruction') or '')}")
+
+
+@history_app.command("import")
+def history_import(path: str = typer.Option("", help="jsonl file to import (default: history.jsonl)")):
+    """Import a history.jsonl file into the SQLite history store."""
+    from pathlib import Path
+    from .config import HISTORY_FILE
+    from .history import get_history_store, SQLiteHistoryStore
+    store = get_history_store()
+    if not isinstance(store, SQLiteHistoryStore):
+        print("[bold red]Error:[/] Import requires the sqlite history backend.")
+        raise typer.Exit(code=1)
+    source = Path(path) if path else HISTORY_FILE
+    if not source.exists():
+        print(f"[bold red]Error:[/] {source} not found.")
+        raise typer.Exit(code=1)
+    count = store.import_jsonl(source)
+    print(f"[green]Imported {count} entries from {source}.[/green]")
+
+
+@history_app.command("export")
+def history_export(path: str = typer.Argument(..., help="Destination jsonl file")):
+    """Export the whole history as jsonl (one JSON object per line)."""
+    from pathlib import Path
+    from .history import get_history_store
+    count = get_history_store().export_jsonl(Path(path))
+    print(f"[green]Exported {count} entries to {path}.[/green]")
+
+
+@stats_app.command("llm")
+def stats_llm(since: str = typer.Option("", help="ISO date/time or relative (e.g. 7d, 12h)"),
+              by: str = typer.Option("model,call_type", help="Group by: model, call_type, provider (comma separated)"),
+              as_json: bool = typer.Option(False, "--json", help="Print rows as JSON")):
+    """Token and latency percentiles of LLM calls, per model and call type."""
+    from .history import parse_since
+    from .llm_metrics import iter_llm_calls, summarize_llm_calls
+    group_by = [g.strip() for g in by.split(",") if g.strip()]
+    if not group_by or any(g not in ("model", "call_type", "provider") for g in group_by):
+        print("[bold red]Error:[/] --by must list model, call_type and/or provider.")
+        raise typer.Exit(code=1)
+    try:
+        since_ts = parse_since(since) if since else None
+    except ValueError:
+        print(f"[bold red]Error:[/] Invalid --since value: {since}")
+        raise typer.Exit(code=1)
+    rows = summarize_llm_calls(iter_llm_calls(since=since_ts), group_by=group_by)
+    if as_json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    if not rows:
+        print("[yellow]No LLM calls recorded yet.[/yellow]")
+        return
+
+    from rich.console import Console
+    from rich.table import Table
+
+    def ms(value):
+        return "-" if value is None else f"{value:,.0f}"
+
+    table = Table(title="LLM calls (ms; tokens are totals, ~ = partly estimated)")
+    for column in group_by:
+        table.add_column(column)
+    for column in ("calls", "err", "prompt tok", "resp tok", "cached",
+                   "p50", "p90", "p99", "ttft p50", "ttft p90"):
+        table.add_column(column, justify="right")
+    for row in rows:
+        approx = "~" if row["estimated"] else ""
+        table.add_row(
+            *[row[g] for g in group_by],
+            str(row["calls"]), str(row["errors"]),
+            f"{approx}{row['prompt_tokens']:,}", f"{approx}{row['response_tokens']:,}", f"{row['cached_tokens']:,}",
+            ms(row["latency_p50"]), ms(row["latency_p90"]), ms(row["latency_p99"]),
+            ms(row["ttft_p50"]), ms(row["ttft_p90"]),
+        )
+    Console().print(table)
+
+
 @creds_app.command("set")
 def creds_set(host: str = typer.Option(..., "--host", help="Host name as defined in config.toml"), username: str = typer.Option(..., "--username", prompt=True), password: str = typer.Option(..., "--password", prompt=True, hide_input=True)):
     """Save API Basic Auth (Application Password) to keyring for the host."""
@@ -451,7 +612,11 @@ def llm_show():
 
 
 @llm_config_app.command("set")
-def llm_set(provider: str = typer.Option(...), model: str = typer.Option(...)):
+def llm_set(
+    provider: str = typer.Option(...),
+    model: str = typer.Option(...),
+    base_url: Optional[str] = typer.Option(None, help="OpenAI-compatible endpoint for the openai provider (e.g. http://localhost:8000/v1)"),
+):
     from .config import CONFIG_FILE, ensure_config_dir
     cfg = load_config()
     cfg.llm.provider = provider
@@ -467,6 +632,11 @@ def llm_set(provider: str = typer.Option(...), model: str = typer.Option(...)):
     import re as _re
     text = _re.sub(r"provider\s*=\s*\".*?\"", f'provider = "{provider}"', text)
     text = _re.sub(r"model\s*=\s*\".*?\"", f'model = "{model}"', text)
+    if base_url is not None:
+        if _re.search(r"base_url\s*=\s*\".*?\"", text):
+            text = _re.sub(r"base_url\s*=\s*\".*?\"", f'base_url = "{base_url}"', text)
+        else:
+            text = _re.sub(r"(model\s*=\s*\".*?\")", lambda m: f'{m.group(1)}\nbase_url = "{base_url}"', text, count=1)
     CONFIG_FILE.write_text(text, encoding="utf-8")
     print("[green]LLM config updated.[/green]")
 
@@ -475,7 +645,7 @@ def llm_set(provider: str = typer.Option(...), model: str = typer.Option(...)):
 def aichat_ask(message: str):
     cfg = load_config()
     try:
-        client = LLMClient(cfg.llm)
+        client = LLMClient(cfg.llm, call_type="aichat")
         print("[bold blue]LLM...[/]")
         resp = client.generate_content(message)
         print(resp)
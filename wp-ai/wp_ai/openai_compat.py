@@ -0,0 +1,161 @@
+"""
+OpenAI-compatible chat completions client
+
+Talks to any server that implements the OpenAI REST API (api.openai.com,
+vLLM, llama.cpp server, Ollama, LM Studio, ...) over wp_ai.http_client, so
+requests reuse pooled keep-alive connections. Streaming uses Server-Sent
+Events (``stream: true``).
+"""
+
+import json
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from .http_client import AsyncHTTPClient, HTTPError, HTTPStatusError, Response
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+DEFAULT_TIMEOUT = 60.0
+
+
+class OpenAIStatusError(HTTPStatusError):
+    """HTTP error response; the server's error message is appended when present."""
+
+    def __init__(self, status: int, reason: str, url: str, body: bytes = b""):
+        super().__init__(status, reason, url, body)
+        detail = _error_detail(body)
+        if detail:
+            self.args = (f"{self.args[0]}: {detail}",)
+
+
+class OpenAIResponseError(HTTPError):
+    """The server answered 200 but the payload is unusable (or an in-stream error)."""
+
+
+def _error_detail(body: bytes) -> str:
+    try:
+        payload = json.loads(body.decode("utf-8", errors="replace"))
+    except ValueError:
+        return body.decode("utf-8", errors="replace").strip()[:200]
+    error = payload.get("error") if isinstance(payload, dict) else None
+    if isinstance(error, dict):
+        return str(error.get("message") or "")
+    return str(error or "")
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    """Text of a chat message/delta (content may be a string or a list of parts)."""
+    content = message.get("content")
+    if content is None:
+        return ""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content)
+
+
+async def iter_sse_data(response: Response) -> AsyncIterator[str]:
+    """Yield the data field of each Server-Sent Event until ``[DONE]``.
+
+    The body is still read to its end after ``[DONE]`` so the connection
+    can go back to the pool.
+    """
+    data: List[str] = []
+    done = False
+    async for line in response.iter_lines():
+        if done:
+            continue
+        if not line:
+            if data:
+                payload = "\n".join(data)
+                data = []
+                if payload.strip() == "[DONE]":
+                    done = True
+                    continue
+                yield payload
+            continue
+        if line.startswith(":"):
+            continue  # comment / keep-alive
+        field, _, value = line.partition(":")
+        if field == "data":
+            data.append(value[1:] if value.startswith(" ") else value)
+    if data and not done and "\n".join(data).strip() != "[DONE]":
+        yield "\n".join(data)
+
+
+class AsyncOpenAICompatClient:
+    """asyncio client for /chat/completions and /models.
+
+    Pass a shared AsyncHTTPClient to reuse connections (see api.AsyncWPDoctorClient).
+    """
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 timeout: float = DEFAULT_TIMEOUT, http: Optional[AsyncHTTPClient] = None):
+        self.base = (base_url or DEFAULT_BASE_URL).rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+        self.http = http or AsyncHTTPClient(timeout=timeout)
+
+    def _headers(self, stream: bool = False) -> Dict[str, str]:
+        headers = {"Accept": "text/event-stream" if stream else "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    async def _check(self, response: Response):
+        if response.status >= 400:
+            body = await response.read()
+            raise OpenAIStatusError(response.status, response.reason, response.url, body)
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], timeout: Optional[float] = None,
+                   on_usage: Optional[Callable[[Dict[str, Any]], None]] = None, **params) -> str:
+        """Non-streaming chat completion; returns the assistant text.
+
+        ``on_usage`` receives the response's "usage" object when present.
+        """
+        body = {"model": model, "messages": messages, **params}
+        response = await self.http.post(f"{self.base}/chat/completions", json=body,
+                                        headers=self._headers(), timeout=timeout or self.timeout)
+        await self._check(response)
+        try:
+            payload = await response.json()
+            if on_usage and isinstance(payload.get("usage"), dict):
+                on_usage(payload["usage"])
+            return message_text(payload["choices"][0]["message"])
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise OpenAIResponseError(f"Unexpected chat completion response: {e}")
+
+    async def chat_stream(self, model: str, messages: List[Dict[str, Any]], timeout: Optional[float] = None,
+                          on_usage: Optional[Callable[[Dict[str, Any]], None]] = None, **params) -> AsyncIterator[str]:
+        """Streaming chat completion; yields text deltas as they arrive.
+
+        ``on_usage`` receives the "usage" object of the final event, which
+        servers send when asked with stream_options={"include_usage": True}.
+        """
+        body = {"model": model, "messages": messages, "stream": True, **params}
+        response = await self.http.post(f"{self.base}/chat/completions", json=body,
+                                        headers=self._headers(stream=True), timeout=timeout or self.timeout,
+                                        stream=True)
+        await self._check(response)
+        try:
+            async for data in iter_sse_data(response):
+                try:
+                    event = json.loads(data)
+                except ValueError:
+                    raise OpenAIResponseError(f"Malformed stream event: {data[:200]}")
+                if event.get("error"):
+                    raise OpenAIResponseError(_error_detail(data.encode("utf-8")))
+                if on_usage and isinstance(event.get("usage"), dict):
+                    on_usage(event["usage"])
+                for choice in event.get("choices") or []:
+                    text = message_text(choice.get("delta") or {})
+                    if text:
+                        yield text
+        finally:
+            await response.aclose()
+
+    async def list_models(self) -> List[str]:
+        response = await self.http.get(f"{self.base}/models", headers=self._headers(), timeout=self.timeout)
+        await self._check(response)
+        payload = await response.json()
+        return sorted(item["id"] for item in payload.get("data", []) if item.get("id"))
+
+    async def aclose(self):
+        await self.http.aclose()
@@ -0,0 +1,106 @@
+"""
+Local bookkeeping for provider-side prompt caches
+
+The planner's system prompt is long and only changes with the host, so it is
+worth caching on the provider side (Gemini cached content). This module
+remembers which cache handle belongs to which (provider, model, system
+prompt) and when it expires, in ~/.config/wp-ai/prompt_cache.json, so that
+separate `wp-ai say` runs and GUI sessions reuse one handle instead of
+creating a new cache each time.
+
+Prompts the provider refuses to cache (too short for the model's minimum,
+model without caching support) are remembered as "uncacheable" for a while
+so we don't ask again on every call.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from .config import CONFIG_DIR, ensure_config_dir
+
+PROMPT_CACHE_FILE = CONFIG_DIR / "prompt_cache.json"
+EXPIRY_MARGIN = 60.0  # seconds; don't hand out handles that are about to expire
+UNCACHEABLE_FOR = 7 * 24 * 60 * 60.0
+
+
+def prompt_key(provider: str, model: str, system_prompt: str) -> str:
+    """Cache key for a rendered system prompt (the prompt itself is not stored)."""
+    digest = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:32]
+    return f"{provider}:{model}:{digest}"
+
+
+class PromptCacheRegistry:
+    """Cache handles and expiry per prompt key, persisted as JSON."""
+
+    def __init__(self, path=PROMPT_CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, dict]] = None
+
+    def _load(self) -> Dict[str, dict]:
+        if self._entries is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._entries = data if isinstance(data, dict) else {}
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        now = time.time()
+        entries = {k: v for k, v in self._load().items() if v.get("expires_at", 0) > now}
+        self._entries = entries
+        try:
+            ensure_config_dir()
+            tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def lookup(self, key: str) -> Optional[dict]:
+        """The live entry for key: {"name": handle} or {"uncacheable": True}, else None."""
+        with self._lock:
+            entry = self._load().get(key)
+            if not entry:
+                return None
+            margin = 0.0 if entry.get("uncacheable") else EXPIRY_MARGIN
+            if entry.get("expires_at", 0) - margin <= time.time():
+                return None
+            return entry
+
+    def store(self, key: str, name: str, expires_at: float):
+        with self._lock:
+            self._entries = None  # merge with entries written by other processes
+            self._load()[key] = {"name": name, "expires_at": expires_at}
+            self._save()
+
+    def mark_uncacheable(self, key: str, reason: str = "", for_seconds: float = UNCACHEABLE_FOR):
+        with self._lock:
+            self._entries = None
+            self._load()[key] = {"uncacheable": True, "reason": reason[:200], "expires_at": time.time() + for_seconds}
+            self._save()
+
+    def forget(self, key: str):
+        with self._lock:
+            self._entries = None
+            if self._load().pop(key, None) is not None:
+                self._save()
+
+
+_registry: Optional[PromptCacheRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_cache() -> PromptCacheRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptCacheRegistry()
+        return _registry
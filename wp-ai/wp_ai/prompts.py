@@ -1,3 +1,6 @@
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
 SYSTEM_PROMPT = """**CRITICAL INSTRUCTION**: You MUST respond with ONLY a valid JSON object. No markdown, no code blocks, no explanations.
 
 You are WP Doctor AI, an intelligent assistant for WordPress operations.
@@ -31,6 +34,10 @@ Your goal is to help the user manage their WordPress site by generating WP-CLI c
 
 **The "risk" field MUST be one of**: "low", "medium", "high", or "unknown"
 
+**Optional**: instead of "commands" you may give "steps", e.g.
+"steps": [{{"cmd": "wp plugin list", "parallel_safe": true}}, {{"cmd": "wp core version", "parallel_safe": true}}, {{"cmd": "wp plugin update akismet", "depends_on": [1]}}]
+Set "parallel_safe": true only on read-only checks that may run at the same time as other steps; "depends_on" lists the (1-based) earlier steps a step needs. Commands that change the site always run one at a time, in order.
+
 **EXAMPLE OF CORRECT OUTPUT:**
 {{"intent": "Clear WordPress cache", "commands": ["wp cache flush"], "risk": "low", "reason": "Safe operation to refresh cache"}}
 
@@ -45,6 +52,34 @@ Target Host: {host}
 **REMEMBER**: Your entire response must be ONLY the JSON object. Nothing else.
 """
 
+class PromptParts(NamedTuple):
+    """A plan prompt split into its parts.
+
+    ``system`` depends only on the host and is rendered once per host
+    configuration; ``context`` and ``instruction`` change per request.
+    Providers that cache the system prompt get ``system`` and user_text()
+    separately; text() is the single-string prompt.
+    """
+    system: str
+    context: str
+    instruction: str
+
+    def user_text(self) -> str:
+        """The per-request part (context and instruction)."""
+        if self.context:
+            return "[Current System Context]\n" + self.context + "\n\n[User Instruction]\n" + self.instruction
+        return "[User Instruction]\n" + self.instruction
+
+    def text(self) -> str:
+        """The whole prompt as one string."""
+        return self.system + "\n\n" + self.user_text()
+
+
+def build_prompt_parts(instruction: str, host=None, host_config=None, context: str = "") -> PromptParts:
+    """Build the prompt as PromptParts (see build_prompt for the arguments)."""
+    return PromptParts(build_system_prompt(host=host, host_config=host_config), context or "", instruction)
+
+
 def build_prompt(instruction: str, host=None, host_config=None, context: str = "") -> str:
     """Build the full prompt for the LLM.
     
@@ -57,6 +92,15 @@ def build_prompt(instruction: str, host=None, host_config=None, context: str = "
     Returns:
         Complete prompt string for the LLM
     """
+    return build_prompt_parts(instruction, host=host, host_config=host_config, context=context).text()
+
+
+def build_system_prompt(host=None, host_config=None) -> str:
+    """The static, per-host part of the prompt (same for every instruction).
+    
+    Sent as the system instruction so providers can cache it. Rendering is
+    memoized on the fields it depends on (host name, wp_path, wordpress_path).
+    """
     # Determine host name and config
     if host_config:
         host_name = host_config.name if hasattr(host_config, 'name') else 'unknown'
@@ -65,44 +109,51 @@ def build_prompt(instruction: str, host=None, host_config=None, context: str = "
     else:
         host_name = 'unknown'
     
+    ssh_config = getattr(host_config, 'ssh', None) if host_config else None
+    if ssh_config:
+        return _render_system_prompt(host_name, True, ssh_config.wp_path, ssh_config.wordpress_path)
+    return _render_system_prompt(host_name, False, None, None)
+
+
+@lru_cache(maxsize=64)
+def _render_system_prompt(host_name: str, has_ssh: bool, wp_path: Optional[str], wordpress_path: Optional[str]) -> str:
+    """Render SYSTEM_PROMPT for one host configuration (cached by its arguments)."""
     # WP-CLI command format instructions
     wp_cli_instructions = ""
     example_command = '"wp plugin list --status=active --format=table"'
     
-    if host_config and hasattr(host_config, 'ssh') and host_config.ssh:
-        ssh_config = host_config.ssh
-        
+    if has_ssh:
         # wp_path が設定されている場合
-        if ssh_config.wp_path:
+        if wp_path:
             wp_cli_instructions = f"""**CRITICAL COMMAND FORMAT REQUIREMENT**:
 This host uses a custom WP-CLI path. You MUST follow this EXACT format for ALL commands:
 
-1. Start with: `{ssh_config.wp_path}`
+1. Start with: `{wp_path}`
 2. Follow with the WP-CLI subcommand (WITHOUT the 'wp' prefix)
-3. End with: `--path='{ssh_config.wordpress_path}'`
+3. End with: `--path='{wordpress_path}'`
 
 **Examples:**
 - Instead of: `wp cache flush`
-  You MUST generate: `{ssh_config.wp_path} cache flush --path='{ssh_config.wordpress_path}'`
+  You MUST generate: `{wp_path} cache flush --path='{wordpress_path}'`
 
 - Instead of: `wp plugin list --status=active`
-  You MUST generate: `{ssh_config.wp_path} plugin list --status=active --path='{ssh_config.wordpress_path}'`
+  You MUST generate: `{wp_path} plugin list --status=active --path='{wordpress_path}'`
 
 - Instead of: `wp core version`
-  You MUST generate: `{ssh_config.wp_path} core version --path='{ssh_config.wordpress_path}'`
+  You MUST generate: `{wp_path} core version --path='{wordpress_path}'`
 
 **REMEMBER**: Remove 'wp' from the beginning and add the custom path and --path parameter!
 """
-            example_command = f'"{ssh_config.wp_path} cache flush --path=\'{ssh_config.wordpress_path}\'"'
+            example_command = f'"{wp_path} cache flush --path=\'{wordpress_path}\'"'
         
         # wp_path がなくても wordpress_path が設定されている場合
-        elif ssh_config.wordpress_path:
+        elif wordpress_path:
             wp_cli_instructions = f"""**IMPORTANT**: This host requires the WordPress path to be specified.
-You MUST add `--path='{ssh_config.wordpress_path}'` to all WP-CLI commands.
+You MUST add `--path='{wordpress_path}'` to all WP-CLI commands.
 
-Example: `wp plugin list --path='{ssh_config.wordpress_path}'`
+Example: `wp plugin list --path='{wordpress_path}'`
 """
-            example_command = f'"wp plugin list --status=active --format=table --path=\'{ssh_config.wordpress_path}\'"'
+            example_command = f'"wp plugin list --status=active --format=table --path=\'{wordpress_path}\'"'
         
         # 標準的な wp コマンド
         else:
@@ -118,15 +169,8 @@ Example: `wp plugin list --status=active`
 """
     
     # Build the prompt
-    prompt = SYSTEM_PROMPT.format(
+    return SYSTEM_PROMPT.format(
         host=host_name,
         wp_cli_format_instructions=wp_cli_instructions,
         example_command=example_command
     )
-    
-    if context:
-        prompt += f"\n\n[Current System Context]\n{context}"
-    
-    prompt += f"\n\n[User Instruction]\n{instruction}"
-    
-    return prompt
@@ -0,0 +1,230 @@
+"""
+Retry, deadline and circuit-breaker helpers for LLM calls
+
+A ResilientCall walks an ordered list of models (primary first, then the
+configured fallbacks). Each model gets up to max_retries retries with
+full-jitter exponential backoff on rate limits and transient errors; the
+whole call is bounded by one deadline. A process-wide circuit breaker per
+(provider, model) skips models that keep failing until a cool-down passes.
+
+The loop itself does not sleep, so the same object drives sync and async
+callers:
+
+    call = ResilientCall(provider, models, config)
+    for model, timeout in call.attempts():
+        try:
+            result = do_request(model, timeout)
+        except Exception as e:
+            time.sleep(call.failed(model, e))   # or: await asyncio.sleep(...)
+            continue
+        call.succeeded(model)
+        return result
+    raise call.exhausted()
+"""
+
+import random
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Error classes
+RATE_LIMIT = "rate_limit"
+TRANSIENT = "transient"
+NOT_FOUND = "not_found"
+FATAL = "fatal"
+
+
+class LLMCallError(Exception):
+    """Raised when no model could serve a call."""
+
+    def __init__(self, message: str, last_error: Optional[BaseException] = None):
+        super().__init__(message)
+        self.last_error = last_error
+
+
+class LLMTimeoutError(LLMCallError):
+    """Raised when the per-call deadline passes."""
+
+
+def classify_error(error: BaseException) -> str:
+    """Map an exception from an LLM backend to RATE_LIMIT / TRANSIENT / NOT_FOUND / FATAL."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return TRANSIENT
+    # google.api_core exceptions expose the HTTP status as .code,
+    # wp_ai.http_client.HTTPStatusError as .status
+    status = getattr(error, "code", None)
+    if not isinstance(status, int):
+        status = getattr(error, "status", None)
+    if isinstance(status, int):
+        if status == 429:
+            return RATE_LIMIT
+        if status == 404:
+            return NOT_FOUND
+        if status in (408, 500, 502, 503, 504):
+            return TRANSIENT
+        if 400 <= status < 500:
+            return FATAL
+    name = type(error).__name__
+    if name in ("ResourceExhausted", "TooManyRequests"):
+        return RATE_LIMIT
+    if name in ("ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "HTTPError", "TimeoutError"):
+        return TRANSIENT
+    return FATAL
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed -> open -> half-open)."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold: int = 3, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """May a request be sent now? In half-open state only one trial is let through."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+            self._trial_in_flight = False
+
+    def release(self):
+        """End a half-open trial without judging the endpoint (e.g. a bad request)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider: str, model: str, threshold: int = 3, cooldown: float = 30.0) -> CircuitBreaker:
+    """Process-wide breaker for (provider, model)."""
+    with _breakers_lock:
+        breaker = _breakers.get((provider, model))
+        if breaker is None:
+            breaker = _breakers[(provider, model)] = CircuitBreaker(threshold, cooldown)
+        return breaker
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Full-jitter exponential backoff for the given retry number (0-based)."""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+class ResilientCall:
+    """Attempt plan for one logical LLM call (see module docstring)."""
+
+    def __init__(self, provider: str, models: List[str], config):
+        self.provider = provider
+        # keep order, drop duplicates / empties
+        self.models = [m for i, m in enumerate(models) if m and m not in models[:i]]
+        self.timeout = float(config.timeout)
+        self.max_retries = max(0, int(config.max_retries))
+        self.backoff_base = float(config.backoff_base)
+        self.backoff_max = float(config.backoff_max)
+        self.breaker_threshold = int(config.breaker_threshold)
+        self.breaker_cooldown = float(config.breaker_cooldown)
+        self.deadline = time.monotonic() + self.timeout if self.timeout > 0 else None
+        self.model: Optional[str] = None  # the model that served the call
+        self.errors: List[Tuple[str, BaseException]] = []
+        self.skipped: List[str] = []
+        self._done = False
+        self._next_model = False
+        self._retry = 0
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        return get_breaker(self.provider, model, self.breaker_threshold, self.breaker_cooldown)
+
+    def attempts(self) -> Iterator[Tuple[str, Optional[float]]]:
+        """Yield (model, remaining seconds or None) for each attempt to make."""
+        for model in self.models:
+            breaker = self._breaker(model)
+            self._next_model = False
+            for retry in range(self.max_retries + 1):
+                remaining = self.remaining()
+                if remaining is not None and remaining <= 0:
+                    raise LLMTimeoutError(f"LLM call exceeded its {self.timeout:g}s deadline", self._last_error())
+                if not breaker.allow():
+                    self.skipped.append(model)
+                    break
+                self._retry = retry
+                yield model, remaining
+                if self._done:
+                    return
+                if self._next_model:
+                    break
+
+    def succeeded(self, model: str):
+        self._breaker(model).record_success()
+        self.model = model
+        self._done = True
+
+    def failed(self, model: str, error: BaseException) -> float:
+        """Record a failed attempt; returns the delay before the next attempt.
+
+        Raises the error for non-retryable failures (bad request, auth).
+        """
+        kind = classify_error(error)
+        self.errors.append((model, error))
+        if kind in (FATAL, NOT_FOUND):
+            self._breaker(model).release()
+        if kind == FATAL:
+            raise error
+        if kind == NOT_FOUND:
+            # model does not exist: not the endpoint's fault, try the next one
+            self._next_model = True
+            return 0.0
+        self._breaker(model).record_failure()
+        if self._retry >= self.max_retries:
+            self._next_model = True
+            return 0.0
+        delay = backoff_delay(self._retry, self.backoff_base, self.backoff_max)
+        remaining = self.remaining()
+        if remaining is not None:
+            delay = max(0.0, min(delay, remaining))
+        return delay
+
+    def _last_error(self) -> Optional[BaseException]:
+        return self.errors[-1][1] if self.errors else None
+
+    def exhausted(self) -> LLMCallError:
+        """The error to raise when attempts() ran out."""
+        parts = [f"{model}: {error}" for model, error in self.errors[-3:]]
+        if self.skipped:
+            parts.append(f"circuit open for {', '.join(sorted(set(self.skipped)))}")
+        detail = "; ".join(parts) or "no model available"
+        return LLMCallError(f"All LLM models failed ({detail})", self._last_error())
@@ -4,13 +4,20 @@ Command Runners for WP-AI
 Provides different execution backends:
 - SSHRunner: Execute commands via SSH
 - DockerComposeRunner: Execute commands via docker-compose
+
+CachingRunner serves read-only WP-CLI commands from the per-host result
+cache (command_cache.py).
 """
 
+import codecs
+import socket
 import subprocess
+import threading
+import time
 from typing import Optional
-from .config import SSHConfig, DockerComposeConfig
-import paramiko
-from pathlib import Path
+from .command_cache import CommandCache, get_command_cache, is_cacheable, is_read_only
+from .config import SSHConfig, DockerComposeConfig, HostConfig
+from .ssh_session import SSHSession, acquire_session, release_session
 
 
 class BaseRunner:
@@ -34,59 +41,27 @@ class BaseRunner:
 
 
 class SSHRunner(BaseRunner):
-    """SSH-based command runner"""
+    """SSH-based command runner
+
+    Commands run on channels of the host's shared SSHSession
+    (ssh_session.py): runners for the same host use one connection, and
+    commands run from several threads at once each get their own channel.
+    """
     
     def __init__(self, config: SSHConfig):
         self.config = config
-        self.client = paramiko.SSHClient()
-        # Enforce strict host key checking by default
-        if self.config.strict_host_key_checking:
-            self.client.set_missing_host_key_policy(paramiko.RejectPolicy())
-            known_hosts = self.config.known_hosts_path or str(Path.home() / ".ssh" / "known_hosts")
-            try:
-                self.client.load_host_keys(known_hosts)
-            except FileNotFoundError:
-                # If known_hosts missing and strict is on, connection will fail; that's intended.
-                pass
-        else:
-            self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.session: Optional[SSHSession] = None
+        self._lock = threading.Lock()
 
     def connect(self):
-        """Establish SSH connection."""
-        connect_kwargs = {
-            "hostname": self.config.host,
-            "username": self.config.user,
-            "port": self.config.port,
-            "allow_agent": True,
-            "look_for_keys": True,
-        }
-
-        # 公開鍵認証を優先
-        if self.config.key_path:
-            connect_kwargs["key_filename"] = self.config.key_path
-        
-        # パスワードが設定されている場合のみパスワード認証を許可
-        # ただし、公開鍵認証が失敗した場合のフォールバックとして使用
-        if self.config.password:
-            connect_kwargs["password"] = self.config.password
-
-        try:
-            self.client.connect(**connect_kwargs)
-        except paramiko.ssh_exception.AuthenticationException as e:
-            # 認証エラーの場合、より詳細なメッセージを提供
-            if self.config.key_path:
-                raise Exception(f"SSH認証失敗: 指定された鍵ファイル '{self.config.key_path}' での認証に失敗しました。鍵ファイルのパスとパーミッションを確認してください。")
-            else:
-                raise Exception(f"SSH認証失敗: 公開鍵認証が必要です。config.tomlでkey_pathを設定してください。元のエラー: {str(e)}")
-
-    def run_command(self, command: str) -> int:
-        """
-        Run a command and stream output.
-        Returns exit code.
-        """
-        if not self.client.get_transport() or not self.client.get_transport().is_active():
-            self.connect()
+        """Establish SSH connection (or join the host's existing one)."""
+        with self._lock:
+            if self.session is None:
+                self.session = acquire_session(self.config)
+        self.session.connect()
 
+    def build_command(self, command: str) -> str:
+        """Apply wp_path / wordpress_path to a wp command."""
         # wpコマンドのパス解決
         if self.config.wp_path and command.strip().startswith("wp "):
             command = self.config.wp_path + command.strip()[2:]
@@ -94,19 +69,14 @@ class SSHRunner(BaseRunner):
         # WordPressパスの指定
         if self.config.wordpress_path and (command.strip().startswith("wp ") or (self.config.wp_path and command.startswith(self.config.wp_path))):
             command += f" --path='{self.config.wordpress_path}'"
+        return command
 
-        stdin, stdout, stderr = self.client.exec_command(command, get_pty=True)
-
-        # Stream output (stdout)
-        for line in iter(stdout.readline, ""):
-            print(line, end="")
-        # Stream stderr as well
-        for line in iter(stderr.readline, ""):
-            print(line, end="")
-
-        # Wait for exit status
-        exit_status = stdout.channel.recv_exit_status()
-        return exit_status
+    def run_command(self, command: str) -> int:
+        """
+        Run a command and stream output.
+        Returns exit code.
+        """
+        return self.run_command_with_callback(command)
 
     def run_command_with_callback(self, command: str, output_callback=None, error_callback=None) -> int:
         """
@@ -120,45 +90,60 @@ class SSHRunner(BaseRunner):
         Returns:
             Exit code
         """
-        if not self.client.get_transport() or not self.client.get_transport().is_active():
-            self.connect()
+        self.connect()
 
-        # wpコマンドのパス解決
-        if self.config.wp_path and command.strip().startswith("wp "):
-            command = self.config.wp_path + command.strip()[2:]
-            
-        # WordPressパスの指定
-        if self.config.wordpress_path and (command.strip().startswith("wp ") or (self.config.wp_path and command.startswith(self.config.wp_path))):
-            command += f" --path='{self.config.wordpress_path}'"
+        command = self.build_command(command)
 
-        stdin, stdout, stderr = self.client.exec_command(command, get_pty=True)
+        with self.session.channel() as channel:
+            channel.get_pty()
+            channel.exec_command(command)
+            stdout = channel.makefile("r")
+            stderr = channel.makefile_stderr("r")
 
-        # Stream output (stdout)
-        for line in iter(stdout.readline, ""):
-            if output_callback:
-                output_callback(line)
-            else:
-                print(line, end="")
-                
-        # Stream stderr as well
-        for line in iter(stderr.readline, ""):
-            if error_callback:
-                error_callback(line)
-            elif output_callback:
-                # If no error callback, send to output callback
-                output_callback(line)
-            else:
-                print(line, end="")
+            # Stream output (stdout)
+            for line in iter(stdout.readline, ""):
+                _emit(line, output_callback)
+
+            # Stream stderr as well (if no error callback, send to output callback)
+            for line in iter(stderr.readline, ""):
+                _emit(line, error_callback, output_callback)
 
-        # Wait for exit status
-        exit_status = stdout.channel.recv_exit_status()
-        return exit_status
+            # Wait for exit status
+            return channel.recv_exit_status()
+
+    def follow(self, command: str, lines_callback, stop: threading.Event, poll: float = 0.5) -> int:
+        """Stream a long-running command (e.g. tail -F) on its own channel until stop is set.
+
+        lines_callback receives the lines of each chunk as a list. Returns
+        the exit code, or -1 if stopped while running.
+        """
+        self.connect()
+        with self.session.channel() as channel:
+            # with a pty the remote command gets SIGHUP when the channel is closed
+            channel.get_pty()
+            channel.exec_command(self.build_command(command))
+            channel.settimeout(poll)
+            splitter = _LineSplitter()
+            while not stop.is_set():
+                try:
+                    data = channel.recv(32768)
+                except socket.timeout:
+                    continue
+                if not data:
+                    lines = splitter.flush()
+                    if lines:
+                        lines_callback(lines)
+                    return channel.recv_exit_status()
+                lines = splitter.feed(data)
+                if lines:
+                    lines_callback(lines)
+            return -1
 
     def close(self):
-        try:
-            self.client.close()
-        except Exception:
-            pass
+        with self._lock:
+            session, self.session = self.session, None
+        if session is not None:
+            release_session(session)
 
 
 class DockerComposeRunner(BaseRunner):
@@ -174,12 +159,8 @@ class DockerComposeRunner(BaseRunner):
         """Docker Compose doesn't need persistent connection"""
         pass
     
-    def run_command(self, command: str) -> int:
-        """
-        Run a command via docker-compose.
-        Returns exit code.
-        """
-        # Build docker-compose command
+    def build_command(self, command: str) -> list:
+        """Build the docker-compose argv for a command."""
         docker_cmd = ["docker-compose"]
         
         if self.compose_file:
@@ -195,6 +176,14 @@ class DockerComposeRunner(BaseRunner):
         
         # Wrap command in bash -c to properly execute within container
         docker_cmd.extend(["bash", "-c", command])
+        return docker_cmd
+    
+    def run_command(self, command: str) -> int:
+        """
+        Run a command via docker-compose.
+        Returns exit code.
+        """
+        docker_cmd = self.build_command(command)
         
         # Execute
         try:
@@ -220,22 +209,7 @@ class DockerComposeRunner(BaseRunner):
         Returns:
             Exit code
         """
-        # Build docker-compose command
-        docker_cmd = ["docker-compose"]
-        
-        if self.compose_file:
-            docker_cmd.extend(["-f", self.compose_file])
-        
-        docker_cmd.extend(["run", "--rm"])
-        
-        # Add working directory if needed
-        if self.wordpress_path:
-            docker_cmd.extend(["-w", self.wordpress_path])
-        
-        docker_cmd.append(self.service)
-        
-        # Wrap command in bash -c to properly execute within container
-        docker_cmd.extend(["bash", "-c", command])
+        docker_cmd = self.build_command(command)
         
         # Execute with streaming output
         try:
@@ -284,3 +258,152 @@ class DockerComposeRunner(BaseRunner):
     def close(self):
         """Docker Compose doesn't need cleanup"""
         pass
+
+
+def _emit(line: str, callback=None, fallback=None):
+    if callback:
+        callback(line)
+    elif fallback:
+        fallback(line)
+    else:
+        print(line, end="")
+
+
+class _LineSplitter:
+    """Incrementally decode bytes and split them into lines (keeping line endings)."""
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._partial = ""
+
+    def feed(self, data: bytes) -> list:
+        text = self._partial + self._decoder.decode(data)
+        lines = text.splitlines(keepends=True)
+        if lines and not lines[-1].endswith(("\n", "\r")):
+            self._partial = lines.pop()
+        else:
+            self._partial = ""
+        return lines
+
+    def flush(self) -> list:
+        text = self._partial + self._decoder.decode(b"", final=True)
+        self._partial = ""
+        return [text] if text else []
+
+
+class CachingRunner(BaseRunner):
+    """Serves read-only WP-CLI commands from the command cache.
+
+    Cache hits replay the stored output after a "[cached ...]" marker line
+    and set last_cache_age (seconds) so callers can mark the result in
+    history; it is None after a live run. Any command that is not read-only
+    drops the host's cached results. The wrapped runner connects on the
+    first live run, so a plan served entirely from the cache never opens a
+    connection.
+    """
+
+    def __init__(self, runner: BaseRunner, host_name: str, ttl: float, cache: Optional[CommandCache] = None):
+        self.runner = runner
+        self.host_name = host_name
+        self.ttl = ttl
+        self.cache = cache or get_command_cache()
+        self._connected = False
+        self._connect_lock = threading.Lock()
+        self._local = threading.local()  # commands may run concurrently (scheduler.run_steps)
+
+    @property
+    def last_cache_age(self) -> Optional[float]:
+        """Age of the result of this thread's last command if it came from the cache."""
+        return getattr(self._local, "cache_age", None)
+
+    @last_cache_age.setter
+    def last_cache_age(self, value: Optional[float]):
+        self._local.cache_age = value
+
+    def connect(self):
+        # deferred to the first command that is not served from the cache
+        pass
+
+    def _ensure_connected(self):
+        with self._connect_lock:
+            if not self._connected:
+                self.runner.connect()
+                self._connected = True
+
+    def run_command(self, command: str) -> int:
+        return self.run_command_with_callback(command)
+
+    def run_command_with_callback(self, command: str, output_callback=None, error_callback=None) -> int:
+        self.last_cache_age = None
+        if not is_read_only(command):
+            # the site may change: invalidate before running, not after
+            self.cache.invalidate(self.host_name)
+            self._ensure_connected()
+            return self.runner.run_command_with_callback(command, output_callback, error_callback)
+        if not is_cacheable(command):
+            # read-only, but the output holds secrets (wp config get)
+            self._ensure_connected()
+            return self.runner.run_command_with_callback(command, output_callback, error_callback)
+
+        entry = self.cache.lookup(self.host_name, command, self.ttl)
+        if entry is not None:
+            self.last_cache_age = max(0.0, time.time() - entry["ts"])
+            _emit(f"[cached {self.last_cache_age:.0f}s ago]\n", output_callback)
+            for stream, text in entry["lines"]:
+                if stream == "err":
+                    _emit(text, error_callback, output_callback)
+                else:
+                    _emit(text, output_callback)
+            return entry["exit_code"]
+
+        lines = []
+
+        def on_output(line):
+            lines.append(("out", line))
+            _emit(line, output_callback)
+
+        def on_error(line):
+            lines.append(("err", line))
+            _emit(line, error_callback, output_callback)
+
+        self._ensure_connected()
+        exit_code = self.runner.run_command_with_callback(command, on_output, on_error)
+        if exit_code == 0:
+            self.cache.store(self.host_name, command, exit_code, lines, self.ttl)
+        return exit_code
+
+    def close(self):
+        if self._connected:
+            self._connected = False
+            self.runner.close()
+
+
+def cached_fields(runner: BaseRunner) -> dict:
+    """History fields marking a result served from the command cache (empty for live runs)."""
+    age = getattr(runner, "last_cache_age", None)
+    if age is None:
+        return {}
+    return {"cached": True, "cached_age": round(age)}
+
+
+def _runner_type(host_config: HostConfig, default: str = "ssh") -> str:
+    runner_type = host_config.runner or default
+    if runner_type not in ("ssh", "docker_compose"):
+        raise ValueError(f"Unknown runner type '{runner_type}' for host '{host_config.name}'.")
+    return runner_type
+
+
+def create_runner(host_config: HostConfig, default: str = "ssh", cache_ttl: float = 0.0) -> BaseRunner:
+    """Create the sync runner configured for a host.
+
+    With cache_ttl > 0 read-only WP-CLI commands are served from the
+    command cache (see CachingRunner).
+    """
+    if _runner_type(host_config, default) == "docker_compose":
+        runner = DockerComposeRunner(host_config.docker_compose or DockerComposeConfig())
+    else:
+        runner = SSHRunner(host_config.ssh)
+    if cache_ttl > 0:
+        return CachingRunner(runner, host_config.name, cache_ttl)
+    return runner
+
@@ -0,0 +1,153 @@
+"""
+Plan step scheduler
+
+Runs the steps of a plan on one runner, concurrently where that is safe:
+
+- a step may run alongside others only if the plan marks it
+  "parallel_safe": true AND it is a read-only WP-CLI command
+  (command_cache.is_read_only); neither the LLM's flag nor the classifier
+  is trusted alone, so plain command lists run sequentially;
+- every other step is a barrier: it waits for all earlier steps, and all
+  later steps wait for it, so mutating commands keep their sequential
+  semantics;
+- "depends_on" (1-based step numbers) adds ordering between read-only
+  steps; a reference to a later or unknown step makes the step a barrier.
+
+At most max_parallel steps run at once. On the SSH runner each one is a
+separate channel on the same connection. Output events are released to
+the sink in step order, so a step's output is never interleaved with
+another's: the earliest unfinished step streams live, later ones are held
+back until it ends. After a failure no new steps are started; the steps
+already running finish.
+"""
+
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+
+from .command_cache import is_read_only
+from .history import OutputCapture
+from .runner import BaseRunner, cached_fields
+
+# sink(kind, index, payload): ("start", i, cmd), ("output", i, text), ("end", i, result)
+Sink = Callable[[str, int, Any], None]
+
+
+def step_dependencies(steps: Sequence[Any]) -> List[Set[int]]:
+    """0-based indices each step must wait for.
+
+    ``steps`` are PlanStep-like objects (cmd, depends_on, parallel_safe).
+    """
+    deps: List[Set[int]] = []
+    barrier: Optional[int] = None
+    for index, step in enumerate(steps):
+        refs = getattr(step, "depends_on", None) or []
+        parallel = (getattr(step, "parallel_safe", None) is True and is_read_only(step.cmd)
+                    and all(isinstance(ref, int) and 1 <= ref <= index for ref in refs))
+        if parallel:
+            wait_for = {ref - 1 for ref in refs}
+            if barrier is not None:
+                wait_for.add(barrier)
+        else:
+            wait_for = set(range(index))
+            barrier = index
+        deps.append(wait_for)
+    return deps
+
+
+class OrderedEvents:
+    """Passes per-step events to a sink in step order (thread-safe)."""
+
+    def __init__(self, count: int, sink: Sink):
+        self._sink = sink
+        self._pending: List[List[tuple]] = [[] for _ in range(count)]
+        self._ended = [False] * count
+        self._cursor = 0
+        self._lock = threading.Lock()
+
+    def emit(self, kind: str, index: int, payload: Any):
+        with self._lock:
+            if index == self._cursor:
+                self._sink(kind, index, payload)
+            else:
+                self._pending[index].append((kind, index, payload))
+            if kind == "end":
+                self._ended[index] = True
+                self._advance()
+
+    def skip(self, index: int):
+        """Mark a step that will never run."""
+        with self._lock:
+            self._ended[index] = True
+            self._advance()
+
+    def _advance(self):
+        while self._cursor < len(self._ended) and self._ended[self._cursor]:
+            self._cursor += 1
+            if self._cursor < len(self._ended):
+                for event in self._pending[self._cursor]:
+                    self._sink(*event)
+                self._pending[self._cursor].clear()
+
+
+def run_steps(runner: BaseRunner, steps: Sequence[Any], sink: Sink, results: List[Dict[str, Any]],
+              max_parallel: int = 1, output_max_bytes: int = 0):
+    """Run plan steps on a connected runner.
+
+    The history results of the steps that ran are appended to ``results`` in
+    step order, also when a step raises; the exception is re-raised once the
+    running steps have finished.
+    """
+    deps = step_dependencies(steps)
+    events = OrderedEvents(len(steps), sink)
+    by_step: List[Optional[Dict[str, Any]]] = [None] * len(steps)
+
+    def run_step(index: int) -> Dict[str, Any]:
+        cmd = steps[index].cmd
+        events.emit("start", index, cmd)
+        capture = OutputCapture(output_max_bytes)
+
+        def on_output(line):
+            capture.write(line)
+            events.emit("output", index, line)
+
+        exit_code = runner.run_command_with_callback(cmd, output_callback=on_output)
+        result = {"command": cmd, "exit_code": exit_code, **capture.result_fields(), **cached_fields(runner)}
+        events.emit("end", index, result)
+        return result
+
+    started: Set[int] = set()
+    finished: Set[int] = set()
+    error: Optional[BaseException] = None
+    stop = False
+    with ThreadPoolExecutor(max_workers=max(1, max_parallel), thread_name_prefix="plan-step") as executor:
+        running = {}
+        while True:
+            if not stop:
+                for index in range(len(steps)):
+                    if len(running) >= max(1, max_parallel):
+                        break
+                    if index not in started and deps[index] <= finished:
+                        started.add(index)
+                        running[executor.submit(run_step, index)] = index
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                try:
+                    by_step[index] = future.result()
+                except Exception as e:
+                    error = error or e
+                    stop = True
+                    events.skip(index)
+                    continue
+                finished.add(index)
+                if by_step[index]["exit_code"] != 0:
+                    stop = True
+    for index in range(len(steps)):
+        if index not in started:
+            events.skip(index)
+    results.extend(result for result in by_step if result is not None)
+    if error is not None:
+        raise error
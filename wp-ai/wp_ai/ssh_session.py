@@ -0,0 +1,188 @@
+"""
+Multiplexed SSH sessions
+
+An SSH connection can carry many channels at once, each running its own
+command (what OpenSSH's ControlMaster does for the ssh CLI). SSHSession is
+one authenticated connection per host, shared by every runner of the
+process. acquire_session() returns the connection of a host and
+release_session() closes it when the last user is done, so a plan run and
+a log follower on the same host use one transport.
+
+Each command takes a channel slot. At most [hosts.ssh].max_sessions
+channels are open per transport (OpenSSH's MaxSessions, 10 by default);
+further commands wait for a slot. If the server refuses a channel while
+others are open, its limit is lower than configured: the session lowers
+its own limit to the number of open channels and waits instead of failing.
+"""
+
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+import paramiko
+
+from .config import SSHConfig
+
+
+def session_key(config: SSHConfig) -> tuple:
+    """Connections are shared between configs that log in the same way."""
+    return (config.host, config.port, config.user, config.key_path, config.password,
+            config.strict_host_key_checking, config.known_hosts_path)
+
+
+class SSHSession:
+    """One authenticated SSH connection whose transport carries concurrent channels (thread-safe)."""
+
+    def __init__(self, config: SSHConfig):
+        self.config = config
+        self.client = self._new_client()
+        self.max_channels = max(1, config.max_sessions)
+        self.open_channels = 0
+        self._cond = threading.Condition()
+        self._connect_lock = threading.Lock()
+        self._refs = 0
+
+    def _new_client(self) -> paramiko.SSHClient:
+        client = paramiko.SSHClient()
+        # Enforce strict host key checking by default
+        if self.config.strict_host_key_checking:
+            client.set_missing_host_key_policy(paramiko.RejectPolicy())
+            known_hosts = self.config.known_hosts_path or str(Path.home() / ".ssh" / "known_hosts")
+            try:
+                client.load_host_keys(known_hosts)
+            except FileNotFoundError:
+                # If known_hosts missing and strict is on, connection will fail; that's intended.
+                pass
+        else:
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        return client
+
+    def is_active(self) -> bool:
+        transport = self.client.get_transport()
+        return bool(transport and transport.is_active())
+
+    def connect(self):
+        """Establish the SSH connection (again, if the transport has died)."""
+        with self._connect_lock:
+            if self.is_active():
+                return
+            if self.client.get_transport() is not None:
+                self.client.close()
+                self.client = self._new_client()
+
+            connect_kwargs = {
+                "hostname": self.config.host,
+                "username": self.config.user,
+                "port": self.config.port,
+                "allow_agent": True,
+                "look_for_keys": True,
+            }
+
+            # 公開鍵認証を優先
+            if self.config.key_path:
+                connect_kwargs["key_filename"] = self.config.key_path
+
+            # パスワードが設定されている場合のみパスワード認証を許可
+            # ただし、公開鍵認証が失敗した場合のフォールバックとして使用
+            if self.config.password:
+                connect_kwargs["password"] = self.config.password
+
+            try:
+                self.client.connect(**connect_kwargs)
+            except paramiko.ssh_exception.AuthenticationException as e:
+                # 認証エラーの場合、より詳細なメッセージを提供
+                if self.config.key_path:
+                    raise Exception(f"SSH認証失敗: 指定された鍵ファイル '{self.config.key_path}' での認証に失敗しました。鍵ファイルのパスとパーミッションを確認してください。")
+                else:
+                    raise Exception(f"SSH認証失敗: 公開鍵認証が必要です。config.tomlでkey_pathを設定してください。元のエラー: {str(e)}")
+
+    # ===== channels =====
+
+    def _take_slot(self):
+        with self._cond:
+            while self.open_channels >= self.max_channels:
+                self._cond.wait()
+            self.open_channels += 1
+
+    def _give_slot(self):
+        with self._cond:
+            self.open_channels -= 1
+            self._cond.notify()
+
+    def open_channel(self, timeout: Optional[float] = None) -> paramiko.Channel:
+        """Open a session channel, waiting for a free slot; pass it to release() when done."""
+        self.connect()
+        self._take_slot()
+        while True:
+            transport = self.client.get_transport()
+            try:
+                return transport.open_session(timeout=timeout)
+            except paramiko.SSHException:
+                # a refusal is a ChannelException, or a bare SSHException when
+                # several opens fail at once; a dead transport is a real error
+                if not transport.is_active():
+                    self._give_slot()
+                    raise
+                with self._cond:
+                    self.open_channels -= 1
+                    if self.open_channels == 0:
+                        # refused with nothing else open: not a session limit
+                        self._cond.notify()
+                        raise
+                    # the server allows fewer sessions than configured
+                    self.max_channels = self.open_channels
+                    while self.open_channels >= self.max_channels:
+                        self._cond.wait()
+                    self.open_channels += 1
+            except BaseException:
+                self._give_slot()
+                raise
+
+    def release(self, channel: paramiko.Channel):
+        try:
+            channel.close()
+        finally:
+            self._give_slot()
+
+    @contextmanager
+    def channel(self, timeout: Optional[float] = None) -> Iterator[paramiko.Channel]:
+        channel = self.open_channel(timeout)
+        try:
+            yield channel
+        finally:
+            self.release(channel)
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+_sessions: Dict[tuple, SSHSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def acquire_session(config: SSHConfig) -> SSHSession:
+    """The shared session for a host (not connected yet if new); pair with release_session()."""
+    key = session_key(config)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = SSHSession(config)
+            _sessions[key] = session
+        session._refs += 1
+        return session
+
+
+def release_session(session: SSHSession):
+    """Drop one reference; the last one closes the connection."""
+    with _sessions_lock:
+        session._refs -= 1
+        if session._refs > 0:
+            return
+        key = session_key(session.config)
+        if _sessions.get(key) is session:
+            del _sessions[key]
+    session.close()
@@ -0,0 +1,198 @@
+"""
+Structured (JSON) output from LLMs
+
+Plans are requested as JSON. Where the provider supports it, the reply is
+constrained by a response schema derived from the pydantic model (Gemini
+response_schema, OpenAI-compatible response_format=json_schema), so it is
+valid JSON by construction. Everything else goes through a tolerant
+extractor:
+
+- extract_json_object() finds the first top-level JSON object in free-form
+  text (code fences, prose before or after) and parses it, forgiving the
+  usual slips (trailing commas, Python literals, raw newlines in strings).
+
+When a complete reply still fails to parse or validate, callers make one
+cheap repair call with repair_prompt(): the broken reply and the error,
+without the original context.
+
+A reply that was cut off before its closing brace is neither closed
+automatically nor repaired: its last command may be half-written, and the
+steps after it are missing. extract_json_object() raises
+TruncatedJSONError for it.
+"""
+
+import json
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+REPAIR_PROMPT = (
+    "The following reply was supposed to be a single JSON object matching this JSON schema, "
+    "but it could not be used: {error}\n\n"
+    "Schema:\n{schema}\n\nReply:\n{reply}\n\n"
+    "Return only the corrected JSON object. Keep the content of the reply; "
+    "fix only the format. No markdown, no explanations."
+)
+
+
+# ===== response schemas =====
+
+@lru_cache(maxsize=None)
+def json_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """JSON schema of a pydantic model with $refs inlined and titles dropped."""
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+
+    def resolve(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(defs[node["$ref"].rsplit("/", 1)[1]])
+            return {k: resolve(v) for k, v in node.items() if k != "title"}
+        if isinstance(node, list):
+            return [resolve(v) for v in node]
+        return node
+
+    return resolve(schema)
+
+
+@lru_cache(maxsize=None)
+def openapi_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """The OpenAPI subset Gemini's response_schema takes (no anyOf / null types, no defaults)."""
+
+    def convert(node: Dict[str, Any]) -> Dict[str, Any]:
+        node = dict(node)
+        options = node.pop("anyOf", None)
+        if options:
+            # Optional[X] -> X, nullable
+            concrete = [o for o in options if o.get("type") != "null"]
+            merged = convert(concrete[0]) if concrete else {"type": "string"}
+            if len(concrete) < len(options):
+                merged["nullable"] = True
+            node = {**merged, **node}
+        out: Dict[str, Any] = {}
+        for key in ("type", "format", "description", "enum", "nullable", "required"):
+            if key in node:
+                out[key] = node[key]
+        if "properties" in node:
+            out["properties"] = {name: convert(prop) for name, prop in node["properties"].items()}
+        if "items" in node:
+            out["items"] = convert(node["items"])
+        return out
+
+    return convert(json_schema(model))
+
+
+# ===== tolerant extraction =====
+
+class TruncatedJSONError(ValueError):
+    """The reply starts a JSON object but ends before closing it (or one of its strings)."""
+
+
+def _scan_object(text: str, start: int) -> Optional[int]:
+    """End index (exclusive) of the balanced object opening at text[start], or None if it never closes."""
+    stack: List[str] = []
+    in_string = escape = False
+    for index in range(start, len(text)):
+        ch = text[index]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if stack and stack[-1] == ch:
+                stack.pop()
+            if not stack:
+                return index + 1
+    return None
+
+
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def _relax(text: str) -> str:
+    """Drop trailing commas and map Python literals, outside strings."""
+    out: List[str] = []
+    in_string = escape = False
+    index = 0
+    while index < len(text):
+        ch = text[index]
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            out.append(ch)
+        else:
+            match = re.match(r"True|False|None", text[index:])
+            if match and not (out and (out[-1].isalnum() or out[-1] == "_")):
+                out.append(_LITERALS[match.group()])
+                index += len(match.group())
+                continue
+            out.append(ch)
+        index += 1
+    return "".join(out)
+
+
+def _loads_object(text: str) -> Optional[Dict[str, Any]]:
+    for candidate in (text, _relax(text)):
+        try:
+            data = json.loads(candidate, strict=False)  # strict=False: raw newlines/tabs in strings
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
+
+
+def extract_json_object(text: str) -> Dict[str, Any]:
+    """The first JSON object in an LLM reply, tolerating fences, prose and common slips.
+
+    Raises TruncatedJSONError if the reply ends inside an object, and
+    ValueError if no object can be recovered otherwise.
+    """
+    text = (text or "").strip()
+    if text.startswith("{"):
+        data = _loads_object(text)
+        if data is not None:
+            return data
+
+    start = text.find("{")
+    while start >= 0:
+        end = _scan_object(text, start)
+        if end is None:
+            raise TruncatedJSONError("The response ends before its JSON object is complete")
+        data = _loads_object(text[start:end])
+        if data is not None:
+            return data
+        # not an object after all (e.g. "{placeholder}" in prose): look further on
+        start = text.find("{", start + 1)
+    raise ValueError("No JSON object found in the response")
+
+
+def repair_prompt(reply: str, error: Exception, model: Type[BaseModel]) -> str:
+    """Prompt for the single repair call after a reply failed to parse or validate."""
+    return REPAIR_PROMPT.format(
+        error=str(error)[:500],
+        schema=json.dumps(json_schema(model), ensure_ascii=False),
+        reply=reply[:8000],
+    )